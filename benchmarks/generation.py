@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+'''
+Measures how code generation scales with the size of the schema
+
+Generates synthetic schemas of growing size, both with many messages and with
+single messages that have many members, and reports the generation time per member
+for every backend. For linear scaling the time per member stays roughly constant.
+'''
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bragi.parser import CompilationUnit
+from bragi.cpp_generator import CodeGenerator as CppGenerator
+from bragi.rust_generator import CodeGenerator as RustGenerator
+from bragi.wireshark_generator import CodeGenerator as WiresharkGenerator
+
+from schema import make_schema
+
+BACKENDS = {
+    'cpp': lambda units: CppGenerator(units, 'stdc++'),
+    'rust': lambda units: RustGenerator(units),
+    'wireshark': lambda units: WiresharkGenerator(units),
+}
+
+def time_generation(backend, unit, repeat):
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        BACKENDS[backend]([unit]).generate()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description = 'bragi code generation scaling benchmark')
+    parser.add_argument('-n', '--repeat', help = 'number of runs per measurement (the fastest is reported)', type = int, default = 3)
+    parser.add_argument('-s', '--size', help = 'number of members of the smallest schema', type = int, default = 1000)
+    parser.add_argument('--steps', help = 'number of times the schema size is quadrupled', type = int, default = 2)
+    parser.add_argument('--max-ratio', help = 'fail if the time per member of the largest schema exceeds that of the smallest by this factor', type = float)
+    args = parser.parse_args()
+
+    failed = False
+
+    for shape in ['messages', 'members']:
+        per_member = {backend: [] for backend in BACKENDS}
+
+        for step in range(args.steps + 1):
+            size = args.size * 4 ** step
+
+            if shape == 'messages':
+                schema = make_schema(size // 10, 10)
+            else:
+                schema = make_schema(1, size)
+
+            unit = CompilationUnit('bench.bragi', schema)
+            unit.process()
+            unit.verify()
+            unit.layout()
+
+            row = []
+            for backend in BACKENDS:
+                elapsed = time_generation(backend, unit, args.repeat)
+                per_member[backend].append(elapsed / size)
+                row.append(f'{backend} {elapsed * 1000:8.1f} ms ({elapsed / size * 1e6:5.1f} us/member)')
+
+            print(f'{shape:>8} {size:7}: {"  ".join(row)}')
+
+        for backend, times in per_member.items():
+            ratio = times[-1] / times[0]
+            print(f'{shape:>8} {backend}: time per member grows by {ratio:.2f}x')
+
+            if args.max_ratio is not None and ratio > args.max_ratio:
+                print(f'error: {backend} does not scale linearly with the number of {shape}')
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
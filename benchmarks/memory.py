@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+'''
+Measures the memory kept alive by a parsed and verified compilation unit
+
+The server and the watch mode keep units resident, so their footprint matters as
+much as the time needed to build them. The schema source itself is not counted.
+'''
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bragi.parser import CompilationUnit
+from bragi.lark_parser import get_parser
+
+from schema import make_schema
+
+def main():
+    parser = argparse.ArgumentParser(description = 'bragi memory footprint benchmark')
+    parser.add_argument('-m', '--messages', help = 'number of messages in the schema', type = int, default = 2000)
+    parser.add_argument('--members', help = 'number of tail members per message', type = int, default = 8)
+    args = parser.parse_args()
+
+    schema = make_schema(args.messages, args.members)
+
+    # The parser is shared by all units, so it is not part of their footprint.
+    get_parser()
+
+    gc.collect()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+
+    unit = CompilationUnit('bench.bragi', schema)
+    unit.process()
+    unit.verify()
+    unit.layout()
+
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    resident = current - base
+    members = args.messages * (args.members + 4)
+
+    print(f'{args.messages} messages, {members} members')
+    print(f'resident: {resident / 2**20:.2f} MiB ({resident / members:.0f} bytes/member)')
+    print(f'peak: {(peak - base) / 2**20:.2f} MiB')
+
+    # Keep the unit alive until it has been measured.
+    del unit
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+'''
+Compares the throughput of the Lark and the native parser engine
+
+Parses a synthetic schema with both engines and reports the time and throughput
+of each. Only parsing is measured; building the Lark parser is done up front.
+'''
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bragi.parser import CompilationUnit
+from bragi.lark_parser import get_parser
+
+from schema import make_schema
+
+ENGINES = ['lark', 'native']
+
+def time_parsing(engine, schema, repeat):
+    best = None
+
+    for _ in range(repeat):
+        unit = CompilationUnit('bench.bragi', schema)
+
+        start = time.perf_counter()
+        unit.process(engine)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description = 'bragi parser engine benchmark')
+    parser.add_argument('-n', '--repeat', help = 'number of runs per measurement (the fastest is reported)', type = int, default = 3)
+    parser.add_argument('-m', '--messages', help = 'number of messages in the schema', type = int, default = 2000)
+    parser.add_argument('--members', help = 'number of tail members per message', type = int, default = 8)
+    parser.add_argument('--min-speedup', help = 'fail if the native engine is not at least this much faster than Lark', type = float)
+    args = parser.parse_args()
+
+    schema = make_schema(args.messages, args.members)
+    size = len(schema.encode('utf-8'))
+    get_parser()
+
+    print(f'{args.messages} messages, {size / 2**20:.2f} MiB')
+
+    times = {}
+    for engine in ENGINES:
+        times[engine] = time_parsing(engine, schema, args.repeat)
+        print(f'{engine:>6}: {times[engine] * 1000:8.1f} ms ({size / times[engine] / 2**20:6.2f} MiB/s)')
+
+    speedup = times['lark'] / times['native']
+    print(f'native is {speedup:.1f}x faster than lark')
+
+    if args.min_speedup is not None and speedup < args.min_speedup:
+        print(f'error: the native engine is less than {args.min_speedup}x faster than lark')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
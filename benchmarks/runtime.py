@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+'''
+Builds and runs the microbenchmarks of the generated C++ code and its runtime
+
+Every benchmarks/runtime/<name>.cpp is compiled against the header generated from
+<name>.bragi (for the stdc++ library) and then run. Unlike the other benchmarks,
+these measure the code that bragi emits, not the compiler itself.
+
+Each benchmark is built once per generator configuration given with --config, and
+if there are several, their results are compared against the first one.
+'''
+
+import argparse
+import glob
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bragi import api
+
+RUNTIME_DIR = os.path.join(ROOT, 'benchmarks', 'runtime')
+
+# Options of the C++ backend that the benchmarks can be generated with.
+CONFIGS = {
+    'sized': dict(encoder = 'sized'),
+    'single-pass': dict(encoder = 'single-pass'),
+    'cached': dict(encoder = 'sized', cache_sizes = True),
+}
+
+# Results are reported by bench::report() as '<label> <time> ns <throughput> MiB/s'.
+RESULT_RE = re.compile(r'^(\s*\S.*?)\s+([0-9.]+) ns\s')
+
+def build(name, config, cxx, cxxflags, builddir):
+    result = api.compile_files([os.path.join(RUNTIME_DIR, f'{name}.bragi')], 'cpp', lib = 'stdc++', **CONFIGS[config])
+    if not result.ok:
+        for diagnostic in result.diagnostics:
+            print(diagnostic.format())
+        sys.exit(1)
+
+    configdir = os.path.join(builddir, config)
+    os.makedirs(configdir, exist_ok = True)
+
+    with open(os.path.join(configdir, f'{name}.bragi.hpp'), 'w') as f:
+        f.write(result.output)
+
+    binary = os.path.join(configdir, name)
+    subprocess.run([*shlex.split(cxx), '-std=c++20', *shlex.split(cxxflags),
+            '-I', os.path.join(ROOT, 'include'), '-I', configdir,
+            os.path.join(RUNTIME_DIR, f'{name}.cpp'), '-o', binary], check = True)
+
+    return binary
+
+def run(binary):
+    '''
+    Runs a benchmark, printing its output, and returns a dict mapping every result to its time
+    '''
+    results = {}
+    section = ''
+
+    with subprocess.Popen([binary], stdout = subprocess.PIPE, text = True) as process:
+        for line in process.stdout:
+            print(line, end = '', flush = True)
+            line = line.rstrip()
+
+            if line.endswith(':'):
+                section = line[:-1]
+            elif match := RESULT_RE.match(line):
+                results[f'{section}, {match.group(1).strip()}'] = float(match.group(2))
+
+    if process.returncode:
+        sys.exit(process.returncode)
+
+    return results
+
+def compare(configs, results):
+    base = configs[0]
+    width = max(len(key) for key in results[base])
+
+    print(f'{"":<{width}} ' + ' '.join(f'{config:>14}' for config in configs))
+
+    for key, base_ns in results[base].items():
+        row = [f'{base_ns:11.1f} ns']
+        for config in configs[1:]:
+            ns = results[config].get(key)
+            row.append(f'{base_ns / ns:13.2f}x' if ns else f'{"-":>14}')
+
+        print(f'{key:<{width}} ' + ' '.join(row))
+
+def main():
+    names = sorted(os.path.basename(path)[:-4] for path in glob.glob(os.path.join(RUNTIME_DIR, '*.cpp')))
+
+    parser = argparse.ArgumentParser(description = 'bragi generated code microbenchmarks')
+    parser.add_argument('benchmarks', help = f'benchmarks to run, out of {", ".join(names)} (default: all)', nargs = '*')
+    parser.add_argument('--config', help = 'generator configuration to build with, can be repeated to compare them (default: sized)', choices = list(CONFIGS), action = 'append')
+    parser.add_argument('--cxx', help = 'C++ compiler (default: $CXX or c++)', type = str, default = os.environ.get('CXX', 'c++'))
+    parser.add_argument('--cxxflags', help = 'flags passed to the C++ compiler', type = str, default = '-O2 -march=native')
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in names:
+            parser.error(f'unknown benchmark {name!r}')
+
+    configs = args.config or ['sized']
+
+    with tempfile.TemporaryDirectory() as builddir:
+        for name in args.benchmarks or names:
+            results = {}
+
+            for config in configs:
+                binary = build(name, config, args.cxx, args.cxxflags, builddir)
+
+                print(f'== {name} ({config})', flush = True)
+                results[config] = run(binary)
+
+            if len(configs) > 1:
+                print(f'== {name}: speed-up over {configs[0]}')
+                compare(configs, results)
+
+if __name__ == '__main__':
+    main()
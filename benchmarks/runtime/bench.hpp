@@ -0,0 +1,38 @@
+#pragma once
+
+#include <chrono>
+#include <stdio.h>
+
+namespace bench {
+
+// Keeps the compiler from optimizing away the computation of value.
+template <typename T>
+inline void keep(T &value) {
+	asm volatile("" : : "g"(&value) : "memory");
+}
+
+// Returns the fastest time per call of f in nanoseconds, out of repeat runs of
+// iterations calls each.
+template <typename F>
+inline double time_ns(F f, size_t iterations, int repeat = 5) {
+	double best = 0;
+
+	for (int r = 0; r < repeat; r++) {
+		auto start = std::chrono::steady_clock::now();
+		for (size_t i = 0; i < iterations; i++)
+			f();
+		auto end = std::chrono::steady_clock::now();
+
+		double ns = std::chrono::duration<double, std::nano>(end - start).count() / iterations;
+		if (!r || ns < best)
+			best = ns;
+	}
+
+	return best;
+}
+
+inline void report(const char *name, size_t bytes, double ns) {
+	printf("%-32s %10.1f ns %10.1f MiB/s\n", name, ns, bytes / ns * 1e9 / (1 << 20));
+}
+
+} // namespace bench
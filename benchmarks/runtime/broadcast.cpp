@@ -0,0 +1,70 @@
+// Measures encoding one message into a buffer for each of many receivers, the way
+// a broadcast sends it.
+
+#include <bragi/helpers-all.hpp>
+#include <bragi/helpers-std.hpp>
+#include <broadcast.bragi.hpp>
+#include <stdlib.h>
+#include <string>
+#include <vector>
+
+#include "bench.hpp"
+
+namespace {
+
+void check(bool ok) {
+	if (!ok) {
+		fprintf(stderr, "error: encoding failed\n");
+		exit(1);
+	}
+}
+
+void run(size_t receivers, size_t subscribers) {
+	bench::Event msg;
+	msg.set_sequence(1);
+	msg.set_kind(4);
+	msg.set_source("input/keyboard0");
+	msg.set_timestamp(123456789);
+	msg.set_payload(std::string(64, 'x'));
+	for (size_t i = 0; i < subscribers; i++) {
+		msg.add_subscribers("client-" + std::to_string(i));
+		msg.add_flags(i);
+	}
+
+	std::vector<std::vector<uint8_t>> heads(receivers), tails(receivers);
+	size_t iterations = (size_t{1} << 20) / (receivers * subscribers) + 1;
+
+	auto broadcast = bench::time_ns([&] {
+		for (size_t i = 0; i < receivers; i++) {
+			heads[i].resize(msg.size_of_head());
+			tails[i].resize(msg.size_of_tail());
+			check(bragi::write_head_tail(msg, heads[i], tails[i]));
+		}
+		bench::keep(tails);
+	}, iterations);
+
+	// Changing the head leaves the cached size of the tail valid.
+	auto changing = bench::time_ns([&] {
+		for (size_t i = 0; i < receivers; i++) {
+			msg.set_sequence(i);
+			msg.set_tag("seq");
+			heads[i].resize(msg.size_of_head());
+			tails[i].resize(msg.size_of_tail());
+			check(bragi::write_head_tail(msg, heads[i], tails[i]));
+		}
+		bench::keep(tails);
+	}, iterations);
+
+	size_t bytes = receivers * (msg.size_of_head() + msg.size_of_tail());
+	printf("%zu receivers, %zu subscribers:\n", receivers, subscribers);
+	bench::report("  same message", bytes, broadcast);
+	bench::report("  head changed before every send", bytes, changing);
+}
+
+} // namespace
+
+int main() {
+	run(16, 4);
+	run(16, 64);
+	run(64, 256);
+}
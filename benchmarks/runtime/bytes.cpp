@@ -0,0 +1,160 @@
+// Compares encoding and decoding strings and byte arrays one element at a time,
+// as the generated code used to do, with the bulk write_bytes/read_bytes copy.
+
+#include <bragi/helpers-all.hpp>
+#include <bragi/helpers-std.hpp>
+#include <bytes.bragi.hpp>
+#include <stdlib.h>
+#include <string>
+#include <vector>
+
+#include "bench.hpp"
+
+namespace {
+
+template <typename Writer>
+bool encode_per_element(Writer &wr, const std::string &path, const std::vector<uint8_t> &data) {
+	bragi::serializer sr;
+
+	if (!sr.write_varint(wr, path.size()))
+		return false;
+	for (size_t i = 0; i < path.size(); i++)
+		if (!sr.write_integer<char>(wr, path[i]))
+			return false;
+
+	if (!sr.write_varint(wr, data.size()))
+		return false;
+	for (size_t i = 0; i < data.size(); i++)
+		if (!sr.write_integer<uint8_t>(wr, data[i]))
+			return false;
+
+	return true;
+}
+
+template <typename Writer>
+bool encode_bulk(Writer &wr, const std::string &path, const std::vector<uint8_t> &data) {
+	bragi::serializer sr;
+
+	if (!sr.write_varint(wr, path.size()))
+		return false;
+	if (!sr.write_bytes(wr, path.data(), path.size()))
+		return false;
+
+	if (!sr.write_varint(wr, data.size()))
+		return false;
+	return sr.write_bytes(wr, data.data(), data.size());
+}
+
+template <typename Reader>
+bool decode_per_element(Reader &rd, std::string &path, std::vector<uint8_t> &data) {
+	bragi::deserializer de;
+	uint64_t size;
+
+	if (!de.read_varint(rd, size))
+		return false;
+	path.resize(size);
+	for (size_t i = 0; i < size; i++)
+		if (!de.read_integer<char>(rd, path[i]))
+			return false;
+
+	if (!de.read_varint(rd, size))
+		return false;
+	data.resize(size);
+	for (size_t i = 0; i < size; i++)
+		if (!de.read_integer<uint8_t>(rd, data[i]))
+			return false;
+
+	return true;
+}
+
+template <typename Reader>
+bool decode_bulk(Reader &rd, std::string &path, std::vector<uint8_t> &data) {
+	bragi::deserializer de;
+	uint64_t size;
+
+	if (!de.read_varint(rd, size))
+		return false;
+	path.resize(size);
+	if (!de.read_bytes(rd, path.data(), size))
+		return false;
+
+	if (!de.read_varint(rd, size))
+		return false;
+	data.resize(size);
+	return de.read_bytes(rd, data.data(), size);
+}
+
+void check(bool ok) {
+	if (!ok) {
+		fprintf(stderr, "error: encoding or decoding failed\n");
+		exit(1);
+	}
+}
+
+void run(size_t n) {
+	std::string path(n, 'p');
+	std::vector<uint8_t> data(n);
+	for (size_t i = 0; i < n; i++)
+		data[i] = i;
+
+	size_t bytes = 2 * n;
+	size_t iterations = (size_t{1} << 26) / (bytes + 64) + 1;
+	std::vector<uint8_t> buf(bytes + 32);
+	std::string path_out;
+	std::vector<uint8_t> data_out;
+
+	auto enc_element = bench::time_ns([&] {
+		bragi::limited_writer wr{buf.data(), buf.size()};
+		check(encode_per_element(wr, path, data));
+		bench::keep(buf);
+	}, iterations);
+	auto enc_bulk = bench::time_ns([&] {
+		bragi::limited_writer wr{buf.data(), buf.size()};
+		check(encode_bulk(wr, path, data));
+		bench::keep(buf);
+	}, iterations);
+
+	auto dec_element = bench::time_ns([&] {
+		bragi::limited_reader rd{buf.data(), buf.size()};
+		check(decode_per_element(rd, path_out, data_out));
+		bench::keep(data_out);
+	}, iterations);
+	auto dec_bulk = bench::time_ns([&] {
+		bragi::limited_reader rd{buf.data(), buf.size()};
+		check(decode_bulk(rd, path_out, data_out));
+		bench::keep(data_out);
+	}, iterations);
+	check(path_out == path && data_out == data);
+
+	bench::Blob msg;
+	msg.set_id(1);
+	msg.set_path(path);
+	msg.set_data(data);
+
+	std::vector<uint8_t> head(bench::Blob::head_size), tail(msg.size_of_tail());
+	auto enc_message = bench::time_ns([&] {
+		check(bragi::write_head_tail(msg, head, tail));
+		bench::keep(tail);
+	}, iterations);
+	auto dec_message = bench::time_ns([&] {
+		auto out = bragi::parse_head_tail<bench::Blob>(head, tail);
+		check(out && out->data().size() == n);
+		bench::keep(out);
+	}, iterations);
+
+	printf("%zu byte string and %zu byte array:\n", n, n);
+	bench::report("  encode, per element", bytes, enc_element);
+	bench::report("  encode, bulk", bytes, enc_bulk);
+	bench::report("  decode, per element", bytes, dec_element);
+	bench::report("  decode, bulk", bytes, dec_bulk);
+	bench::report("  generated Blob, encode", bytes, enc_message);
+	bench::report("  generated Blob, decode", bytes, dec_message);
+	printf("  bulk speed-up: encode %.1fx, decode %.1fx\n", enc_element / enc_bulk, dec_element / dec_bulk);
+}
+
+} // namespace
+
+int main() {
+	for (size_t n : {16, 256, 4096, 65536})
+		run(n);
+}
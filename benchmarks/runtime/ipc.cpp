@@ -0,0 +1,77 @@
+// Measures encoding and decoding the heads of typical IPC requests and replies.
+
+#include <bragi/helpers-all.hpp>
+#include <bragi/helpers-std.hpp>
+#include <ipc.bragi.hpp>
+#include <stdlib.h>
+#include <vector>
+
+#include "bench.hpp"
+
+namespace {
+
+// Forwards to a limited_writer, but is not one, so the encoders check every write.
+struct checked_writer {
+	bool write(size_t offset, const void *data, size_t size) {
+		return wr.write(offset, data, size);
+	}
+
+	bragi::limited_writer &wr;
+};
+
+void check(bool ok) {
+	if (!ok) {
+		fprintf(stderr, "error: encoding or decoding failed\n");
+		exit(1);
+	}
+}
+
+template <typename Message>
+void run(const char *name, Message &msg) {
+	constexpr size_t iterations = 1 << 22;
+	std::vector<uint8_t> head(Message::head_size);
+
+	auto enc_checked = bench::time_ns([&] {
+		bragi::limited_writer wr{head.data(), head.size()};
+		checked_writer cwr{wr};
+		check(msg.encode_head(cwr));
+		bench::keep(head);
+	}, iterations);
+	auto enc = bench::time_ns([&] {
+		bragi::limited_writer wr{head.data(), head.size()};
+		check(msg.encode_head(wr));
+		bench::keep(head);
+	}, iterations);
+	auto dec = bench::time_ns([&] {
+		auto out = bragi::parse_head_only<Message>(head);
+		check(out.has_value());
+		bench::keep(out);
+	}, iterations);
+
+	size_t size = msg.size_of_head();
+	printf("%s (%zu byte head):\n", name, size);
+	bench::report("  encode, checked writes", size, enc_checked);
+	bench::report("  encode", size, enc);
+	bench::report("  decode", size, dec);
+}
+
+} // namespace
+
+int main() {
+	bench::Request req;
+	req.set_req_type(3);
+	req.set_handle(42);
+	req.set_offset(1 << 20);
+	req.set_size(4096);
+	req.set_flags(0x80);
+	req.set_mode(0644);
+	req.set_path("/usr/lib/libc.so.6");
+	run("Request", req);
+
+	bench::Reply reply;
+	reply.set_error(bench::Error::SUCCESS);
+	reply.set_size(4096);
+	reply.set_handle(42);
+	reply.set_flags(0x80);
+	run("Reply", reply);
+}
@@ -0,0 +1,63 @@
+// Measures encoding messages with large string arrays, the case in which
+// computing the sizes up front costs the most.
+
+#include <bragi/helpers-all.hpp>
+#include <bragi/helpers-std.hpp>
+#include <strings.bragi.hpp>
+#include <stdlib.h>
+#include <string>
+#include <vector>
+
+#include "bench.hpp"
+
+namespace {
+
+void check(bool ok) {
+	if (!ok) {
+		fprintf(stderr, "error: encoding or decoding failed\n");
+		exit(1);
+	}
+}
+
+void run(size_t n) {
+	bench::Listing msg;
+	msg.set_status(0);
+	msg.set_cookie(0x1234);
+	msg.set_directory("/usr/share/doc");
+	for (size_t i = 0; i < n; i++) {
+		msg.add_names("file-with-a-longer-name-" + std::to_string(i));
+		msg.add_sizes(i * 4096);
+	}
+
+	size_t iterations = (size_t{1} << 22) / n + 1;
+	std::vector<uint8_t> head(bench::Listing::head_size), tail(msg.size_of_tail());
+	size_t bytes = msg.size_of_head() + tail.size();
+
+	auto encode = bench::time_ns([&] {
+		check(bragi::write_head_tail(msg, head, tail));
+		bench::keep(tail);
+	}, iterations);
+	// A sender first has to find out how large the tail buffer must be.
+	auto size_and_encode = bench::time_ns([&] {
+		tail.resize(msg.size_of_tail());
+		check(bragi::write_head_tail(msg, head, tail));
+		bench::keep(tail);
+	}, iterations);
+	auto decode = bench::time_ns([&] {
+		auto out = bragi::parse_head_tail<bench::Listing>(head, tail);
+		check(out && out->names().size() == n);
+		bench::keep(out);
+	}, iterations);
+
+	printf("%zu names:\n", n);
+	bench::report("  encode", bytes, encode);
+	bench::report("  size and encode", bytes, size_and_encode);
+	bench::report("  decode", bytes, decode);
+}
+
+} // namespace
+
+int main() {
+	for (size_t n : {16, 256, 4096})
+		run(n);
+}
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+'''
+Generates synthetic bragi schemas for the benchmarks
+
+Can also be run on its own to write a schema to stdout, e.g. to measure a large
+schema with 'bragi --timings'.
+'''
+
+import argparse
+
+def make_struct(name, level, depth):
+    out = [f'struct {name}_{level} {{\n', f'\tuint32 a{level};\n', f'\tstring b{level};\n', f'\tuint64 c{level};\n']
+
+    if level + 1 < depth:
+        out.append(f'\t{name}_{level + 1} inner;\n')
+
+    out.append('}\n\n')
+    return out
+
+def make_message(i, members, tags, arrays, structs, indent):
+    out = [
+        f'message Message{i} {i + 1} {{\n',
+        'head(128):\n',
+        '\tuint32 id;\n',
+    ]
+
+    if arrays:
+        out.append('\tuint8[16] digest;\n')
+
+    if tags:
+        out.append('\ttags {\n')
+        for t in range(tags):
+            kind = t % 3
+            if kind == 0:
+                out.append(f'\t\ttag({t + 1}) uint64 flags{t};\n')
+            elif kind == 1 or not arrays:
+                out.append(f'\t\ttag({t + 1}) string label{t};\n')
+            else:
+                out.append(f'\t\ttag({t + 1}) uint32[] values{t};\n')
+        out.append('\t}\n')
+
+    out.append('tail:\n')
+
+    kinds = ['uint32', 'string']
+    if arrays:
+        kinds += ['uint64[]', 'byte[8]']
+
+    for j in range(members):
+        if structs and j == 0:
+            out.append(f'\tStruct{i % structs}_0 data;\n')
+        else:
+            out.append(f'\t{kinds[j % len(kinds)]} member{j};\n')
+
+    out.append('}\n')
+    return [indent + line if line != '\n' else line for line in out]
+
+def make_schema(messages = 100, members = 8, groups = 0, structs = 0, depth = 1, tags = 2, arrays = True):
+    '''
+    Returns the source of a synthetic schema
+
+    The messages are spread evenly over groups groups, or all placed at the top
+    level if groups is 0. Each message has tags tagged members in its head and
+    members tail members, the first of which uses one of structs chains of structs
+    nested depth levels deep. arrays adds fixed-size and dynamic array members to
+    the messages.
+    '''
+    out = ['namespace "bench";\n\n']
+
+    # The C++ backend needs every struct to be defined before it is used.
+    for i in range(structs):
+        for level in reversed(range(depth)):
+            out.extend(make_struct(f'Struct{i}', level, depth))
+
+    if groups:
+        per_group = -(-messages // groups)
+
+        for g in range(groups):
+            out.append('group {\n')
+            for i in range(g * per_group, min(messages, (g + 1) * per_group)):
+                out.extend(make_message(i, members, tags, arrays, structs, '\t'))
+            out.append('}\n\n')
+    else:
+        for i in range(messages):
+            out.extend(make_message(i, members, tags, arrays, structs, ''))
+            out.append('\n')
+
+    return ''.join(out)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'synthetic bragi schema generator')
+    parser.add_argument('-m', '--messages', help = 'number of messages', type = int, default = 100)
+    parser.add_argument('--members', help = 'number of tail members per message', type = int, default = 8)
+    parser.add_argument('--groups', help = 'number of groups the messages are spread over (0: no groups)', type = int, default = 0)
+    parser.add_argument('--structs', help = 'number of struct chains used by the messages', type = int, default = 0)
+    parser.add_argument('--depth', help = 'nesting depth of every struct chain', type = int, default = 1)
+    parser.add_argument('--tags', help = 'number of tagged members per message', type = int, default = 2)
+    parser.add_argument('--no-arrays', help = 'do not use array members', action = 'store_false', dest = 'arrays')
+    args = parser.parse_args()
+
+    print(make_schema(args.messages, args.members, args.groups, args.structs, args.depth, args.tags, args.arrays), end = '')
+
+if __name__ == '__main__':
+    main()
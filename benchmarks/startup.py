@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+'''
+Measures the start-up cost of the bragi CLI
+
+Importing bragi.cli must not pull in Lark or any of the backends, only the backend
+selected on the command line is loaded later on. This script checks that with
+'python -X importtime', for the import as well as for complete runs of every backend,
+and reports the wall time of these runs.
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported once they are actually needed.
+LAZY_MODULES = [
+    'lark',
+    'bragi.parser',
+    'bragi.lark_parser',
+    'bragi.native_parser',
+    'bragi.cpp_generator',
+    'bragi.wireshark_generator',
+    'bragi.rust_generator',
+    'bragi.server',
+    'concurrent.futures',
+]
+
+# Modules that no run must import, mapped to the reason.
+SLOW_MODULES = {
+    'importlib.metadata': 'takes longer to import than a cached run',
+}
+
+BACKENDS = {
+    'cpp': ['cpp', '-l', 'stdc++'],
+    'rust': ['rust'],
+}
+
+GENERATORS = {
+    'cpp': 'bragi.cpp_generator',
+    'rust': 'bragi.rust_generator',
+    'wireshark': 'bragi.wireshark_generator',
+}
+
+def import_times(argv):
+    '''
+    Returns a dict mapping every module imported by 'python argv' to its cumulative import time in us
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + argv,
+            cwd = ROOT, capture_output = True, text = True, check = True)
+    times = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative_us)
+
+    return times
+
+def time_run(argv, repeat):
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'bragi'] + argv, cwd = ROOT, check = True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description = 'bragi start-up benchmark')
+    parser.add_argument('-n', '--repeat', help = 'number of runs per measurement (the fastest is reported)', type = int, default = 10)
+    parser.add_argument('--max-import-ms', help = 'fail if importing bragi.cli takes longer than this', type = float)
+    args = parser.parse_args()
+
+    times = import_times(['-c', 'import bragi.cli'])
+    cli_ms = times['bragi.cli'] / 1000
+    print(f'import bragi.cli: {cli_ms:.1f} ms')
+
+    failed = False
+
+    eager = [m for m in LAZY_MODULES if m in times]
+    if eager:
+        print(f'error: importing bragi.cli also imports {", ".join(eager)}')
+        failed = True
+
+    if args.max_import_ms is not None and cli_ms > args.max_import_ms:
+        print(f'error: importing bragi.cli takes longer than {args.max_import_ms} ms')
+        failed = True
+
+    source = os.path.join(ROOT, 'tests', 'basic', 'basic.bragi')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, backend in BACKENDS.items():
+            output = os.path.join(tmp, f'out.{name}')
+            elapsed = time_run(['-o', output, source] + backend, args.repeat)
+            print(f'bragi {" ".join(backend)}: {elapsed * 1000:.1f} ms')
+
+            times = import_times(['-m', 'bragi', '-o', output, source] + backend)
+
+            for module, reason in SLOW_MODULES.items():
+                if module in times:
+                    print(f'error: bragi {" ".join(backend)} imports {module}, which {reason}')
+                    failed = True
+
+            others = [m for b, m in GENERATORS.items() if b != name and m in times]
+            if others:
+                print(f'error: bragi {" ".join(backend)} also imports {", ".join(others)}')
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+'''
+Runs the compiler benchmark suite and stores its results
+
+Measures parsing with both engines, verification, layout and every backend on a
+set of synthetic schemas. The results are stored as benchmarks/results/<label>.json
+(the label defaults to 'git describe' of the tree), and --baseline compares them
+against an earlier run so that regressions between versions show up.
+'''
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bragi.parser import CompilationUnit
+from bragi.lark_parser import get_parser
+from bragi.cpp_generator import CodeGenerator as CppGenerator
+from bragi.rust_generator import CodeGenerator as RustGenerator
+from bragi.wireshark_generator import CodeGenerator as WiresharkGenerator
+
+from schema import make_schema
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+SCHEMAS = {
+    'flat': dict(messages = 1000, members = 8),
+    'groups': dict(messages = 1000, members = 8, groups = 20),
+    'structs': dict(messages = 500, members = 8, structs = 50, depth = 4),
+    'tags': dict(messages = 500, members = 4, tags = 16),
+}
+
+BACKENDS = {
+    'cpp-std': lambda units: CppGenerator(units, 'stdc++'),
+    'cpp-frigg': lambda units: CppGenerator(units, 'frigg'),
+    'rust': lambda units: RustGenerator(units),
+    'wireshark': lambda units: WiresharkGenerator(units),
+}
+
+def best_of(repeat, prepare, measure):
+    '''
+    Returns the fastest of repeat runs of measure(prepare())
+    '''
+    best = None
+
+    for _ in range(repeat):
+        state = prepare()
+
+        start = time.perf_counter()
+        measure(state)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def processed_unit(schema):
+    unit = CompilationUnit('bench.bragi', schema)
+    unit.process('native')
+    return unit
+
+def run_schema(schema, repeat):
+    '''
+    Returns a dict mapping every benchmark to its time in seconds for schema
+    '''
+    results = {}
+
+    for engine in ['lark', 'native']:
+        results[f'parse-{engine}'] = best_of(repeat,
+                lambda: CompilationUnit('bench.bragi', schema),
+                lambda unit: unit.process(engine))
+
+    # Verification records state in the tokens, so every run needs a fresh unit.
+    results['verify'] = best_of(repeat, lambda: processed_unit(schema), lambda unit: unit.verify())
+
+    unit = processed_unit(schema)
+    unit.verify()
+    results['layout'] = best_of(repeat, lambda: unit, lambda unit: unit.layout())
+
+    # The wireshark backend reports constructs it does not support on stdout.
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for backend, make_generator in BACKENDS.items():
+            results[backend] = best_of(repeat, lambda: make_generator([unit]), lambda generator: generator.generate())
+
+    return results
+
+def default_label():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'],
+                cwd = ROOT, capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def load_results(label):
+    with open(os.path.join(RESULTS_DIR, f'{label}.json'), 'r') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'bragi compiler benchmark suite')
+    parser.add_argument('-n', '--repeat', help = 'number of runs per measurement (the fastest is reported)', type = int, default = 3)
+    parser.add_argument('--scale', help = 'factor applied to the number of messages of every schema', type = float, default = 1)
+    parser.add_argument('--schema', help = 'only run the given schemas', choices = list(SCHEMAS), action = 'append')
+    parser.add_argument('--label', help = 'name the results are stored under (default: git describe)', type = str)
+    parser.add_argument('--no-save', help = 'do not store the results', action = 'store_true')
+    parser.add_argument('--baseline', help = 'label of earlier results to compare against', type = str)
+    parser.add_argument('--max-regression', help = 'fail if a benchmark is slower than the baseline by more than this factor', type = float)
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline)['results'] if args.baseline else {}
+
+    # Building the Lark parser is a one-time cost that is not part of any benchmark.
+    get_parser()
+
+    results = {}
+    regressions = []
+
+    for name in args.schema or SCHEMAS:
+        options = dict(SCHEMAS[name])
+        options['messages'] = max(1, int(options['messages'] * args.scale))
+
+        for benchmark, seconds in run_schema(make_schema(**options), args.repeat).items():
+            key = f'{name}/{benchmark}'
+            results[key] = seconds
+            line = f'{key:<24} {seconds * 1000:9.2f} ms'
+
+            if key in baseline:
+                ratio = seconds / baseline[key]
+                line += f'  {ratio:5.2f}x baseline'
+
+                if args.max_regression is not None and ratio > args.max_regression:
+                    regressions.append(key)
+
+            print(line, flush = True)
+
+    if not args.no_save:
+        label = args.label or default_label()
+        path = os.path.join(RESULTS_DIR, f'{label}.json')
+
+        os.makedirs(RESULTS_DIR, exist_ok = True)
+        with open(path, 'w') as f:
+            json.dump({
+                'label': label,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'scale': args.scale,
+                'results': results,
+            }, f, indent = 2)
+            f.write('\n')
+
+        print(f'results stored in {os.path.relpath(path)}')
+
+    if regressions:
+        print(f'error: slower than the baseline by more than {args.max_regression}x: {", ".join(regressions)}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
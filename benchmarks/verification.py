@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+'''
+Measures how semantic analysis scales with the size of the schema
+
+Verifies synthetic schemas with up to --messages messages in a single group and
+reports the verification time per message. For linear scaling the time per message
+stays roughly constant.
+'''
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bragi.parser import CompilationUnit
+
+from schema import make_schema
+
+def time_verification(schema, repeat):
+    best = None
+
+    for _ in range(repeat):
+        unit = CompilationUnit('bench.bragi', schema)
+        unit.process()
+
+        start = time.perf_counter()
+        unit.verify()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description = 'bragi verification scaling benchmark')
+    parser.add_argument('-n', '--repeat', help = 'number of runs per measurement (the fastest is reported)', type = int, default = 3)
+    parser.add_argument('-m', '--messages', help = 'number of messages of the largest schema', type = int, default = 10000)
+    parser.add_argument('--members', help = 'number of tail members per message', type = int, default = 4)
+    parser.add_argument('--max-ratio', help = 'fail if the time per message of the largest schema exceeds that of the smallest by this factor', type = float)
+    args = parser.parse_args()
+
+    per_message = []
+
+    for messages in [args.messages // 4, args.messages // 2, args.messages]:
+        elapsed = time_verification(make_schema(messages, args.members, groups = 1), args.repeat)
+        per_message.append(elapsed / messages)
+        print(f'{messages:7} messages: {elapsed * 1000:8.1f} ms ({elapsed / messages * 1e6:5.1f} us/message)')
+
+    ratio = per_message[-1] / per_message[0]
+    print(f'time per message grows by {ratio:.2f}x')
+
+    if args.max_ratio is not None and ratio > args.max_ratio:
+        print('error: verification does not scale linearly with the number of messages')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+'''
+In-process compiler API for build tooling
+
+Compiles bragi sources to generated code without spawning the bragi command and
+reports errors as structured diagnostics instead of printing them and exiting:
+
+    import bragi.api
+
+    result = bragi.api.compile_files(['proto.bragi'], 'cpp', lib = 'stdc++')
+    if result.ok:
+        write(result.output)
+    else:
+        for diagnostic in result.diagnostics:
+            print(diagnostic.format())
+
+The Lark parser and the backends are loaded once per process, so calling the API in
+a loop only pays for the actual compilation.
+'''
+
+from bragi.diagnostics import Diagnostic, CompilationError
+from bragi.timings import phase
+
+LANGUAGES = ['cpp', 'wireshark', 'rust']
+LIBS = ['stdc++', 'frigg']
+ENCODERS = ['sized', 'single-pass']
+
+# Backends that generate code for a single source at a time.
+SINGLE_SOURCE_LANGUAGES = {'rust'}
+
+class CompileResult:
+    '''
+    Output of a compilation, output is None if any of the sources contained an error
+    '''
+    __slots__ = ('output', 'diagnostics')
+
+    def __init__(self, output, diagnostics):
+        self.output = output
+        self.diagnostics = diagnostics
+
+    @property
+    def ok(self):
+        return self.output is not None
+
+def load_unit(filename, source, engine = 'lark'):
+    '''
+    Returns the parsed, verified and laid out unit for source
+
+    Raises CompilationError if source contains an error.
+    '''
+    from bragi.parser import CompilationUnit
+
+    unit = CompilationUnit(filename, source)
+    unit.process(engine)
+
+    with phase('verify', filename):
+        unit.verify()
+    with phase('layout', filename):
+        unit.layout()
+
+    return unit
+
+def make_generator(language, units, lib = 'stdc++', protobuf = False, encoder = 'sized', cache_sizes = False):
+    '''
+    Returns the code generator of the given backend for units
+
+    lib, protobuf, encoder and cache_sizes only apply to the cpp backend.
+    '''
+    if language == 'cpp':
+        from bragi.cpp_generator import CodeGenerator
+
+        return CodeGenerator(units, lib, protobuf_compat = protobuf, encoder = encoder, cache_sizes = cache_sizes)
+    elif language == 'wireshark':
+        from bragi.wireshark_generator import CodeGenerator
+
+        return CodeGenerator(units)
+    elif language == 'rust':
+        from bragi.rust_generator import CodeGenerator
+
+        return CodeGenerator(units)
+
+    raise ValueError(f'unknown language {language!r}, expected one of {", ".join(LANGUAGES)}')
+
+def generate(units, language, lib = 'stdc++', protobuf = False, encoder = 'sized', cache_sizes = False):
+    '''
+    Returns the code generated for units by the given backend
+    '''
+    return make_generator(language, units, lib, protobuf, encoder, cache_sizes).generate()
+
+def check_options(language, n_sources, lib = 'stdc++', encoder = 'sized', engine = 'lark'):
+    '''
+    Raises ValueError if the options cannot be used to compile n_sources sources
+    '''
+    if language not in LANGUAGES:
+        raise ValueError(f'unknown language {language!r}, expected one of {", ".join(LANGUAGES)}')
+    if language == 'cpp' and lib not in LIBS:
+        raise ValueError(f'unknown library {lib!r}, expected one of {", ".join(LIBS)}')
+    if language == 'cpp' and encoder not in ENCODERS:
+        raise ValueError(f'unknown encoder {encoder!r}, expected one of {", ".join(ENCODERS)}')
+    if engine not in ('lark', 'native'):
+        raise ValueError(f'unknown parser engine {engine!r}, expected lark or native')
+    if language in SINGLE_SOURCE_LANGUAGES and n_sources != 1:
+        raise ValueError(f'the {language} backend compiles exactly one source at a time, got {n_sources}')
+
+def compile_sources(sources, language, lib = 'stdc++', protobuf = False, encoder = 'sized', cache_sizes = False, engine = 'lark'):
+    '''
+    Compiles sources, a list of (filename, source text) pairs, into one output
+
+    Errors in the sources do not raise, they are returned in the diagnostics of the
+    result. Every source is checked, so the result reports the first error of each.
+
+    Invalid options raise ValueError before any source is parsed, see check_options().
+    This includes passing several sources to a backend that only takes one. Other
+    exceptions are bugs in bragi.
+    '''
+    check_options(language, len(sources), lib, encoder, engine)
+
+    units = []
+    diagnostics = []
+    failed = False
+
+    for filename, source in sources:
+        try:
+            unit = load_unit(filename, source, engine)
+        except CompilationError as e:
+            diagnostics.extend(e.diagnostics)
+            failed = True
+            continue
+
+        diagnostics.extend(unit.diagnostics)
+        units.append(unit)
+
+    if failed:
+        return CompileResult(None, diagnostics)
+
+    return CompileResult(generate(units, language, lib, protobuf, encoder, cache_sizes), diagnostics)
+
+def compile_string(source, language, filename = '<string>', **options):
+    '''
+    Compiles a single source text, see compile_sources()
+    '''
+    return compile_sources([(filename, source)], language, **options)
+
+def compile_files(paths, language, **options):
+    '''
+    Reads and compiles the files at paths, see compile_sources()
+
+    Files that cannot be read raise OSError or UnicodeDecodeError.
+    '''
+    sources = []
+
+    for path in paths:
+        with open(path, 'r') as f:
+            sources.append((path, f.read()))
+
+    return compile_sources(sources, language, **options)
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+
+import bragi.tokens
+from bragi.types import Type, TypeIdentity, TypeRegistry
+
+def cache_dir():
+    '''
+    Returns the directory for bragi's on-disk caches, or None if caching is disabled
+
+    The directory can be overridden through BRAGI_CACHE_DIR; setting it to an empty
+    string disables caching.
+    '''
+    path = os.environ.get('BRAGI_CACHE_DIR')
+
+    if path is None:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        path = os.path.join(base, 'bragi')
+
+    return path if path else None
+
+class CachedUnit:
+    '''
+    Verified compilation unit loaded from the unit cache
+
+    Holds everything the generators need from a CompilationUnit. Unlike the latter it
+    does not depend on bragi.parser, so loading it does not import Lark.
+    '''
+    __slots__ = ('filename', 'tokens', 'type_registry')
+
+    def __init__(self, filename, tokens, type_registry):
+        self.filename = filename
+        self.tokens = tokens
+        self.type_registry = type_registry
+
+# Classes that unit cache entries can contain and the attributes stored for them.
+# Loading an entry only ever creates objects of these classes.
+CACHED_CLASSES = {cls.__name__: (cls, cls.__slots__)
+        for cls in vars(bragi.tokens).values()
+        if isinstance(cls, type) and cls.__module__ == 'bragi.tokens'}
+CACHED_CLASSES.update({
+    'CachedUnit': (CachedUnit, CachedUnit.__slots__),
+    'Type': (Type, Type.__slots__),
+    'TypeRegistry': (TypeRegistry, ('types', 'array_types')),
+})
+
+def encode_unit(unit):
+    '''
+    Returns the JSON text of unit, a CachedUnit
+
+    The objects of the unit are stored in a table, so that objects referred to from
+    several places, like types, are shared again after decoding. Containers and
+    references are stored as [kind, payload] pairs.
+    '''
+    objects = []
+    indices = {}
+
+    def encode(value):
+        if value is None or type(value) in (bool, int, str):
+            return value
+        elif type(value) is list:
+            return ['l', [encode(v) for v in value]]
+        elif type(value) is dict:
+            return ['d', [[encode(k), encode(v)] for k, v in value.items()]]
+        elif type(value) is TypeIdentity:
+            return ['e', value.value]
+
+        index = indices.get(id(value))
+
+        if index is None:
+            name = type(value).__name__
+            _, fields = CACHED_CLASSES[name]
+            index = indices[id(value)] = len(objects)
+
+            entry = [name, None]
+            objects.append(entry)
+            entry[1] = [encode(getattr(value, f, None)) for f in fields]
+
+        return ['o', index]
+
+    root = encode(unit)
+    return json.dumps([objects, root], separators = (',', ':'))
+
+def decode_unit(text):
+    '''
+    Returns the CachedUnit stored in text by encode_unit()
+
+    Raises ValueError, LookupError or TypeError if text is not a valid entry.
+    '''
+    entries, root = json.loads(text)
+    objects = []
+
+    for name, _ in entries:
+        cls, _ = CACHED_CLASSES[name]
+        objects.append(cls.__new__(cls))
+
+    def decode(value):
+        if value is None or type(value) in (bool, int, str):
+            return value
+
+        kind, payload = value
+
+        if kind == 'l':
+            return [decode(v) for v in payload]
+        elif kind == 'd':
+            return {decode(k): decode(v) for k, v in payload}
+        elif kind == 'e':
+            return TypeIdentity(payload)
+        elif kind == 'o' and type(payload) is int:
+            return objects[payload]
+
+        raise ValueError(f'unexpected value in unit cache entry: {kind!r}')
+
+    for obj, (name, values) in zip(objects, entries):
+        _, fields = CACHED_CLASSES[name]
+
+        if len(values) != len(fields):
+            raise ValueError(f'wrong number of attributes for {name} in unit cache entry')
+
+        for field, value in zip(fields, values):
+            setattr(obj, field, decode(value))
+
+    unit = decode(root)
+
+    if type(unit) is not CachedUnit:
+        raise ValueError('unit cache entry does not hold a unit')
+
+    return unit
+
+def unit_cache_key(compiler, source):
+    h = hashlib.sha256(compiler.encode('utf-8'))
+    h.update(b'\0' + source.encode('utf-8'))
+    return h.hexdigest()
+
+# Entries are spread over 256 buckets by the first byte of their key. Every bucket
+# keeps the most recently used entries, which bounds the cache to 4096 entries.
+MAX_UNITS_PER_BUCKET = 16
+
+def cached_unit_path(directory, key):
+    return os.path.join(directory, 'units', key[:2], key)
+
+def evict_cached_units(bucket):
+    '''
+    Removes the least recently used entries of bucket beyond MAX_UNITS_PER_BUCKET
+    '''
+    try:
+        entries = [(e.stat().st_mtime, e.path) for e in os.scandir(bucket)
+                if not e.name.startswith('.')]
+    except OSError:
+        return
+
+    entries.sort()
+
+    for _, path in entries[:-MAX_UNITS_PER_BUCKET]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def load_cached_unit(directory, key):
+    '''
+    Returns the unit stored under key, or None if there is no usable entry
+    '''
+    path = cached_unit_path(directory, key)
+
+    try:
+        with open(path, 'r', encoding = 'utf-8') as f:
+            unit = decode_unit(f.read())
+    except (OSError, ValueError, LookupError, TypeError, RecursionError):
+        # Damaged entries are treated like missing ones and overwritten later on.
+        return None
+
+    # Mark the entry as recently used, see evict_cached_units().
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return unit
+
+def store_cached_unit(directory, key, unit):
+    '''
+    Stores the verified and laid out unit under key
+    '''
+    import tempfile
+
+    path = cached_unit_path(directory, key)
+    tmp = None
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(path), prefix = '.unit-')
+
+        with os.fdopen(fd, 'w', encoding = 'utf-8') as f:
+            f.write(encode_unit(CachedUnit(unit.filename, unit.tokens, unit.type_registry)))
+
+        os.replace(tmp, path)
+    except OSError:
+        # The cache is only an optimization, failing to fill it is not an error.
+        if tmp is not None and os.path.exists(tmp):
+            os.unlink(tmp)
+        return
+
+    # Every edit of a source adds an entry, e.g. in watch mode.
+    evict_cached_units(os.path.dirname(path))
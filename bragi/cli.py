@@ -1,45 +1,592 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
+import os
+import sys
 
-from bragi.parser import CompilationUnit
-from bragi.cpp_generator import CodeGenerator as CppCodeGenerator
-from bragi.wireshark_generator import CodeGenerator as WiresharkCodeGenerator
-from bragi.rust_generator import CodeGenerator as RustCodeGenerator
+from bragi import api
+from bragi import timings
+from bragi.diagnostics import CompilationError
+from bragi.timings import phase
 
-parser = argparse.ArgumentParser(prog = 'bragi', description = 'Bragi IDL to C++ compiler')
+# Everything that is not needed by every run (Lark, the backends, the server, ...)
+# is imported where it is used to keep the start-up time of the CLI low.
+
+# Separates the backends of an invocation that generates several outputs at once,
+# e.g. 'bragi proto.bragi cpp -l frigg -o proto.hpp + rust -o proto.rs'.
+BACKEND_SEPARATOR = '+'
+
+# Seconds between two checks of the inputs in watch mode.
+WATCH_INTERVAL = 0.05
+
+# Digest of this bragi version, see compiler_digest().
+shared_compiler_digest = None
+
+# Output file names used in batch mode when no output template is given.
+DEFAULT_OUTPUT_TEMPLATES = {
+	'cpp': '{basename}.bragi.hpp',
+	'wireshark': '{basename}.lua',
+	'rust': '{basename}.rs',
+}
+
+def add_backend_parsers(parser):
+	subparsers = parser.add_subparsers(required=True, dest='language')
+
+	cpp_parser = subparsers.add_parser('cpp')
+	cpp_parser.add_argument('-l', '--lib', nargs=1, help='C++ library to use', choices=['frigg', 'stdc++'], default='libc++')
+	cpp_parser.add_argument('--protobuf', help='Generate protobuf compatibilty methods (SerializeAsString/ParseFromArray)', action='store_true')
+	cpp_parser.add_argument('--encoder', help='how messages are encoded: compute the size of every part up front and write it without bounds checks if the buffer is large enough, or write every member once and fill in the offsets as they become known (default: sized)', choices=['sized', 'single-pass'], default='sized')
+	cpp_parser.add_argument('--cache-sizes', help='make messages remember the sizes and dynamic offsets of their parts until a setter changes them, for messages that are encoded repeatedly (references returned by getters must not be used to modify a message after its size was computed)', action='store_true')
+
+	ws_parser = subparsers.add_parser('wireshark')
+
+	rust_parser = subparsers.add_parser('rust')
+
+	for p in [cpp_parser, ws_parser, rust_parser]:
+		p.add_argument('-o', '--output', help='output file of this backend (overrides the global one)', type=str, dest='backend_output')
+
+parser = argparse.ArgumentParser(prog = 'bragi', description = 'Bragi IDL to C++ compiler',
+		epilog = f'Several backends can be run on the same inputs by separating them with \'{BACKEND_SEPARATOR}\'.')
 parser.add_argument('input', nargs='+', help='input file', type=argparse.FileType('r'))
-parser.add_argument('-o', '--output', help='output file', type=str)
-subparsers = parser.add_subparsers(required=True, dest='language')
+parser.add_argument('-o', '--output', help='output file, or output file template in batch mode', type=str)
+parser.add_argument('--batch', help='compile every input separately into its own output; \'{basename}\' in output templates is replaced by the input file name without extension', action='store_true')
+parser.add_argument('-O', '--output-dir', help='directory for the outputs of batch mode (implies --batch)', type=str)
+parser.add_argument('--depfile', help='write a Makefile-style dependency file listing the inputs of every output', type=str)
+parser.add_argument('--cache-dir', help='directory to cache generated outputs and verified units in, keyed by the inputs, backend options and bragi version', type=str)
+parser.add_argument('--no-unit-cache', help='do not cache verified units, which are cached next to the parser tables unless --cache-dir is given', action='store_true')
+parser.add_argument('--parser', help='parser engine, the Lark grammar or the faster hand-written parser (default: lark)', choices=['lark', 'native'], default='lark', dest='engine')
+parser.add_argument('--timings', help='print the wall time and peak memory of every compiler phase and the size of every output to stderr', action='store_true')
+parser.add_argument('--timings-json', help='write the measurements of --timings to a JSON file', type=str)
+parser.add_argument('--profile', help='write cProfile statistics of the run to a file (work done by -j worker processes is not included)', type=str)
+parser.add_argument('-j', '--jobs', help='number of processes used for parsing and generation (0: one per CPU)', type=int, default=1)
+add_backend_parsers(parser)
 
-cpp_parser = subparsers.add_parser('cpp')
-cpp_parser.add_argument('-l', '--lib', nargs=1, help='C++ library to use', choices=['frigg', 'stdc++'], default='libc++')
-cpp_parser.add_argument('--protobuf', help='Generate protobuf compatibilty methods (SerializeAsString/ParseFromArray)', action='store_true')
+backend_parser = argparse.ArgumentParser(prog = f'bragi ... {BACKEND_SEPARATOR}')
+add_backend_parsers(backend_parser)
 
-ws_parser = subparsers.add_parser('wireshark')
+serve_parser = argparse.ArgumentParser(prog = 'bragi serve',
+		description = 'Keep a bragi process running and compile requests of clients that have BRAGI_SERVER set to its socket')
+serve_parser.add_argument('-s', '--socket', help='path of the Unix socket to listen on', type=str)
 
-rust_parser = subparsers.add_parser('rust')
+def parse_arguments(argv):
+	segments = [[]]
 
-def main():
-	args = parser.parse_args()
+	for arg in argv:
+		if arg == BACKEND_SEPARATOR:
+			segments.append([])
+		else:
+			segments[-1].append(arg)
+
+	args = parser.parse_args(segments[0])
+	backends = [args] + [backend_parser.parse_args(s) for s in segments[1:]]
+
+	if args.output_dir:
+		args.batch = True
+	if args.jobs < 1:
+		args.jobs = os.cpu_count() or 1
+
+	# The first backend shares its namespace with the global options, only keep
+	# what the generators need so that backends can be sent to worker processes.
+	global_options = {'input', 'output', 'batch', 'output_dir', 'depfile', 'cache_dir', 'no_unit_cache', 'engine', 'jobs',
+			'timings', 'timings_json', 'profile'}
+	backends = [argparse.Namespace(**{k: v for k, v in vars(b).items() if k not in global_options})
+			for b in backends]
+
+	for backend in backends:
+		backend.output = backend.backend_output or args.output
+
+		if not backend.output:
+			if not args.batch:
+				parser.error(f'no output file given for the {backend.language} backend')
+
+			backend.output = DEFAULT_OUTPUT_TEMPLATES[backend.language]
+
+	return args, backends
+
+def expand_output(args, template, filename):
+	basename = os.path.splitext(os.path.basename(filename))[0]
+	path = template.replace('{basename}', basename)
+
+	if args.output_dir:
+		return os.path.join(args.output_dir, path)
+
+	return path
+
+def plan_outputs(args, backends):
+	'''
+	Returns a list of (backend, input indices, output file) tuples, one per generated file
+	'''
+	plan = []
+
+	for backend in backends:
+		if args.batch:
+			for i, source in enumerate(args.input):
+				plan.append((backend, [i], expand_output(args, backend.output, source.name)))
+		else:
+			plan.append((backend, list(range(len(args.input))), backend.output))
+
+	outputs = set()
+
+	for backend, indices, output in plan:
+		if output in outputs:
+			parser.error(f'output file {output} would be written more than once')
+
+		outputs.add(output)
+
+	return plan
+
+def make_generator(backend, units):
+	if backend.language == 'cpp':
+		return api.make_generator('cpp', units, lib = backend.lib[0], protobuf = backend.protobuf, encoder = backend.encoder,
+				cache_sizes = backend.cache_sizes)
+
+	return api.make_generator(backend.language, units)
+
+def unit_cache_dir(args):
+	'''
+	Returns the directory to cache verified units in, or None if they are not cached
+
+	Units are cached next to the parser tables unless --cache-dir is given. Unlike
+	setting BRAGI_CACHE_DIR to an empty string, --no-unit-cache keeps the parser cache.
+	'''
+	if args.no_unit_cache:
+		return None
+
+	from bragi.cache import cache_dir
+	return args.cache_dir or cache_dir()
+
+def load_unit(filename, code, engine = 'lark', cache = None):
+	'''
+	Returns the verified and laid out unit for code, using the unit cache in cache if given
+
+	Both parser engines produce the same units, so they share cache entries. Errors
+	in code are printed and end the process.
+	'''
+	if cache:
+		from bragi.cache import unit_cache_key, load_cached_unit, store_cached_unit
+
+		with phase('cache', filename):
+			key = unit_cache_key(compiler_digest(), code)
+			unit = load_cached_unit(cache, key)
+
+		if unit is not None:
+			unit.filename = filename
+			return unit
+
+	try:
+		unit = api.load_unit(filename, code, engine)
+	except CompilationError as e:
+		for diagnostic in e.diagnostics:
+			print(diagnostic.format())
+		sys.exit(1)
+
+	for diagnostic in unit.diagnostics:
+		print(diagnostic.format())
+
+	if cache:
+		with phase('cache', filename):
+			store_cached_unit(cache, key, unit)
+	return unit
+
+def generate(backend, units, output = None):
+	with phase('import', backend.language):
+		generator = make_generator(backend, units)
+	with phase('generate', output):
+		return generator.generate()
+
+def call_in_worker(record, function, *args):
+	'''
+	Calls function and returns its result and exit status along with what it printed
+
+	If record is set, the result is paired with the timings recorded by the call.
+
+	Worker processes cannot print themselves: when forked from a 'bragi serve'
+	request, their stdout and stderr are copies of the redirected ones of the request
+	and whatever they print is lost.
+	'''
+	import contextlib
+	import io
+
+	stdout = io.StringIO()
+	stderr = io.StringIO()
+	result = None
+	status = None
+
+	with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+		try:
+			if record:
+				result = timings.record_call(function, *args)
+			else:
+				result = function(*args)
+		except SystemExit as e:
+			status = e.code
+
+	return result, status, stdout.getvalue(), stderr.getvalue()
+
+def map_recorded(pool, function, *iterables):
+	'''
+	Like pool.map(), but adds the timings recorded by the workers to those of this process
+
+	What the workers print is printed by this process in submission order, and a
+	worker that exits ends this process after its output was printed.
+	'''
+	import itertools
+
+	record = timings.recorder is not None
+	results = []
+
+	for result, status, out, err in pool.map(call_in_worker, itertools.repeat(record), itertools.repeat(function), *iterables):
+		sys.stdout.write(out)
+		sys.stderr.write(err)
+
+		if status is not None:
+			sys.exit(status)
+
+		if record:
+			result, recorder = result
+			timings.recorder.merge(recorder)
+
+		results.append(result)
+
+	return results
+
+def write_output(path, text):
+	'''
+	Writes text to path unless the file already contains exactly that text
+
+	Unchanged outputs keep their mtime, so build systems do not rebuild everything
+	that includes them. Changed outputs are replaced atomically; symlinks are followed
+	and existing files keep their mode.
+	'''
+	try:
+		with open(path, "r") as f:
+			if f.read() == text:
+				return False
+	except (OSError, UnicodeDecodeError):
+		pass
+
+	import itertools
+	import stat
+
+	path = os.path.realpath(path)
+	directory, name = os.path.split(path)
+
+	try:
+		mode = stat.S_IMODE(os.stat(path).st_mode)
+	except OSError:
+		mode = None
+
+	# New outputs get the permissions open() would give them, the kernel applies the
+	# umask. The PID keeps the names of concurrent processes apart.
+	for n in itertools.count():
+		tmp = os.path.join(directory, f'.{name}.{os.getpid()}.{n}.tmp')
+		try:
+			fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+			break
+		except FileExistsError:
+			pass
+
+	try:
+		with os.fdopen(fd, "w") as o:
+			o.write(text)
+
+		if mode is not None:
+			os.chmod(tmp, mode)
+
+		os.replace(tmp, path)
+	except BaseException:
+		os.unlink(tmp)
+		raise
+
+	return True
+
+def escape_make_path(path):
+	return path.replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
+
+def generate_depfile(plan, filenames):
+	out = ''
 
-	inputs = []
-	output = args.output
+	for backend, indices, output in plan:
+		deps = ' '.join(escape_make_path(filenames[i]) for i in indices)
+		out += f'{escape_make_path(output)}: {deps}\n'
+
+	return out
+
+def compiler_digest():
+	'''
+	Returns a digest identifying this bragi version, including local modifications
+
+	Only the sources of the package are hashed: looking up the installed version with
+	importlib.metadata would take longer than most cached runs.
+	'''
+	global shared_compiler_digest
+	if shared_compiler_digest is not None:
+		return shared_compiler_digest
+
+	h = hashlib.sha256()
+	package_dir = os.path.dirname(os.path.abspath(__file__))
+
+	for name in sorted(os.listdir(package_dir)):
+		if name.endswith('.py'):
+			with open(os.path.join(package_dir, name), 'rb') as f:
+				h.update(name.encode('utf-8') + b'\0' + f.read() + b'\0')
+
+	shared_compiler_digest = h.hexdigest()
+	return shared_compiler_digest
+
+def output_cache_key(compiler, backend, sources):
+	options = sorted((k, v) for k, v in vars(backend).items() if k not in {'output', 'backend_output'})
+
+	h = hashlib.sha256(compiler.encode('utf-8'))
+	h.update(repr(options).encode('utf-8'))
+
+	for source in sources:
+		h.update(b'\0' + hashlib.sha256(source.encode('utf-8')).digest())
+
+	return h.hexdigest()
+
+def cached_output_path(cache_dir, key):
+	return os.path.join(cache_dir, 'outputs', key[:2], key)
+
+def load_cached_output(cache_dir, key):
+	try:
+		with open(cached_output_path(cache_dir, key), "r") as f:
+			return f.read()
+	except (OSError, UnicodeDecodeError):
+		return None
+
+def store_cached_output(cache_dir, key, text):
+	path = cached_output_path(cache_dir, key)
+
+	try:
+		os.makedirs(os.path.dirname(path), exist_ok = True)
+		write_output(path, text)
+	except OSError:
+		# The cache is only an optimization, failing to fill it is not an error.
+		pass
+
+def run(argv):
+	args, backends = parse_arguments(argv)
+
+	if args.timings or args.timings_json:
+		timings.enable()
+
+	if args.profile:
+		import cProfile
+
+		profiler = cProfile.Profile()
+		profiler.enable()
+
+		try:
+			build(args, backends)
+		finally:
+			profiler.disable()
+			profiler.dump_stats(args.profile)
+	else:
+		build(args, backends)
+
+	if timings.recorder is not None:
+		summary = timings.recorder.summary()
+
+		if args.timings:
+			sys.stderr.write(timings.format_report(summary))
+		if args.timings_json:
+			import json
+
+			write_output(args.timings_json, json.dumps(summary, indent = 2) + '\n')
+
+def build(args, backends):
+	plan = plan_outputs(args, backends)
+
+	filenames = [source.name for source in args.input]
+	sources = [source.read() for source in args.input]
+
+	if args.output_dir:
+		os.makedirs(args.output_dir, exist_ok = True)
+
+	texts = [None] * len(plan)
+	keys = [None] * len(plan)
+
+	unit_cache = unit_cache_dir(args)
+
+	if args.cache_dir:
+		compiler = compiler_digest()
+
+		for n, (backend, indices, output) in enumerate(plan):
+			with phase('cache', output):
+				keys[n] = output_cache_key(compiler, backend, [sources[i] for i in indices])
+				texts[n] = load_cached_output(args.cache_dir, keys[n])
+
+	# Only parse the inputs of outputs that are not cached.
+	pending = [n for n in range(len(plan)) if texts[n] is None]
+	needed = sorted({i for n in pending for i in plan[n][1]})
+	inputs = {}
+
+	# All backends share the parsed and verified units. Worker processes return
+	# their results in submission order, so the outputs do not depend on -j.
+	if args.jobs > 1 and pending:
+		import concurrent.futures
+		import itertools
+
+		with concurrent.futures.ProcessPoolExecutor(max_workers = args.jobs) as pool:
+			inputs.update(zip(needed, map_recorded(pool, load_unit,
+					[filenames[i] for i in needed],
+					[sources[i] for i in needed],
+					itertools.repeat(args.engine),
+					itertools.repeat(unit_cache))))
+			generated = map_recorded(pool, generate,
+					[plan[n][0] for n in pending],
+					[[inputs[i] for i in plan[n][1]] for n in pending],
+					[plan[n][2] for n in pending])
+	else:
+		inputs.update((i, load_unit(filenames[i], sources[i], args.engine, unit_cache)) for i in needed)
+		generated = [generate(plan[n][0], [inputs[i] for i in plan[n][1]], plan[n][2]) for n in pending]
+
+	for n, text in zip(pending, generated):
+		texts[n] = text
+
+		if args.cache_dir:
+			with phase('cache', plan[n][2]):
+				store_cached_output(args.cache_dir, keys[n], text)
+
+	for n, ((backend, indices, output), text) in enumerate(zip(plan, texts)):
+		with phase('write', output):
+			written = write_output(output, text)
+
+		if timings.recorder is not None:
+			timings.recorder.add_output(output, len(text.encode('utf-8')), n not in pending, written)
+
+	if args.depfile:
+		write_output(args.depfile, generate_depfile(plan, filenames))
+
+def watch(argv):
+	'''
+	Regenerates the outputs of argv whenever one of their inputs changes
+
+	Parsed units are kept in memory, only inputs whose content changed are parsed
+	and verified again and only the outputs depending on them are regenerated.
+	Failures are reported and the affected outputs are retried once their inputs
+	change again.
+	'''
+	import time
+
+	args, backends = parse_arguments(argv)
+	plan = plan_outputs(args, backends)
+
+	filenames = [source.name for source in args.input]
+	stamps = [None] * len(filenames)
+	sources = [None] * len(filenames)
+	units = [None] * len(filenames)
 
 	for source in args.input:
-		code = source.read()
-		unit = CompilationUnit(source.name, code)
-		unit.process()
-		unit.verify()
-		inputs.append(unit)
-
-	if args.language == 'cpp':
-		lib = args.lib[0]
-		generator = CppCodeGenerator(inputs, lib, protobuf_compat = args.protobuf)
-	elif args.language == 'wireshark':
-		generator = WiresharkCodeGenerator(inputs)
-	elif args.language == 'rust':
-		generator = RustCodeGenerator(inputs)
-
-	with open(output, "w") as o:
-		o.write(generator.generate())
+		source.close()
+
+	unit_cache = unit_cache_dir(args)
+
+	if args.output_dir:
+		os.makedirs(args.output_dir, exist_ok = True)
+	if args.depfile:
+		write_output(args.depfile, generate_depfile(plan, filenames))
+
+	while True:
+		changed = set()
+
+		for i, filename in enumerate(filenames):
+			try:
+				st = os.stat(filename)
+			except OSError:
+				continue
+
+			# Editors often rewrite files without changing them, so compare the
+			# content before doing any work.
+			if (st.st_mtime_ns, st.st_size) == stamps[i]:
+				continue
+			stamps[i] = (st.st_mtime_ns, st.st_size)
+
+			# The file may be replaced between stat() and open(), or be saved halfway.
+			try:
+				with open(filename, "r") as f:
+					code = f.read()
+			except (OSError, UnicodeDecodeError) as e:
+				print(f'bragi: cannot read {filename}: {e}', file = sys.stderr, flush = True)
+				continue
+			if code == sources[i]:
+				continue
+			sources[i] = code
+
+			# Errors have already been reported, keep watching for a fix.
+			try:
+				units[i] = load_unit(filename, code, args.engine, unit_cache)
+			except SystemExit:
+				units[i] = None
+
+			changed.add(i)
+
+		for backend, indices, output in plan:
+			if not changed.intersection(indices) or not all(units[i] for i in indices):
+				continue
+
+			try:
+				text = generate(backend, [units[i] for i in indices])
+			except Exception:
+				# A bug in a backend should not end the session, the next edit may
+				# avoid whatever triggers it.
+				import traceback
+				print(f'bragi: the {backend.language} backend failed for {output}:', file = sys.stderr)
+				traceback.print_exc()
+				continue
+
+			try:
+				updated = write_output(output, text)
+			except OSError as e:
+				print(f'bragi: cannot write {output}: {e}', file = sys.stderr, flush = True)
+				continue
+
+			if updated:
+				print(f'bragi: updated {output}', flush = True)
+
+		time.sleep(WATCH_INTERVAL)
+
+def main():
+	argv = sys.argv[1:]
+
+	if argv[:1] == ['watch']:
+		try:
+			watch(argv[1:])
+		except KeyboardInterrupt:
+			pass
+		return
+
+	if argv[:1] == ['serve']:
+		# Import the backends and build the parser once, requests are handled
+		# in forked children that inherit them.
+		import bragi.cpp_generator
+		import bragi.wireshark_generator
+		import bragi.rust_generator
+		from bragi import server
+		from bragi.lark_parser import get_parser
+
+		args = serve_parser.parse_args(argv[1:])
+		get_parser()
+
+		try:
+			server.serve(args.socket or server.default_socket_path(), run)
+		except RuntimeError as e:
+			serve_parser.error(str(e))
+		return
+
+	# Let a running server do the work if there is one, compile in-process otherwise.
+	socket_path = os.environ.get('BRAGI_SERVER')
+
+	if socket_path:
+		from bragi import server
+
+		response = server.forward_request(socket_path, argv)
+
+		if response is not None:
+			sys.stdout.write(response['stdout'])
+			sys.stderr.write(response['stderr'])
+			sys.exit(response['status'])
+
+	run(argv)
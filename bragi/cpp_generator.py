@@ -1,5 +1,6 @@
 from .tokens import *
 from .types import *
+from .emitter import Emitter
 
 import hashlib
 
@@ -41,13 +42,15 @@ class FriggTraits:
 
 flatten = lambda l: [item for sublist in l for item in sublist]
 
-class CodeGenerator:
-    def __init__(self, unit, stdlib, protobuf_compat = False):
+class CodeGenerator(Emitter):
+    def __init__(self, unit, stdlib, protobuf_compat = False, encoder = 'sized', cache_sizes = False):
+        super().__init__()
         self.units = unit
         self.protobuf_compat = protobuf_compat
+
+        # Whether messages memoize the sizes and dynamic offsets of their parts.
+        self.cache_sizes = cache_sizes
         self.stdlib_traits = None
-        self.indent_depth = 0
-        self.indent = ''
 
         if stdlib == 'stdc++':
             self.stdlib_traits = StdlibTraits()
@@ -56,70 +59,72 @@ class CodeGenerator:
         else:
             raise AttributeError('invalid standard library')
 
+        if encoder == 'sized':
+            self.emit_encoder = self.emit_part_encoder
+        elif encoder == 'single-pass':
+            self.emit_encoder = self.emit_single_pass_part_encoder
+        else:
+            raise AttributeError('invalid encoder')
+        self.encoder = encoder
+
         self.current_ns = None
 
-    def enter_indent(self):
-        self.indent_depth += 1
-        self.indent = '\t' * self.indent_depth
-        return self.indent
+        # C++ spelling of every type, the type registry interns types so they can be
+        # looked up by identity.
+        self.type_names = {}
 
-    def leave_indent(self):
-        self.indent_depth -= 1
-        self.indent = '\t' * self.indent_depth
-        return self.indent
+    def generate(self, stream = None):
+        '''
+        Generates the header, writing it to stream if given and returning it otherwise
+        '''
+        self.begin_output(stream)
 
-    def generate(self):
-        out = '// This file has been autogenerated, changes *will* be lost eventually...\n'
-        out += '#pragma once\n'
+        self.write('// This file has been autogenerated, changes *will* be lost eventually...\n')
+        self.write('#pragma once\n')
 
         for i in self.stdlib_traits.includes():
-            out += f'#include {i}\n'
+            self.write(f'#include {i}\n')
 
-        out += '#include <bragi/internals.hpp>\n\n'
+        self.write('#include <bragi/internals.hpp>\n\n')
 
         for unit in self.units:
             for thing in unit.tokens:
                 if type(thing) == NamespaceTag:
-                    out += self.switch_ns(thing)
+                    self.switch_ns(thing)
                     protohash = hashlib.shake_128(thing.name.encode('ascii')).hexdigest(4)
-                    out += f'{self.indent}const char protocol_hash[] = "0x{protohash}";\n\n'
+                    self.write(f'{self.indent}const char protocol_hash[] = "0x{protohash}";\n\n')
                 if type(thing) == UsingTag:
-                    out += self.generate_using(thing)
+                    self.generate_using(thing)
                 if type(thing) == Enum and thing.mode == "enum":
-                    out += self.generate_enum(thing)
+                    self.generate_enum(thing)
                 if type(thing) == Enum and thing.mode == "consts":
-                    out += self.generate_consts(thing)
+                    self.generate_consts(thing)
                 if type(thing) == Message:
-                    out += self.generate_message(thing)
+                    self.generate_message(thing)
                 if type(thing) == Struct:
-                    out += self.generate_struct(thing)
+                    self.generate_struct(thing)
                 if type(thing) == Group:
                     for m in thing.members:
-                        out += self.generate_message(m)
+                        self.generate_message(m)
 
-        out += self.finalize_ns()
+        self.finalize_ns()
 
-        return out
+        return self.end_output()
 
     def switch_ns(self, ns):
-        out = ''
-
         if self.current_ns:
-            out += self.finalize_ns()
+            self.finalize_ns()
 
-        out += f'namespace {ns.name} {{\n\n'
+        self.write(f'namespace {ns.name} {{\n\n')
 
         self.current_ns = ns
-        return out
 
     def finalize_ns(self):
         if self.current_ns:
-            return f'}} // namespace {self.current_ns.name}\n\n'
-
-        return ''
+            self.write(f'}} // namespace {self.current_ns.name}\n\n')
 
     def generate_consts(self, enum):
-        out = f'{self.indent}namespace {enum.name} {{\n'
+        self.write(f'{self.indent}namespace {enum.name} {{\n')
         i = 0
         self.enter_indent()
 
@@ -127,15 +132,15 @@ class CodeGenerator:
             if m.value is not None:
                 i = m.value
 
-            out += f'{self.indent}inline constexpr {self.generate_type(enum.type)} {m.name} = {i};\n'
+            self.write(f'{self.indent}inline constexpr {self.generate_type(enum.type)} {m.name} = {i};\n')
 
             i += 1
 
         self.leave_indent()
-        return out + f'{self.indent}}} // namespace {enum.name}\n\n'
+        self.write(f'{self.indent}}} // namespace {enum.name}\n\n')
 
     def generate_enum(self, enum):
-        out = f'{self.indent}enum class {enum.name} : int32_t {{\n'
+        self.write(f'{self.indent}enum class {enum.name} : int32_t {{\n')
         i = 0
         self.enter_indent()
 
@@ -143,12 +148,12 @@ class CodeGenerator:
             if m.value is not None:
                 i = m.value
 
-            out += f'{self.indent}{m.name} = {i},\n'
+            self.write(f'{self.indent}{m.name} = {i},\n')
 
             i += 1
 
         self.leave_indent()
-        return out + f'{self.indent}}}; // enum class {enum.name}\n\n'
+        self.write(f'{self.indent}}}; // enum class {enum.name}\n\n')
 
     def make_ns_name(self, full):
         a, b, c = full.rpartition('::')
@@ -167,32 +172,27 @@ class CodeGenerator:
 
         if not to_a:
             last_ns = self.current_ns
-            out = self.finalize_ns()
+            self.finalize_ns()
             self.current_ns = None
 
             if to_b != '':
-                out += f'namespace {to_b} {{\n\n'
+                self.write(f'namespace {to_b} {{\n\n')
 
             if self.stdlib_traits.needs_allocator():
-                out += f'{self.indent}template <typename Allocator>\n'
-                out += f'{self.indent}using {to_name} = {from_full}<Allocator>;\n\n'
+                self.write(f'{self.indent}template <typename Allocator>\n')
+                self.write(f'{self.indent}using {to_name} = {from_full}<Allocator>;\n\n')
             else:
-                out += f'{self.indent}using {to_name} = {from_full};\n\n'
+                self.write(f'{self.indent}using {to_name} = {from_full};\n\n')
 
             if to_b != '':
-                out += f'}} // namespace {to_b}\n\n'
-            out += self.switch_ns(last_ns)
-            return out
+                self.write(f'}} // namespace {to_b}\n\n')
+            self.switch_ns(last_ns)
         else:
-            out = ''
-
             if self.stdlib_traits.needs_allocator():
-                out += f'{self.indent}template <typename Allocator>\n'
-                out += f'{self.indent}using {to_name} = {from_full}<Allocator>;\n\n'
+                self.write(f'{self.indent}template <typename Allocator>\n')
+                self.write(f'{self.indent}using {to_name} = {from_full}<Allocator>;\n\n')
             else:
-                out += f'{self.indent}using {to_name} = {from_full};\n\n'
-
-            return out
+                self.write(f'{self.indent}using {to_name} = {from_full};\n\n')
 
     def check_needs_allocator(self, t):
         if t.identity is TypeIdentity.ARRAY and t.n_elements is not None:
@@ -202,6 +202,12 @@ class CodeGenerator:
                 or t.dynamic) and self.stdlib_traits.needs_allocator()
 
     def generate_type(self, t):
+        if t not in self.type_names:
+            self.type_names[t] = self.spell_type(t)
+
+        return self.type_names[t]
+
+    def spell_type(self, t):
         if t.identity is TypeIdentity.INTEGER:
             if t.name == 'char':
                 return 'char'
@@ -225,6 +231,14 @@ class CodeGenerator:
     def is_simple_integer(self, t):
         return t in ['char', 'int8_t', 'uint8_t', 'int16_t', 'uint16_t', 'int32_t', 'uint32_t', 'int64_t', 'uint64_t']
 
+    def is_byte_array(self, t):
+        '''
+        Strings and arrays of 1-byte integers are copied with a single write_bytes/read_bytes
+        '''
+        return (t.identity in {TypeIdentity.STRING, TypeIdentity.ARRAY}
+                and t.subtype.identity in {TypeIdentity.INTEGER, TypeIdentity.CONSTS}
+                and t.subtype.fixed_size == 1)
+
     def is_dyn_pointer(self, m):
         return type(m) is TagsBlock or m.type.dynamic
 
@@ -248,35 +262,6 @@ class CodeGenerator:
     def emit_assert_that(self, stmt):
         return f'{self.indent}{self.stdlib_traits.assert_func()}({stmt});\n'
 
-    def determine_pointer_size(self, what, size):
-        if what != 'head':
-            return 8
-
-        if size < 256:
-            return 1
-        elif size < 65536:
-            return 2
-        elif size < 4294967296:
-            return 4
-        elif size < 18446744073709551616:
-            return 8
-        else:
-            return None
-
-    def calculate_fixed_part_size(self, what, members, parent):
-        i = 8 if what == 'head' else 0
-
-        ptr_size = self.determine_pointer_size(what, parent.head.size if what == 'head' else None)
-
-        for m in members:
-            if not self.is_dyn_pointer(m):
-                assert m.type.fixed_size
-                i += m.type.fixed_size
-            else:
-                i += ptr_size
-
-        return i
-
     def emit_calculate_dynamic_size_of_member(self, into, member):
         if type(member) is TagsBlock:
             out = ''
@@ -299,7 +284,7 @@ class CodeGenerator:
             return f'{self.indent}{into} += bragi::detail::size_of_varint({expr});\n'
         elif expr_type.identity is TypeIdentity.ENUM:
             return f'{self.indent}{into} += bragi::detail::size_of_varint(static_cast<int32_t>({expr}));\n'
-        elif expr_type.identity is TypeIdentity.STRING:
+        elif self.is_byte_array(expr_type):
             out = f'{self.indent}{into} += bragi::detail::size_of_varint({expr}.size());\n'
             return out + f'{self.indent}{into} += {expr}.size();\n'
         elif expr_type.identity is TypeIdentity.ARRAY:
@@ -314,92 +299,122 @@ class CodeGenerator:
         else:
             raise RuntimeError('unexpected member type')
 
-    def emit_determine_dyn_off_for(self, skip, prev, n):
-        out = ''
-        into = f'dyn_offs[{n}]'
+    def caches_size_of(self, part):
+        '''
+        Whether messages memoize the size and dynamic offsets of part, which is only
+        done if they can change
+        '''
+        return self.cache_sizes and part is not None and len(part.dynamic_members) > 0
 
-        if n > 0:
-            out += f'{self.indent}{into} = dyn_offs[{n - 1}];\n'
-        else:
-            out += f'{self.indent}{into} = {skip};\n'
+    def emit_calculate_size_of(self, what, members, parent):
+        part = getattr(parent, what)
 
-        if not prev:
-            return out + '\n'
-        else:
-            return out + self.emit_calculate_dynamic_size_of_member(into, prev) + '\n'
+        if self.caches_size_of(part):
+            self.emit_cached_calculate_size_of(what, part)
+            return
 
-    def emit_calculate_size_of(self, what, members, parent):
-        out = f'{self.indent}size_t size_of_{what}() {{\n'
+        self.write(f'{self.indent}size_t size_of_{what}() {{\n')
         self.enter_indent()
 
-        out += f'{self.indent}size_t size = {self.calculate_fixed_part_size(what, members, parent)};\n'
+        self.write(f'{self.indent}size_t size = {getattr(parent, what).fixed_size};\n')
 
         for member in filter(self.is_dyn_pointer, members):
-            out += self.emit_calculate_dynamic_size_of_member('size', member)
+            self.write(self.emit_calculate_dynamic_size_of_member('size', member))
+
+        self.write(f'\n{self.indent}return size;\n')
+
+        self.leave_indent()
+        self.write(f'{self.indent}}}\n')
+
+        self.write('\n')
+
+    def emit_cached_calculate_size_of(self, what, part):
+        self.write(f'{self.indent}size_t size_of_{what}() {{\n')
+        self.enter_indent()
 
-        out += f'\n{self.indent}return size;\n'
+        self.write(f'{self.indent}if (!c_{what}_valid) {{\n')
+        self.enter_indent()
+
+        self.write(f'{self.indent}size_t size = {part.fixed_size};\n')
+        for i, member in enumerate(part.dynamic_members):
+            self.write(f'{self.indent}c_{what}_offs[{i}] = size;\n')
+            self.write(self.emit_calculate_dynamic_size_of_member('size', member))
+
+        self.write('\n')
+        self.write(f'{self.indent}c_{what}_size = size;\n')
+        self.write(f'{self.indent}c_{what}_valid = true;\n')
 
         self.leave_indent()
-        out += f'{self.indent}}}\n'
+        self.write(f'{self.indent}}}\n')
 
-        return out + '\n'
+        self.write(f'\n{self.indent}return c_{what}_size;\n')
+
+        self.leave_indent()
+        self.write(f'{self.indent}}}\n')
+
+        self.write('\n')
 
     def emit_struct_calculate_size_of(self, members, parent):
-        out = f'{self.indent}size_t size_of_body() {{\n'
+        self.write(f'{self.indent}size_t size_of_body() {{\n')
         self.enter_indent()
 
-        out += f'{self.indent}size_t size = 0;\n'
+        self.write(f'{self.indent}size_t size = 0;\n')
 
         for member in members:
-            out += self.emit_calculate_dynamic_size_of_member('size', member)
+            self.write(self.emit_calculate_dynamic_size_of_member('size', member))
 
-        out += f'\n{self.indent}return size;\n'
+        self.write(f'\n{self.indent}return size;\n')
 
         self.leave_indent()
-        out += f'{self.indent}}}\n'
+        self.write(f'{self.indent}}}\n')
 
-        return out + '\n'
+        self.write('\n')
 
     def emit_stub_calculate_size_of(self, what):
-        out = f'{self.indent}size_t size_of_{what}() {{\n'
+        self.write(f'{self.indent}size_t size_of_{what}() {{\n')
         self.enter_indent()
-        out += f'{self.indent}return {8 if what == "head" else 0};\n'
+        self.write(f'{self.indent}return {8 if what == "head" else 0};\n')
         self.leave_indent()
 
-        out += f'{self.indent}}}\n'
+        self.write(f'{self.indent}}}\n')
+
+        self.write('\n')
 
-        return out + '\n'
+    def element_offset(self, offset, array_type, array_depth):
+        '''
+        Returns the offset of element i<array_depth> of a fixed array at offset
+        '''
+        return f'{offset} + i{array_depth} * {array_type.subtype.fixed_size}'
 
-    def determine_pointer_type(self, what, size):
-        size = self.determine_pointer_size(what, size)
-        if not size:
+    def determine_pointer_type(self, part):
+        if not part.pointer_size:
             return None
 
-        return f'uint{size * 8}_t'
+        return f'uint{part.pointer_size * 8}_t'
 
     class FixedEncoder:
         def __init__(self, parent):
             self.parent = parent
-            self.nth_dynamic = 0
 
         def emit_encode_in_fixed(self, member, ptr_type):
-            is_tags = type(member) is TagsBlock
-            return self.emit_encode_in_fixed_internal(f'm_{member.name if not is_tags else "tags"}',
-                    member.type if not is_tags else None, is_tags, ptr_type, 0)
+            if self.parent.is_dyn_pointer(member):
+                return self.parent.emit_stmt_checked(f'sr.write_integer_at<{ptr_type}>(wr, {member.offset}, dyn_offs[{member.dyn_index}])')
 
-        def emit_encode_in_fixed_default(self, expr_type, array_depth):
+            return self.emit_encode_in_fixed_internal(f'm_{member.name}', member.type, 0, str(member.offset))
+
+        def emit_encode_in_fixed_default(self, expr_type, array_depth, offset):
             assert expr_type and not expr_type.dynamic
             if expr_type.identity in {TypeIdentity.INTEGER, TypeIdentity.CONSTS}:
-                return self.parent.emit_stmt_checked(f'sr.write_integer<{self.parent.generate_type(expr_type)}>(wr, 0)')
+                return self.parent.emit_stmt_checked(f'sr.write_integer_at<{self.parent.generate_type(expr_type)}>(wr, {offset}, 0)')
             elif expr_type.identity is TypeIdentity.ENUM:
-                return self.parent.emit_stmt_checked(f'sr.write_integer<int32_t>(wr, static_cast<int32_t>(0))')
+                return self.parent.emit_stmt_checked(f'sr.write_integer_at<int32_t>(wr, {offset}, static_cast<int32_t>(0))')
             elif expr_type.identity is TypeIdentity.ARRAY:
                 assert not expr_type.subtype.dynamic
                 assert expr_type.n_elements
 
                 out = f'{self.parent.indent}for (size_t i{array_depth} = 0; i{array_depth} < {expr_type.n_elements}; i{array_depth}++) {{\n'
                 self.parent.enter_indent()
-                out += self.emit_encode_in_fixed_default(expr_type.subtype, array_depth + 1)
+                out += self.emit_encode_in_fixed_default(expr_type.subtype, array_depth + 1, self.parent.element_offset(offset, expr_type, array_depth))
                 self.parent.leave_indent()
                 out += f'{self.parent.indent}}}\n'
 
@@ -407,15 +422,13 @@ class CodeGenerator:
             else:
                 assert member.type.identity not in {TypeIdentity.STRING, TypeIdentity.STRUCT}
 
-        def emit_encode_in_fixed_internal(self, expr, expr_type, is_tags, ptr_type, array_depth):
-            if is_tags or expr_type.dynamic:
-                out = self.parent.emit_stmt_checked(f'sr.write_integer<{ptr_type}>(wr, dyn_offs[{self.nth_dynamic}])')
-                self.nth_dynamic += 1
-                return out
-            elif expr_type.identity in {TypeIdentity.INTEGER, TypeIdentity.CONSTS}:
-                return self.parent.emit_stmt_checked(f'sr.write_integer<{self.parent.generate_type(expr_type)}>(wr, {expr})')
+        def emit_encode_in_fixed_internal(self, expr, expr_type, array_depth, offset):
+            if expr_type.identity in {TypeIdentity.INTEGER, TypeIdentity.CONSTS}:
+                return self.parent.emit_stmt_checked(f'sr.write_integer_at<{self.parent.generate_type(expr_type)}>(wr, {offset}, {expr})')
             elif expr_type.identity is TypeIdentity.ENUM:
-                return self.parent.emit_stmt_checked(f'sr.write_integer<int32_t>(wr, static_cast<int32_t>({expr}))')
+                return self.parent.emit_stmt_checked(f'sr.write_integer_at<int32_t>(wr, {offset}, static_cast<int32_t>({expr}))')
+            elif self.parent.is_byte_array(expr_type):
+                return self.parent.emit_stmt_checked(f'sr.write_bytes_at(wr, {offset}, {expr}.data(), {expr_type.n_elements})')
             elif expr_type.identity is TypeIdentity.ARRAY:
                 assert not expr_type.subtype.dynamic
                 assert expr_type.n_elements
@@ -424,11 +437,11 @@ class CodeGenerator:
                 self.parent.enter_indent()
                 out += f'{self.parent.indent}if (i{array_depth} < {expr}.size()) {{\n'
                 self.parent.enter_indent()
-                out += self.emit_encode_in_fixed_internal(f'{expr}[i{array_depth}]', expr_type.subtype, False, None, array_depth + 1)
+                out += self.emit_encode_in_fixed_internal(f'{expr}[i{array_depth}]', expr_type.subtype, array_depth + 1, self.parent.element_offset(offset, expr_type, array_depth))
                 self.parent.leave_indent()
                 out += f'{self.parent.indent}}} else {{\n'
                 self.parent.enter_indent()
-                out += self.emit_encode_in_fixed_default(expr_type.subtype, array_depth + 1)
+                out += self.emit_encode_in_fixed_default(expr_type.subtype, array_depth + 1, self.parent.element_offset(offset, expr_type, array_depth))
                 self.parent.leave_indent()
                 out += f'{self.parent.indent}}}\n'
                 self.parent.leave_indent()
@@ -464,6 +477,9 @@ class CodeGenerator:
                 return self.parent.emit_stmt_checked(f'sr.write_varint(wr, static_cast<{self.parent.generate_type(expr_type)}>({expr}))')
             elif expr_type.identity is TypeIdentity.ENUM:
                 return self.parent.emit_stmt_checked(f'sr.write_varint(wr, static_cast<int32_t>({expr}))')
+            elif self.parent.is_byte_array(expr_type):
+                out = self.parent.emit_stmt_checked(f'sr.write_varint(wr, {expr}.size())')
+                return out + self.parent.emit_stmt_checked(f'sr.write_bytes(wr, {expr}.data(), {expr}.size())')
             elif expr_type.identity in {TypeIdentity.ARRAY, TypeIdentity.STRING}:
                 out = self.parent.emit_stmt_checked(f'sr.write_varint(wr, {expr}.size())')
                 out += f'{self.parent.indent}for (size_t i{array_depth} = 0; i{array_depth} < {expr}.size(); i{array_depth}++) {{\n'
@@ -479,67 +495,155 @@ class CodeGenerator:
                 raise RuntimeError('unexpected variable type')
 
     def emit_part_encoder(self, what, parent, members):
-        out = f'{self.indent}template <typename Writer>\n'
-        out += f'{self.indent}bool encode_{what}(Writer &wr) {{\n'
+        self.write(f'{self.indent}template <typename Writer>\n')
+        self.write(f'{self.indent}bool encode_{what}(Writer &writer) {{\n')
         self.enter_indent()
 
-        out += f'{self.indent}(void)wr;\n'
-        out += f'{self.indent}bragi::serializer sr; (void)sr;\n'
+        part = getattr(parent, what) if parent else None
+        fixed_size = part.fixed_size if members else None
+        ptrs = part.dynamic_members if members else None
+        ptr_type = self.determine_pointer_type(part) if parent else None
 
-        fixed_size = self.calculate_fixed_part_size(what, members, parent) if members else None
-        ptrs = [i for i in members if self.is_dyn_pointer(i)] if members else None
-        ptr_type = self.determine_pointer_type(what, parent.head.size if what == 'head' else None) if parent else None
+        if self.caches_size_of(part):
+            # size_of_{what}() caches the dynamic offsets along with the size.
+            self.write(f'{self.indent}size_of_{what}();\n')
+            self.write(f'{self.indent}const {ptr_type} *dyn_offs = c_{what}_offs;\n\n')
+        elif members:
+            if ptrs:
+                self.write(f'{self.indent}{ptr_type} dyn_offs[{len(ptrs)}];\n')
+            self.write('\n')
 
-        if ptrs:
-            if len(ptrs) > 0:
-                out += f'{self.indent}{ptr_type} dyn_offs[{len(ptrs)}];\n'
+            # The size is summed up in a size_t, so that it stays correct even if
+            # the pointers overflow.
+            self.write(f'{self.indent}size_t size = {fixed_size};\n')
 
-        out += '\n'
-
-        if ptrs:
             for i, m in enumerate(ptrs):
-                out += self.emit_determine_dyn_off_for(fixed_size, ptrs[i - 1] if i > 0 else None, i)
+                self.write(f'{self.indent}dyn_offs[{i}] = size;\n')
+                self.write(self.emit_calculate_dynamic_size_of_member('size', m))
+
+            self.write('\n')
+        else:
+            self.write('\n')
+            self.write(f'{self.indent}size_t size = {8 if what == "head" else 0};\n\n')
+
+        if self.caches_size_of(part):
+            # The cached size is stale if a reference returned by a getter was used to
+            # change the message after it was computed, so every write is checked.
+            self.write(f'{self.indent}return [&] (auto &wr) {{\n')
+        else:
+            # Check the capacity once, the writes below are unchecked if the part fits.
+            self.write(f'{self.indent}return bragi::with_capacity(writer, size, [&] (auto &wr) {{\n')
+        self.enter_indent()
+
+        self.write(f'{self.indent}(void)wr;\n')
+        if members:
+            # Fixed members are written at their offsets, dynamic data follows them.
+            self.write(f'{self.indent}bragi::serializer sr{{{fixed_size}}}; (void)sr;\n')
+        else:
+            self.write(f'{self.indent}bragi::serializer sr; (void)sr;\n')
+        self.write('\n')
 
         if what == 'head':
-            out += f'{self.indent}// Encode ID\n'
-            out += self.emit_stmt_checked(f'sr.template write_integer<uint32_t>(wr, message_id)')
+            self.write(f'{self.indent}// Encode ID\n')
+            self.write(self.emit_stmt_checked(f'sr.template write_integer_at<uint32_t>(wr, 0, message_id)'))
 
-            out += f'{self.indent}// Encode tail size\n'
-            out += self.emit_stmt_checked(f'sr.template write_integer<uint32_t>(wr, size_of_tail())')
+            self.write(f'{self.indent}// Encode tail size\n')
+            self.write(self.emit_stmt_checked(f'sr.template write_integer_at<uint32_t>(wr, 4, size_of_tail())'))
 
         if members:
             fixed_enc = self.FixedEncoder(self)
             dyn_enc = self.DynamicEncoder(self)
             for m in members:
-                out += fixed_enc.emit_encode_in_fixed(m, ptr_type) + '\n'
+                self.write(fixed_enc.emit_encode_in_fixed(m, ptr_type) + '\n')
 
             for m in ptrs:
-                out += dyn_enc.emit_encode_in_dynamic(m)
+                self.write(dyn_enc.emit_encode_in_dynamic(m))
 
-        out += f'{self.indent}return true;\n'
+        self.write(f'{self.indent}return true;\n')
+        self.leave_indent()
+        if self.caches_size_of(part):
+            self.write(f'{self.indent}}}(writer);\n')
+        else:
+            self.write(f'{self.indent}}});\n')
+        self.leave_indent()
+        self.write(f'{self.indent}}}\n\n')
+
+    def emit_single_pass_part_encoder(self, what, parent, members):
+        '''
+        Emits an encoder that writes every member once, without computing any sizes first
+
+        The pointer to each dynamic member is filled in when that member is reached.
+        The head takes the size of the tail as an argument and the tail returns the
+        size it encoded, so write_head_tail() encodes the tail first and never has to
+        compute its size.
+        '''
+        part = getattr(parent, what) if parent else None
+        ptr_type = self.determine_pointer_type(part) if parent else None
+        size_arg = 'size_t tail_size' if what == 'head' else 'size_t &tail_size'
+
+        self.write(f'{self.indent}template <typename Writer>\n')
+        self.write(f'{self.indent}bool encode_{what}(Writer &wr) {{\n')
+        self.enter_indent()
+        if what == 'head':
+            self.write(f'{self.indent}return encode_head(wr, size_of_tail());\n')
+        else:
+            self.write(f'{self.indent}size_t tail_size;\n')
+            self.write(f'{self.indent}return encode_tail(wr, tail_size);\n')
         self.leave_indent()
-        out += f'{self.indent}}}\n\n'
+        self.write(f'{self.indent}}}\n\n')
 
-        return out
+        self.write(f'{self.indent}template <typename Writer>\n')
+        self.write(f'{self.indent}bool encode_{what}(Writer &wr, {size_arg}) {{\n')
+        self.enter_indent()
+
+        self.write(f'{self.indent}(void)wr;\n')
+        if members:
+            self.write(f'{self.indent}bragi::serializer sr{{{part.fixed_size}}}; (void)sr;\n')
+        else:
+            self.write(f'{self.indent}bragi::serializer sr; (void)sr;\n')
+        self.write('\n')
+
+        if what == 'head':
+            self.write(f'{self.indent}// Encode ID\n')
+            self.write(self.emit_stmt_checked(f'sr.template write_integer_at<uint32_t>(wr, 0, message_id)'))
+
+            self.write(f'{self.indent}// Encode tail size\n')
+            self.write(self.emit_stmt_checked(f'sr.template write_integer_at<uint32_t>(wr, 4, tail_size)'))
+
+        if members:
+            fixed_enc = self.FixedEncoder(self)
+            dyn_enc = self.DynamicEncoder(self)
+            for m in members:
+                if not self.is_dyn_pointer(m):
+                    self.write(fixed_enc.emit_encode_in_fixed(m, ptr_type) + '\n')
+
+            for m in part.dynamic_members:
+                self.write(self.emit_stmt_checked(f'sr.write_integer_at<{ptr_type}>(wr, {m.offset}, sr.index())'))
+                self.write(dyn_enc.emit_encode_in_dynamic(m) + '\n')
+
+        if what == 'tail':
+            self.write(f'{self.indent}tail_size = sr.index();\n')
+
+        self.write(f'{self.indent}return true;\n')
+        self.leave_indent()
+        self.write(f'{self.indent}}}\n\n')
 
     def emit_struct_encoder(self, parent, members):
-        out = f'{self.indent}template <typename Writer>\n'
-        out += f'{self.indent}bool encode_body(Writer &wr, bragi::serializer &sr) {{\n'
+        self.write(f'{self.indent}template <typename Writer>\n')
+        self.write(f'{self.indent}bool encode_body(Writer &wr, bragi::serializer &sr) {{\n')
         self.enter_indent()
 
-        out += f'{self.indent}(void)wr;\n'
-        out += f'{self.indent}(void)sr;\n'
-        out += '\n'
+        self.write(f'{self.indent}(void)wr;\n')
+        self.write(f'{self.indent}(void)sr;\n')
+        self.write('\n')
 
         dyn_enc = self.DynamicEncoder(self)
         for m in members:
-            out += dyn_enc.emit_encode_in_dynamic(m)
+            self.write(dyn_enc.emit_encode_in_dynamic(m))
 
-        out += f'{self.indent}return true;\n'
+        self.write(f'{self.indent}return true;\n')
         self.leave_indent()
-        out += f'{self.indent}}}\n\n'
-
-        return out
+        self.write(f'{self.indent}}}\n\n')
 
     class Decoder:
         def __init__(self, parent):
@@ -547,30 +651,32 @@ class CodeGenerator:
 
         def emit_decode_member(self, member, ptr_type):
             if type(member) is TagsBlock or member.type.dynamic:
-                out = self.parent.emit_stmt_checked(f'de.read_integer<{ptr_type}>(rd, ptr)')
+                out = self.parent.emit_stmt_checked(f'de.read_integer_at<{ptr_type}>(rd, {member.offset}, ptr)')
                 out += f'{self.parent.indent}de.push_index(ptr);\n'
                 out += self.emit_decode_dynamic(member)
                 out += f'{self.parent.indent}de.pop_index();\n'
                 return out
             else:
-                out = self.emit_decode_fixed_internal(f'm_{member.name}', member.type, 0)
+                out = self.emit_decode_fixed_internal(f'm_{member.name}', member.type, 0, str(member.offset))
                 out += f'{self.parent.indent}p_{member.name} = true;\n'
                 return out
 
-        def emit_decode_fixed_internal(self, expr, expr_type, array_depth):
+        def emit_decode_fixed_internal(self, expr, expr_type, array_depth, offset):
             assert not expr_type.dynamic
             if expr_type.identity in {TypeIdentity.INTEGER, TypeIdentity.CONSTS}:
-                out = self.parent.emit_stmt_checked(f'de.read_integer<{self.parent.generate_type(expr_type)}>(rd, {expr})')
+                out = self.parent.emit_stmt_checked(f'de.read_integer_at<{self.parent.generate_type(expr_type)}>(rd, {offset}, {expr})')
                 return out
             elif expr_type.identity is TypeIdentity.ENUM:
                 out = f'{self.parent.indent}{{\n'
                 self.parent.enter_indent()
                 out += f'{self.parent.indent}int32_t tmp;\n'
-                out += self.parent.emit_stmt_checked(f'de.read_integer<int32_t>(rd, tmp)')
+                out += self.parent.emit_stmt_checked(f'de.read_integer_at<int32_t>(rd, {offset}, tmp)')
                 out += f'{self.parent.indent}{expr} = static_cast<{self.parent.generate_type(expr_type)}>(tmp);\n'
                 self.parent.leave_indent()
                 out += f'{self.parent.indent}}}\n'
                 return out
+            elif self.parent.is_byte_array(expr_type):
+                return self.parent.emit_stmt_checked(f'de.read_bytes_at(rd, {offset}, {expr}.data(), {expr_type.n_elements})')
             elif expr_type.identity is TypeIdentity.ARRAY:
                 assert not expr_type.subtype.dynamic
                 assert expr_type.n_elements
@@ -579,7 +685,7 @@ class CodeGenerator:
 
                 out += f'{self.parent.indent}for (size_t i{array_depth} = 0; i{array_depth} < {expr_type.n_elements}; i{array_depth}++) {{\n'
                 self.parent.enter_indent()
-                out += self.emit_decode_fixed_internal(f'{expr}[i{array_depth}]', expr_type.subtype, array_depth + 1)
+                out += self.emit_decode_fixed_internal(f'{expr}[i{array_depth}]', expr_type.subtype, array_depth + 1, self.parent.element_offset(offset, expr_type, array_depth))
                 self.parent.leave_indent()
                 out += f'{self.parent.indent}}}\n'
 
@@ -657,6 +763,17 @@ class CodeGenerator:
                         out += f'{self.parent.indent}{expr}.resize({target_size}, allocator);\n'
                     else:
                         out += f'{self.parent.indent}{expr}.resize({target_size});\n'
+
+                if self.parent.is_byte_array(expr_type):
+                    # Elements past the end of a fixed-size array are not read, just like below.
+                    if target_size != 'size':
+                        out += self.parent.emit_stmt_checked(f'de.read_bytes(rd, {expr}.data(), size < {target_size} ? size : {target_size})')
+                    else:
+                        out += self.parent.emit_stmt_checked(f'de.read_bytes(rd, {expr}.data(), size)')
+
+                    self.parent.leave_indent()
+                    return out + f'{self.parent.indent}}}\n'
+
                 out += f'{self.parent.indent}for (size_t i{array_depth} = 0; i{array_depth} < {target_size}; i{array_depth}++)\n'
                 if target_size != 'size':
                     self.parent.enter_indent()
@@ -679,197 +796,218 @@ class CodeGenerator:
                 raise RuntimeError('unexpected variable type')
 
     def emit_part_decoder(self, what, parent, members):
-        out = f'{self.indent}template <typename Reader>\n'
-        out += f'{self.indent}bool decode_{what}(Reader &rd) {{\n'
+        self.write(f'{self.indent}template <typename Reader>\n')
+        self.write(f'{self.indent}bool decode_{what}(Reader &rd) {{\n')
         self.enter_indent()
 
-        out += f'{self.indent}(void)rd;\n'
-        out += f'{self.indent}bragi::deserializer de; (void)de;\n'
+        self.write(f'{self.indent}(void)rd;\n')
+        self.write(f'{self.indent}bragi::deserializer de; (void)de;\n')
+
+        if parent and self.caches_size_of(getattr(parent, what)):
+            self.write(f'{self.indent}c_{what}_valid = false;\n')
 
         if members:
-            ptr_type = self.determine_pointer_type(what, parent.head.size if what == 'head' else None)
-            out += f'{self.indent}{ptr_type} ptr; (void)ptr;\n'
+            ptr_type = self.determine_pointer_type(getattr(parent, what))
+            self.write(f'{self.indent}{ptr_type} ptr; (void)ptr;\n')
 
         if what == 'head':
-            out += f'{self.indent}{{\n'
+            self.write(f'{self.indent}{{\n')
             self.enter_indent()
-            out += f'{self.indent}uint32_t tmp;\n'
-            out += f'{self.indent}// Decode and check ID\n'
-            out += self.emit_stmt_checked(f'de.read_integer<uint32_t>(rd, tmp)')
-            out += self.emit_stmt_checked('(tmp == message_id)')
-            out += '\n'
-
-            out += f'{self.indent}// Decode and ignore tail size\n'
-            out += self.emit_stmt_checked(f'de.read_integer<uint32_t>(rd, tmp)')
+            self.write(f'{self.indent}uint32_t tmp;\n')
+            self.write(f'{self.indent}// Decode and check ID\n')
+            self.write(self.emit_stmt_checked(f'de.read_integer_at<uint32_t>(rd, 0, tmp)'))
+            self.write(self.emit_stmt_checked('(tmp == message_id)'))
+            self.write('\n')
+
+            self.write(f'{self.indent}// Decode and ignore tail size\n')
+            self.write(self.emit_stmt_checked(f'de.read_integer_at<uint32_t>(rd, 4, tmp)'))
             self.leave_indent()
-            out += f'{self.indent}}}\n'
-            out += '\n'
+            self.write(f'{self.indent}}}\n')
+            self.write('\n')
 
         dec = self.Decoder(self)
 
         if members:
-            ptr_type = self.determine_pointer_type(what, parent.head.size if what == 'head' else None)
+            ptr_type = self.determine_pointer_type(getattr(parent, what))
 
             for m in members:
-                out += dec.emit_decode_member(m, ptr_type)
-                out += '\n'
+                self.write(dec.emit_decode_member(m, ptr_type))
+                self.write('\n')
 
-        out += f'{self.indent}return true;\n'
+        self.write(f'{self.indent}return true;\n')
         self.leave_indent()
-        out += f'{self.indent}}}\n\n'
-
-        return out
+        self.write(f'{self.indent}}}\n\n')
 
     def emit_struct_decoder(self, parent, members):
-        out = f'{self.indent}template <typename Reader>\n'
-        out += f'{self.indent}bool decode_body(Reader &rd, bragi::deserializer &de) {{\n'
+        self.write(f'{self.indent}template <typename Reader>\n')
+        self.write(f'{self.indent}bool decode_body(Reader &rd, bragi::deserializer &de) {{\n')
         self.enter_indent()
 
-        out += f'{self.indent}(void)rd;\n'
-        out += f'{self.indent}(void)de;'
-        out += '\n'
+        self.write(f'{self.indent}(void)rd;\n')
+        self.write(f'{self.indent}(void)de;')
+        self.write('\n')
 
         dec = self.Decoder(self)
 
         for m in members:
-            out += dec.emit_decode_dynamic(m)
-            out += '\n'
+            self.write(dec.emit_decode_dynamic(m))
+            self.write('\n')
 
-        out += f'{self.indent}return true;\n'
+        self.write(f'{self.indent}return true;\n')
         self.leave_indent()
-        out += f'{self.indent}}}\n\n'
-
-        return out
+        self.write(f'{self.indent}}}\n\n')
 
     # Protobuf compatibilty code
     def emit_serialize_as_string(self):
-        out = ''
-
         if type(self.stdlib_traits) is FriggTraits:
-            out = f'{self.indent}void SerializeToString(frg::string<Allocator> *str) {{\n'
+            self.write(f'{self.indent}void SerializeToString(frg::string<Allocator> *str) {{\n')
             self.enter_indent()
 
-            out += f'{self.indent}str->resize(size_of_head());\n'
-            out += f'{self.indent}bragi::limited_writer wr{{str->data(), str->size()}};\n\n'
-            out += self.emit_assert_that('encode_head(wr)')
+            self.write(f'{self.indent}str->resize(size_of_head());\n')
+            self.write(f'{self.indent}bragi::limited_writer wr{{str->data(), str->size()}};\n\n')
+            self.write(self.emit_assert_that('encode_head(wr)'))
 
             self.leave_indent()
-            out += f'{self.indent}}}\n\n'
+            self.write(f'{self.indent}}}\n\n')
         else:
-            out = f'{self.indent}std::string SerializeAsString() {{\n'
+            self.write(f'{self.indent}std::string SerializeAsString() {{\n')
             self.enter_indent()
 
-            out += f'{self.indent}std::string str(size_of_head(), \'\\0\');\n'
-            out += f'{self.indent}bragi::limited_writer wr{{str.data(), str.size()}};\n\n'
-            out += self.emit_assert_that('encode_head(wr)') + '\n'
-            out += f'{self.indent}return str;\n'
+            self.write(f'{self.indent}std::string str(size_of_head(), \'\\0\');\n')
+            self.write(f'{self.indent}bragi::limited_writer wr{{str.data(), str.size()}};\n\n')
+            self.write(self.emit_assert_that('encode_head(wr)') + '\n')
+            self.write(f'{self.indent}return str;\n')
             self.leave_indent()
 
-            out += f'{self.indent}}}\n\n'
-
-        return out
+            self.write(f'{self.indent}}}\n\n')
 
     # Protobuf compatibilty code
     def emit_parse_from_array(self, parent):
-        out = f'{self.indent}bool ParseFromArray(const void *data, size_t size) {{\n'
+        self.write(f'{self.indent}bool ParseFromArray(const void *data, size_t size) {{\n')
         self.enter_indent()
 
-        out += f'{self.indent}bragi::limited_reader rd{{data, size}};\n\n'
-        out += f'{self.indent}return decode_head(rd);\n'
+        self.write(f'{self.indent}bragi::limited_reader rd{{data, size}};\n\n')
+        self.write(f'{self.indent}return decode_head(rd);\n')
 
         self.leave_indent()
 
-        out += f'{self.indent}}}\n\n'
+        self.write(f'{self.indent}}}\n\n')
 
-        return out
+    def emit_const_getter(self, signature, value):
+        self.write(f'{self.indent}{signature} const {{\n')
+        self.enter_indent()
+        self.write(f'{self.indent}return {value};\n')
+        self.leave_indent()
+        self.write(f'{self.indent}}}\n\n')
 
-    def emit_accessors(self, members):
-        out = ''
+    def emit_accessors(self, members, cached_parts = {}):
+        '''
+        Emits getters and setters for members
 
+        cached_parts maps the names of members whose size is part of a cached part
+        size to that part, their setters and the getters that return a mutable
+        reference invalidate the cache. The const getters of such members do not.
+        '''
         for m in members:
+            cached_part = cached_parts.get(m.name)
+            invalidate = lambda: f'{self.indent}c_{cached_part}_valid = false;\n' if cached_part else ''
+
             # getters
             ref = '&' if m.type.identity not in {TypeIdentity.INTEGER, TypeIdentity.CONSTS, TypeIdentity.ENUM} else ''
 
-            out += f'{self.indent}{self.generate_type(m.type)} {ref}{m.name}() {{\n'
+            self.write(f'{self.indent}{self.generate_type(m.type)} {ref}{m.name}() {{\n')
             self.enter_indent()
-            out += f'{self.indent}return m_{m.name};\n'
+            if ref:
+                self.write(invalidate())
+            self.write(f'{self.indent}return m_{m.name};\n')
             self.leave_indent()
-            out += f'{self.indent}}}\n\n'
+            self.write(f'{self.indent}}}\n\n')
+
+            if ref:
+                self.emit_const_getter(f'const {self.generate_type(m.type)} &{m.name}()', f'm_{m.name}')
 
             if m.type.identity is TypeIdentity.ARRAY:
                 ref = '&' if m.type.subtype.identity not in {TypeIdentity.INTEGER, TypeIdentity.CONSTS, TypeIdentity.ENUM} else ''
 
-                out += f'{self.indent}{self.generate_type(m.type.subtype)} {ref}{m.name}(size_t i) {{\n'
+                self.write(f'{self.indent}{self.generate_type(m.type.subtype)} {ref}{m.name}(size_t i) {{\n')
                 self.enter_indent()
-                out += f'{self.indent}return m_{m.name}[i];\n'
+                if ref:
+                    self.write(invalidate())
+                self.write(f'{self.indent}return m_{m.name}[i];\n')
                 self.leave_indent()
-                out += f'{self.indent}}}\n\n'
+                self.write(f'{self.indent}}}\n\n')
 
-                out += f'{self.indent}size_t {m.name}_size() {{\n'
+                if ref:
+                    self.emit_const_getter(f'const {self.generate_type(m.type.subtype)} &{m.name}(size_t i)', f'm_{m.name}[i]')
+
+                self.write(f'{self.indent}size_t {m.name}_size() {{\n')
                 self.enter_indent()
-                out += f'{self.indent}return m_{m.name}.size();\n'
+                self.write(f'{self.indent}return m_{m.name}.size();\n')
                 self.leave_indent()
-                out += f'{self.indent}}}\n\n'
+                self.write(f'{self.indent}}}\n\n')
 
             # setters
-            out += f'{self.indent}void set_{m.name}({self.generate_type(m.type)} val) {{\n'
+            self.write(f'{self.indent}void set_{m.name}({self.generate_type(m.type)} val) {{\n')
             self.enter_indent()
-            out += f'{self.indent}p_{m.name} = true;\n'
-            out += f'{self.indent}m_{m.name} = val;\n'
+            self.write(invalidate())
+            self.write(f'{self.indent}p_{m.name} = true;\n')
+            self.write(f'{self.indent}m_{m.name} = val;\n')
             self.leave_indent()
-            out += f'{self.indent}}}\n\n'
+            self.write(f'{self.indent}}}\n\n')
 
             if m.type.identity is TypeIdentity.ARRAY:
-                out += f'{self.indent}void set_{m.name}(size_t i, {self.generate_type(m.type.subtype)} val) {{\n'
+                self.write(f'{self.indent}void set_{m.name}(size_t i, {self.generate_type(m.type.subtype)} val) {{\n')
                 self.enter_indent()
-                out += f'{self.indent}p_{m.name} = true;\n'
-                out += f'{self.indent}m_{m.name}[i] = val;\n'
+                self.write(invalidate())
+                self.write(f'{self.indent}p_{m.name} = true;\n')
+                self.write(f'{self.indent}m_{m.name}[i] = val;\n')
                 self.leave_indent()
-                out += f'{self.indent}}}\n\n'
+                self.write(f'{self.indent}}}\n\n')
 
                 if m.type.n_elements is None:
-                    out += f'{self.indent}void add_{m.name}({self.generate_type(m.type.subtype)} v) {{\n'
+                    self.write(f'{self.indent}void add_{m.name}({self.generate_type(m.type.subtype)} v) {{\n')
                     self.enter_indent()
-                    out += f'{self.indent}p_{m.name} = true;\n'
-                    out += f'{self.indent}m_{m.name}.push_back(v);\n'
+                    self.write(invalidate())
+                    self.write(f'{self.indent}p_{m.name} = true;\n')
+                    self.write(f'{self.indent}m_{m.name}.push_back(v);\n')
                     self.leave_indent()
-                    out += f'{self.indent}}}\n\n'
-
-        return out
+                    self.write(f'{self.indent}}}\n\n')
 
     def emit_constructor(self, name, members):
-        out = f'{self.indent}{name}({self.stdlib_traits.allocator_argument()})'
+        self.write(f'{self.indent}{name}({self.stdlib_traits.allocator_argument()})')
 
         if len(members) > 0 or self.stdlib_traits.needs_allocator():
-            out += f'\n{self.indent}: '
+            self.write(f'\n{self.indent}: ')
             for i, m in enumerate(members):
                 alloc = self.stdlib_traits.allocator_parameter() if self.check_needs_allocator(m.type) else ''
-                out += f'm_{m.name}{{{alloc}}}, p_{m.name}{{false}}'
+                self.write(f'm_{m.name}{{{alloc}}}, p_{m.name}{{false}}')
 
                 if i < len(members) - 1 or self.stdlib_traits.needs_allocator():
-                    out += f', \n{self.indent}  '
+                    self.write(f', \n{self.indent}  ')
 
         if self.stdlib_traits.needs_allocator():
-            out += f'allocator{{{self.stdlib_traits.allocator_parameter()}}}'
-
-        out += ' { }\n\n'
-
-        return out
+            self.write(f'allocator{{{self.stdlib_traits.allocator_parameter()}}}')
 
-    def emit_class_members(self, members):
-        out = ''
+        self.write(' { }\n\n')
 
+    def emit_class_members(self, members, parent = None):
         if len(members):
             self.leave_indent()
-            out += f'{self.indent}private:\n'
+            self.write(f'{self.indent}private:\n')
             self.enter_indent()
             for m in members:
-                out += f'{self.indent}{self.generate_type(m.type)} m_{m.name}; bool p_{m.name};\n'
+                self.write(f'{self.indent}{self.generate_type(m.type)} m_{m.name}; bool p_{m.name};\n')
 
-        if self.stdlib_traits.needs_allocator():
-            out += f'{self.indent}Allocator allocator;\n'
+        for what in ['head', 'tail']:
+            part = getattr(parent, what) if parent else None
 
-        return out
+            if self.caches_size_of(part):
+                ptr_type = self.determine_pointer_type(part)
+                self.write(f'{self.indent}bool c_{what}_valid = false; size_t c_{what}_size = 0; '
+                        f'{ptr_type} c_{what}_offs[{len(part.dynamic_members)}] = {{}};\n')
+
+        if self.stdlib_traits.needs_allocator():
+            self.write(f'{self.indent}Allocator allocator;\n')
 
     def generate_message(self, message):
         all_members = flatten([
@@ -877,66 +1015,77 @@ class CodeGenerator:
             flatten((m.members if type(m) is TagsBlock else [m] for m in message.tail.members) if message.tail is not None else [])
         ])
 
-        out = ''
         if self.stdlib_traits.needs_allocator():
-            out += f'{self.indent}template <typename Allocator>\n'
+            self.write(f'{self.indent}template <typename Allocator>\n')
 
-        out += f'{self.indent}struct {message.name} {{\n'
+        self.write(f'{self.indent}struct {message.name} {{\n')
         self.enter_indent()
-        out += f'{self.indent}static constexpr uint32_t message_id = {message.id};\n'
-        out += f'{self.indent}static constexpr size_t head_size = {message.head.size};\n\n'
+        self.write(f'{self.indent}static constexpr uint32_t message_id = {message.id};\n')
+        self.write(f'{self.indent}static constexpr size_t head_size = {message.head.size};\n')
+        if self.encoder == 'single-pass':
+            self.write(f'{self.indent}static constexpr bool single_pass_encoding = true;\n')
+        self.write('\n')
+
+        # Members that change the size of a part have to invalidate its cached size.
+        cached_parts = {}
+        for what in ['head', 'tail']:
+            part = getattr(message, what)
+
+            if self.caches_size_of(part):
+                for m in part.dynamic_members:
+                    for child in (m.members if type(m) is TagsBlock else [m]):
+                        cached_parts[child.name] = what
 
-        out += self.emit_constructor(message.name, all_members)
-        out += self.emit_accessors(all_members)
+        self.emit_constructor(message.name, all_members)
+        self.emit_accessors(all_members, cached_parts)
 
         if message.head:
-            out += self.emit_calculate_size_of('head', message.head.members, message)
-            out += self.emit_part_encoder('head', message, message.head.members)
-            out += self.emit_part_decoder('head', message, message.head.members)
+            self.emit_calculate_size_of('head', message.head.members, message)
+            self.emit_encoder('head', message, message.head.members)
+            self.emit_part_decoder('head', message, message.head.members)
         else:
-            out += self.emit_stub_calculate_size_of('head')
-            out += self.emit_part_encoder('head', None, None)
-            out += self.emit_part_decoder('head', None, None)
+            self.emit_stub_calculate_size_of('head')
+            self.emit_encoder('head', None, None)
+            self.emit_part_decoder('head', None, None)
         if message.tail:
-            out += self.emit_calculate_size_of('tail', message.tail.members, message)
-            out += self.emit_part_encoder('tail', message, message.tail.members)
-            out += self.emit_part_decoder('tail', message, message.tail.members)
+            self.emit_calculate_size_of('tail', message.tail.members, message)
+            self.emit_encoder('tail', message, message.tail.members)
+            self.emit_part_decoder('tail', message, message.tail.members)
         else:
-            out += self.emit_stub_calculate_size_of('tail')
-            out += self.emit_part_encoder('tail', None, None)
-            out += self.emit_part_decoder('tail', None, None)
+            self.emit_stub_calculate_size_of('tail')
+            self.emit_encoder('tail', None, None)
+            self.emit_part_decoder('tail', None, None)
 
         if self.protobuf_compat:
-            out += self.emit_serialize_as_string()
-            out += self.emit_parse_from_array(message)
+            self.emit_serialize_as_string()
+            self.emit_parse_from_array(message)
 
-        out += self.emit_class_members(all_members)
+        self.emit_class_members(all_members, message)
 
         self.leave_indent()
 
-        return out + f'{self.indent}}}; // struct {message.name}\n\n'
+        self.write(f'{self.indent}}}; // struct {message.name}\n\n')
 
     def generate_struct(self, struct):
         all_members = flatten([
             flatten((m.members if type(m) is TagsBlock else [m] for m in struct.members))
         ])
 
-        out = ''
         if self.stdlib_traits.needs_allocator():
-            out += f'{self.indent}template <typename Allocator>\n'
+            self.write(f'{self.indent}template <typename Allocator>\n')
 
-        out += f'{self.indent}struct {struct.name} {{\n'
+        self.write(f'{self.indent}struct {struct.name} {{\n')
         self.enter_indent()
 
-        out += self.emit_constructor(struct.name, all_members)
-        out += self.emit_accessors(all_members)
+        self.emit_constructor(struct.name, all_members)
+        self.emit_accessors(all_members)
 
-        out += self.emit_struct_calculate_size_of(struct.members, struct)
-        out += self.emit_struct_encoder(struct, struct.members)
-        out += self.emit_struct_decoder(struct, struct.members)
+        self.emit_struct_calculate_size_of(struct.members, struct)
+        self.emit_struct_encoder(struct, struct.members)
+        self.emit_struct_decoder(struct, struct.members)
 
-        out += self.emit_class_members(all_members)
+        self.emit_class_members(all_members)
 
         self.leave_indent()
 
-        return out + f'{self.indent}}}; // struct {struct.name}\n\n'
+        self.write(f'{self.indent}}}; // struct {struct.name}\n\n')
@@ -0,0 +1,52 @@
+class Diagnostic:
+    '''
+    Error or warning reported for a location in a bragi source file
+    '''
+    __slots__ = ('filename', 'line', 'column', 'severity', 'message', 'note', 'source_line')
+
+    def __init__(self, filename, line, column, severity, message, note = '', source_line = ''):
+        self.filename = filename
+        self.line = line
+        self.column = column
+        self.severity = severity
+        self.message = message
+        self.note = note
+        self.source_line = source_line
+
+    def format(self):
+        '''
+        Returns the diagnostic as printed by the bragi command, pointing at its column
+        '''
+        n_tabs = self.source_line.count('\t')
+        line = self.source_line.replace('\t', '        ')
+        line_number = str(self.line)
+
+        n_spaces = len(line_number) + ((self.column + n_tabs * 7) - 1) + 5
+        spaces = n_spaces * ' '
+
+        out = [
+            f'{self.filename}:{self.line}:{self.column}: {self.severity}: {self.message}',
+            f'  {line_number} | {line}',
+            f'{spaces}^',
+        ]
+
+        if len(self.note) > 0:
+            out.append(f'{spaces}{self.note}')
+
+        return '\n'.join(out)
+
+    def to_dict(self):
+        return {s: getattr(self, s) for s in self.__slots__}
+
+    def __repr__(self):
+        return f'{self.filename}:{self.line}:{self.column}: {self.severity}: {self.message}'
+
+class CompilationError(Exception):
+    '''
+    Raised when a bragi source file contains an error
+
+    diagnostics holds everything that was reported for the unit, the error last.
+    '''
+    def __init__(self, diagnostics):
+        super().__init__(repr(diagnostics[-1]))
+        self.diagnostics = diagnostics
@@ -0,0 +1,56 @@
+class Emitter:
+    '''
+    Base class of the code generators
+
+    Keeps track of the current indentation and collects the generated code. Code is
+    either written to a stream as it is produced or collected in a list of chunks
+    that is joined once at the end, so generation time stays linear in the size of
+    the output.
+    '''
+    indent_unit = '\t'
+
+    def __init__(self):
+        self.indent_depth = 0
+        self.indent = ''
+        self.stream = None
+        self.chunks = []
+
+    def enter_indent(self):
+        self.indent_depth += 1
+        self.indent = self.indent_unit * self.indent_depth
+        return self.indent
+
+    def leave_indent(self):
+        if self.indent_depth == 0:
+            raise RuntimeError('Indent level cannot be negative')
+
+        self.indent_depth -= 1
+        self.indent = self.indent_unit * self.indent_depth
+        return self.indent
+
+    def begin_output(self, stream = None):
+        '''
+        Starts a new output, written to stream if given
+        '''
+        self.stream = stream
+        self.chunks = []
+
+    def write(self, text):
+        if self.stream is not None:
+            self.stream.write(text)
+        else:
+            self.chunks.append(text)
+
+    def end_output(self):
+        '''
+        Finishes the current output and returns it, or None if it was written to a stream
+        '''
+        stream = self.stream
+        chunks = self.chunks
+        self.stream = None
+        self.chunks = []
+
+        if stream is not None:
+            return None
+
+        return ''.join(chunks)
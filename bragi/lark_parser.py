@@ -0,0 +1,261 @@
+'''
+Lark grammar of the bragi language and its transformation into tokens
+'''
+
+import hashlib
+import os
+import sys
+
+import lark
+from lark.lark import Lark
+from lark.visitors import Transformer, v_args
+from lark.exceptions import UnexpectedToken, UnexpectedCharacters, UnexpectedEOF
+
+from bragi.tokens import *
+from bragi.cache import cache_dir
+from bragi.parser import expected_to_human_readable
+from bragi.timings import phase
+
+grammar = r'''
+start: (message | enum | consts | ns | struct | using | group)+
+
+tag: "tag" "(" INT ")"
+format: "@format" "(" NAME ")"
+attributes: tag? format?
+enum_attributes: format?
+
+message: "message" NAME INT message_block
+enum: enum_attributes "enum" NAME enum_block
+consts: enum_attributes "consts" NAME type_name enum_block
+ns: "namespace" ESCAPED_STRING ";"
+struct: "struct" NAME "{" message_member* "}"
+using: "using" ESCAPED_STRING "=" ESCAPED_STRING ";"
+group: "group" "{" message* "}"
+
+head_section: "head" "(" INT ")" ":" message_member*
+tail_section: "tail" ":" message_member*
+
+enum_block: "{" (enum_member ",")* enum_member "}"
+message_block: "{" (head_section | tail_section)+ "}"
+
+enum_member: NAME ["=" INT]
+message_member: attributes type_name NAME ";" -> message_member
+                | "tags" "{" message_member+ "}" -> tags_block
+
+type_name: NAME type_size*
+NAME: CNAME
+
+type_size: "[" INT "]"
+         | "[" "]"
+
+%import common.INT
+%import common.CNAME
+%import common.ESCAPED_STRING
+%import common.NEWLINE
+
+%import common.WS
+%ignore WS
+
+COMMENT: "//" /(.)+/ NEWLINE
+       | "/*" /(.|\n)+/ "*/"
+
+%ignore COMMENT
+'''
+
+# Parser shared by all compilation units of this process, see get_parser().
+shared_parser = None
+
+def parser_cache_path():
+    directory = cache_dir()
+    if not directory:
+        return None
+
+    key = hashlib.sha256(f'{grammar}{lark.__version__}{sys.version_info[:2]}'.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, f'parser-{key}.lark')
+
+def get_parser():
+    '''
+    Returns the Lark parser for the bragi grammar
+
+    The parser is built once per process. Its LALR tables are serialized to the cache
+    directory so that subsequent runs load them instead of rebuilding them.
+    '''
+    global shared_parser
+
+    if shared_parser is not None:
+        return shared_parser
+
+    path = parser_cache_path()
+
+    if path is None or os.path.exists(path):
+        shared_parser = Lark(grammar, propagate_positions = True, parser = 'lalr', cache = path or False)
+        return shared_parser
+
+    import tempfile
+
+    # Let Lark write the tables to a private file first and move it into place
+    # afterwards, so that concurrent bragi processes never see a partial cache.
+    tmp = None
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(path), prefix = '.parser-')
+        os.close(fd)
+
+        shared_parser = Lark(grammar, propagate_positions = True, parser = 'lalr', cache = tmp)
+        os.replace(tmp, path)
+    except OSError:
+        if tmp is not None and os.path.exists(tmp):
+            os.unlink(tmp)
+
+        if shared_parser is None:
+            shared_parser = Lark(grammar, propagate_positions = True, parser = 'lalr')
+
+    return shared_parser
+
+flatten = lambda l: [item for sublist in l for item in sublist]
+
+class IdlTransformer(Transformer):
+    def start(self, items):
+        return items
+
+    @v_args(meta = True)
+    def message(self, meta, items):
+        return Message(meta.line, meta.column, items[0], items[1], flatten(items[2:]))
+
+    @v_args(meta = True)
+    def struct(self, meta, items):
+        return Struct(meta.line, meta.column, items[0], flatten([items[1:]]) if len(items) > 1 else [])
+
+    def message_block(self, items):
+        return items
+
+    @v_args(meta = True)
+    def head_section(self, meta, items):
+        return HeadSection(meta.line, meta.column, int(items[0]), items[1:])
+
+    @v_args(meta = True)
+    def tail_section(self, meta, items):
+        return TailSection(meta.line, meta.column, items)
+
+    @v_args(meta = True)
+    def message_member(self, meta, items):
+        return MessageMember(meta.line, meta.column, items[0], items[1], items[2])
+
+    @v_args(meta = True)
+    def tags_block(self, meta, items):
+        return TagsBlock(meta.line, meta.column, items)
+
+    def attributes(self, items):
+        ret = {}
+
+        for i in items:
+            if type(i) == Tag:
+                ret['tag'] = i
+            elif type(i) == Format:
+                ret['format'] = i
+
+        return ret
+
+    @v_args(meta = True)
+    def tag(self, meta, items):
+        return Tag(meta.line, meta.column, items[-1])
+
+    @v_args(meta = True)
+    def format(self, meta, items):
+        return Format(meta.line, meta.column, items[0])
+
+    @v_args(meta = True)
+    def enum(self, meta, items):
+        return Enum(meta.line, meta.column, items[1], 'enum', TypeName(0, 0, 'int32'), items[0], flatten(items[2:]))
+
+    @v_args(meta = True)
+    def consts(self, meta, items):
+        return Enum(meta.line, meta.column, items[1], 'consts', items[2], items[0], flatten(items[3:]))
+
+    def enum_attributes(self, items):
+        ret = {}
+
+        for i in items:
+            if type(i) == Format:
+                ret['format'] = i
+
+        return ret
+
+    @v_args(meta = True)
+    def using(self, meta, items):
+        return UsingTag(meta.line, meta.column, items[1][1:-1], items[0][1:-1])
+
+    @v_args(meta = True)
+    def ns(self, meta, items):
+        return NamespaceTag(meta.line, meta.column, items[0][1:-1])
+
+    @v_args(meta = True)
+    def enum_member(self, meta, items):
+        return EnumMember(meta.line, meta.column, items[0], int(items[1]) if items[1] else None)
+
+    def enum_block(self, items):
+        return items
+
+    # Names and type names repeat throughout a schema, so all occurrences share one string.
+    def NAME(self, items):
+        return sys.intern(str(items))
+
+    def INT(self, items):
+        return str(items)
+
+    def ESCAPED_STRING(self, items):
+        return str(items)
+
+    @v_args(meta = True)
+    def type_name(self, meta, items):
+        return TypeName(meta.line , meta.column, sys.intern(''.join(items)))
+
+    @v_args(meta = True)
+    def type_size(self, meta, items):
+        return '[' + ''.join(items) + ']'
+
+    @v_args(meta = True)
+    def group(self, meta, items):
+        return Group(meta.line, meta.column, items)
+
+def terminal_names(parser, names):
+    '''
+    Returns the terminal names with anonymous ones replaced by their quoted text, e.g. '"@format"'
+    '''
+    return [f'"{parser.get_terminal(name).pattern.value}"' if name.startswith('__ANON') else name
+            for name in names]
+
+def parse(unit):
+    '''
+    Parses the source of unit and returns its top-level tokens
+    '''
+    with phase('parser-setup'):
+        parser = get_parser()
+
+    parsed = None
+
+    try:
+        with phase('parse', unit.filename):
+            parsed = parser.parse(unit.source)
+    except UnexpectedToken as e:
+        # LALR parsers report a premature end of the input as an unexpected token.
+        if e.token.type == '$END':
+            unit.report_message(unit.eof, 'error',
+                    f'unexpected end of file',
+                    f'was expecting {expected_to_human_readable(terminal_names(parser, e.expected))} here')
+
+        unit.report_message(e, 'error',
+                f'unexpected token \'{e.token}\'',
+                f'was expecting {expected_to_human_readable(terminal_names(parser, e.expected))} here')
+    except UnexpectedCharacters as e:
+        unit.report_message(e, 'error',
+                f'unexpected character \'{unit.get_line(e.line)[e.column - 1]}\'',
+                f'was expecting {expected_to_human_readable(terminal_names(parser, e.allowed))} here')
+    except UnexpectedEOF as e:
+        unit.report_message(unit.eof, 'error',
+                f'unexpected end of file',
+                f'was expecting {expected_to_human_readable(terminal_names(parser, e.expected))} here')
+
+    with phase('transform', unit.filename):
+        return IdlTransformer().transform(parsed)
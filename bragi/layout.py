@@ -0,0 +1,62 @@
+from .tokens import *
+
+def determine_pointer_size(part):
+    '''
+    Returns the width in bytes of the offsets that point from part into its dynamic data
+    '''
+    if type(part) is not HeadSection:
+        return 8
+
+    if part.size < 256:
+        return 1
+    elif part.size < 65536:
+        return 2
+    elif part.size < 4294967296:
+        return 4
+    elif part.size < 18446744073709551616:
+        return 8
+
+    return None
+
+def is_dyn_pointer(m):
+    return type(m) is TagsBlock or m.type.dynamic
+
+def layout_part(part):
+    '''
+    Assigns the fixed offset, pointer width and dynamic slot index of every member of part
+    '''
+    part.pointer_size = determine_pointer_size(part)
+    part.dynamic_members = []
+
+    # The head starts with the message ID and the size of the tail.
+    offset = 8 if type(part) is HeadSection else 0
+
+    for m in part.members:
+        m.offset = offset
+
+        if is_dyn_pointer(m):
+            m.pointer_size = part.pointer_size
+            m.dyn_index = len(part.dynamic_members)
+            part.dynamic_members.append(m)
+            offset += part.pointer_size
+        else:
+            offset += m.type.fixed_size
+
+    part.fixed_size = offset
+
+def layout_message(message):
+    if message.head is not None:
+        layout_part(message.head)
+    if message.tail is not None:
+        layout_part(message.tail)
+
+def layout_unit(tokens):
+    '''
+    Computes the wire layout of all messages in tokens, which must have been verified
+    '''
+    for t in tokens:
+        if type(t) is Message:
+            layout_message(t)
+        elif type(t) is Group:
+            for m in t.members:
+                layout_message(m)
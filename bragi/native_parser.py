@@ -0,0 +1,368 @@
+'''
+Hand-written parser for the bragi language
+
+An alternative to the Lark grammar in bragi.lark_parser: the source is split into
+tokens by a single regular expression and parsed by recursive descent, without
+building a parse tree first. It produces the same tokens with the same line and
+column information. Unlike the Lark lexer, it never splits a keyword off the start
+of a longer name, e.g. 'messageFoo' is always a single name.
+'''
+
+import re
+import sys
+
+from bragi.tokens import *
+from bragi.parser import expected_to_human_readable
+from bragi.timings import phase
+
+# Whitespace, comments, names, integers, strings, punctuation and anything else, in
+# this order. The comment and string patterns are the ones of the Lark grammar.
+TOKEN_RE = re.compile(r'''
+    ([ \t\f\r\n]+)
+  | (/\*(?:.|\n)+\*/|//.+(?:\r?\n)+)
+  | ([A-Za-z_][A-Za-z0-9_]*)
+  | ([0-9]+)
+  | (".*?(?<!\\)(?:\\\\)*?")
+  | (@format|[(){}\[\];:=,])
+  | (.)
+''', re.VERBOSE)
+
+# Token kinds by group of TOKEN_RE, punctuation uses its text as the kind.
+NAME = 'NAME'
+INT = 'INT'
+ESCAPED_STRING = 'ESCAPED_STRING'
+CHARACTER = '$CHARACTER'
+END = '$END'
+
+GROUP_KINDS = [None, None, None, NAME, INT, ESCAPED_STRING, None, CHARACTER]
+
+# Names of the Lark terminals, used to describe the expected tokens in errors.
+TERMINAL_NAMES = {
+    '(': 'LPAR',
+    ')': 'RPAR',
+    '{': 'LBRACE',
+    '}': 'RBRACE',
+    '[': 'LSQB',
+    ']': 'RSQB',
+    ';': 'SEMICOLON',
+    ':': 'COLON',
+    '=': 'EQUAL',
+    ',': 'COMMA',
+    '@format': '"@format"',
+}
+
+TOP_LEVEL_KEYWORDS = ['message', 'enum', 'consts', 'namespace', 'struct', 'using', 'group']
+
+# Kinds that can start a member of a message section, struct or tags block.
+MEMBER_START = ['NAME', 'TAG', 'TAGS', '@format']
+
+class SourcePosition:
+    __slots__ = ('line', 'column')
+
+    def __init__(self, line, column):
+        self.line = line
+        self.column = column
+
+def tokenize(unit):
+    '''
+    Returns the tokens of unit's source as (kind, text, line, column) tuples
+
+    The last token always has the kind END. Characters that do not start any token
+    have the kind CHARACTER, the parser reports them once it gets there so that it
+    can tell what it expected instead.
+    '''
+    source = unit.source
+    tokens = []
+    line = 1
+    line_start = 0
+
+    for m in TOKEN_RE.finditer(source):
+        group = m.lastindex
+
+        if group <= 2:
+            newlines = m.group(group).count('\n')
+            if newlines:
+                line += newlines
+                line_start = m.start() + m.group(group).rfind('\n') + 1
+            continue
+
+        text = m.group(group)
+        column = m.start() - line_start + 1
+        tokens.append((GROUP_KINDS[group] or text, text, line, column))
+
+    last_line = source.count('\n') + 1
+    tokens.append((END, '', last_line, len(source) - line_start + 1))
+    return tokens
+
+class Parser:
+    def __init__(self, unit):
+        self.unit = unit
+        self.tokens = tokenize(unit)
+        self.pos = 0
+
+    def error(self, expected):
+        kind, text, line, column = self.tokens[self.pos]
+        expected = expected_to_human_readable([TERMINAL_NAMES.get(e, e) for e in expected])
+
+        if kind == END:
+            self.unit.report_message(self.unit.eof, 'error',
+                    'unexpected end of file',
+                    f'was expecting {expected} here')
+
+        self.unit.report_message(SourcePosition(line, column), 'error',
+                f'unexpected {"character" if kind == CHARACTER else "token"} \'{text}\'',
+                f'was expecting {expected} here')
+
+    def expect(self, kind, expected = None):
+        '''
+        Consumes a token of the given kind, expected lists all kinds that would be valid
+        '''
+        token = self.tokens[self.pos]
+        if token[0] != kind:
+            self.error(expected or [kind])
+
+        self.pos += 1
+        return token
+
+    def expect_keyword(self, keyword, expected = None):
+        token = self.tokens[self.pos]
+        if token[0] != NAME or token[1] != keyword:
+            self.error(expected or [keyword.upper()])
+
+        self.pos += 1
+        return token
+
+    def is_keyword(self, keyword):
+        token = self.tokens[self.pos]
+        return token[0] == NAME and token[1] == keyword
+
+    def parse_start(self):
+        items = []
+
+        while True:
+            kind, text, line, column = self.tokens[self.pos]
+
+            if kind == NAME and text == 'message':
+                items.append(self.parse_message())
+            elif kind == NAME and text in ('enum', 'consts') or kind == '@format':
+                items.append(self.parse_enum())
+            elif kind == NAME and text == 'namespace':
+                items.append(self.parse_ns())
+            elif kind == NAME and text == 'struct':
+                items.append(self.parse_struct())
+            elif kind == NAME and text == 'using':
+                items.append(self.parse_using())
+            elif kind == NAME and text == 'group':
+                items.append(self.parse_group())
+            elif kind == END and items:
+                return items
+            else:
+                self.error(['@format'] + [k.upper() for k in TOP_LEVEL_KEYWORDS] + ([END] if items else []))
+
+    def parse_message(self):
+        _, _, line, column = self.expect_keyword('message')
+        name = sys.intern(self.expect(NAME)[1])
+        id = self.expect(INT)[1]
+        self.expect('{')
+
+        body = []
+
+        while True:
+            if self.is_keyword('head'):
+                body.append(self.parse_head_section())
+            elif self.is_keyword('tail'):
+                body.append(self.parse_tail_section())
+            elif self.tokens[self.pos][0] == '}' and body:
+                break
+            else:
+                self.error(['HEAD', 'TAIL'] + (['}'] if body else []))
+
+        self.pos += 1
+        return Message(line, column, name, id, body)
+
+    def parse_head_section(self):
+        _, _, line, column = self.expect_keyword('head')
+        self.expect('(')
+        size = int(self.expect(INT)[1])
+        self.expect(')')
+        self.expect(':')
+
+        return HeadSection(line, column, size, self.parse_section_members())
+
+    def parse_tail_section(self):
+        _, _, line, column = self.expect_keyword('tail')
+        self.expect(':')
+
+        return TailSection(line, column, self.parse_section_members())
+
+    def parse_section_members(self):
+        members = []
+
+        while True:
+            kind, text = self.tokens[self.pos][:2]
+
+            # Like in the Lark grammar, 'head' and 'tail' start the next section
+            # instead of naming the type of a member.
+            if kind == NAME and text not in ('head', 'tail') or kind == '@format':
+                members.append(self.parse_member())
+            elif kind == NAME or kind == '}':
+                return members
+            else:
+                self.error(MEMBER_START + ['HEAD', 'TAIL', '}'])
+
+    def parse_member(self, expected = ()):
+        '''
+        Parses a member, expected lists what else could follow instead of it
+        '''
+        kind, text, line, column = self.tokens[self.pos]
+
+        if kind not in (NAME, '@format'):
+            self.error([*MEMBER_START, *expected])
+
+        if kind == NAME and text == 'tags':
+            self.pos += 1
+            self.expect('{')
+
+            members = [self.parse_member()]
+            while self.tokens[self.pos][0] != '}':
+                members.append(self.parse_member(['}']))
+
+            self.pos += 1
+            return TagsBlock(line, column, members)
+
+        attributes = {}
+
+        if kind == NAME and text == 'tag':
+            self.pos += 1
+            self.expect('(')
+            attributes['tag'] = Tag(line, column, self.expect(INT)[1])
+            self.expect(')')
+
+            if self.tokens[self.pos][0] not in (NAME, '@format'):
+                self.error(['NAME', '@format'])
+
+        if self.tokens[self.pos][0] == '@format':
+            attributes['format'] = self.parse_format()
+
+        typename = self.parse_type_name()
+        name = sys.intern(self.expect(NAME, ['NAME', '['])[1])
+        self.expect(';')
+
+        return MessageMember(line, column, attributes, typename, name)
+
+    def parse_format(self):
+        _, _, line, column = self.expect('@format')
+        self.expect('(')
+        value = sys.intern(self.expect(NAME)[1])
+        self.expect(')')
+
+        return Format(line, column, value)
+
+    def parse_type_name(self):
+        _, name, line, column = self.expect(NAME)
+
+        if self.tokens[self.pos][0] != '[':
+            return TypeName(line, column, sys.intern(name))
+
+        parts = [name]
+
+        while self.tokens[self.pos][0] == '[':
+            self.pos += 1
+
+            if self.tokens[self.pos][0] == INT:
+                parts.append('[' + self.tokens[self.pos][1] + ']')
+                self.pos += 1
+                self.expect(']')
+            else:
+                parts.append('[]')
+                self.expect(']', [INT, ']'])
+
+        return TypeName(line, column, sys.intern(''.join(parts)))
+
+    def parse_enum(self):
+        _, _, line, column = self.tokens[self.pos]
+        attributes = {}
+
+        if self.tokens[self.pos][0] == '@format':
+            attributes['format'] = self.parse_format()
+
+        if self.is_keyword('enum'):
+            self.pos += 1
+            name = sys.intern(self.expect(NAME)[1])
+            return Enum(line, column, name, 'enum', TypeName(0, 0, 'int32'), attributes, self.parse_enum_block())
+
+        self.expect_keyword('consts', ['ENUM', 'CONSTS'])
+        name = sys.intern(self.expect(NAME)[1])
+        typename = self.parse_type_name()
+        return Enum(line, column, name, 'consts', typename, attributes, self.parse_enum_block(['{', '[']))
+
+    def parse_enum_block(self, expected = None):
+        self.expect('{', expected)
+        members = []
+
+        while True:
+            _, name, line, column = self.expect(NAME)
+            value = None
+
+            if self.tokens[self.pos][0] == '=':
+                self.pos += 1
+                value = int(self.expect(INT)[1])
+
+            members.append(EnumMember(line, column, sys.intern(name), value))
+
+            kind = self.tokens[self.pos][0]
+            self.pos += 1
+
+            if kind == '}':
+                return members
+            elif kind != ',':
+                self.pos -= 1
+                self.error([',', '}'] if value is not None else ['=', ',', '}'])
+
+    def parse_ns(self):
+        _, _, line, column = self.expect_keyword('namespace')
+        name = self.expect(ESCAPED_STRING)[1]
+        self.expect(';')
+
+        return NamespaceTag(line, column, name[1:-1])
+
+    def parse_struct(self):
+        _, _, line, column = self.expect_keyword('struct')
+        name = sys.intern(self.expect(NAME)[1])
+        self.expect('{')
+
+        members = []
+        while self.tokens[self.pos][0] != '}':
+            members.append(self.parse_member(['}']))
+
+        self.pos += 1
+        return Struct(line, column, name, members)
+
+    def parse_using(self):
+        _, _, line, column = self.expect_keyword('using')
+        to_name = self.expect(ESCAPED_STRING)[1]
+        self.expect('=')
+        from_name = self.expect(ESCAPED_STRING)[1]
+        self.expect(';')
+
+        return UsingTag(line, column, from_name[1:-1], to_name[1:-1])
+
+    def parse_group(self):
+        _, _, line, column = self.expect_keyword('group')
+        self.expect('{')
+
+        members = []
+        while self.tokens[self.pos][0] != '}':
+            if not self.is_keyword('message'):
+                self.error(['MESSAGE', '}'])
+            members.append(self.parse_message())
+
+        self.pos += 1
+        return Group(line, column, members)
+
+def parse(unit):
+    '''
+    Parses the source of unit and returns its top-level tokens
+    '''
+    with phase('parse', unit.filename):
+        return Parser(unit).parse_start()
@@ -1,165 +1,16 @@
-import sys
-
-from lark.lark import Lark
-from lark.visitors import Transformer, v_args
-from lark.exceptions import *
+import re
 
 from bragi.tokens import *
 from bragi.types import *
-
-grammar = r'''
-start: (message | enum | consts | ns | struct | using | group)+
-
-tag: "tag" "(" INT ")"
-format: "@format" "(" NAME ")"
-attributes: tag? format?
-enum_attributes: format?
-
-message: "message" NAME INT message_block
-enum: enum_attributes "enum" NAME enum_block
-consts: enum_attributes "consts" NAME type_name enum_block
-ns: "namespace" ESCAPED_STRING ";"
-struct: "struct" NAME "{" message_member* "}"
-using: "using" ESCAPED_STRING "=" ESCAPED_STRING ";"
-group: "group" "{" message* "}"
-
-head_section: "head" "(" INT ")" ":" message_member*
-tail_section: "tail" ":" message_member*
-
-enum_block: "{" (enum_member ",")* enum_member "}"
-message_block: "{" (head_section | tail_section)+ "}"
-
-enum_member: NAME ["=" INT]
-message_member: attributes type_name NAME ";" -> message_member
-                | "tags" "{" message_member+ "}" -> tags_block
-
-type_name: NAME type_size*
-NAME: CNAME
-
-type_size: "[" INT "]"
-         | "[" "]"
-
-%import common.INT
-%import common.CNAME
-%import common.ESCAPED_STRING
-%import common.NEWLINE
-
-%import common.WS
-%ignore WS
-
-COMMENT: "//" /(.)+/ NEWLINE
-       | "/*" /(.|\n)+/ "*/"
-
-%ignore COMMENT
-'''
+from bragi.layout import determine_pointer_size, layout_unit
+from bragi.timings import phase
+from bragi.diagnostics import Diagnostic, CompilationError
 
 RESERVED_NAMES = [
         'int8', 'int16', 'int32', 'int64',
         'uint8', 'uint16', 'uint32', 'uint64',
         'char', 'byte', 'string']
 
-flatten = lambda l: [item for sublist in l for item in sublist]
-
-class IdlTransformer(Transformer):
-    def start(self, items):
-        return items
-
-    @v_args(meta = True)
-    def message(self, meta, items):
-        return Message(meta.line, meta.column, items[0], items[1], flatten(items[2:]))
-
-    @v_args(meta = True)
-    def struct(self, meta, items):
-        return Struct(meta.line, meta.column, items[0], flatten([items[1:]]) if len(items) > 1 else [])
-
-    def message_block(self, items):
-        return items
-
-    @v_args(meta = True)
-    def head_section(self, meta, items):
-        return HeadSection(meta.line, meta.column, int(items[0]), items[1:])
-
-    @v_args(meta = True)
-    def tail_section(self, meta, items):
-        return TailSection(meta.line, meta.column, items)
-
-    @v_args(meta = True)
-    def message_member(self, meta, items):
-        return MessageMember(meta.line, meta.column, items[0], items[1], items[2])
-
-    @v_args(meta = True)
-    def tags_block(self, meta, items):
-        return TagsBlock(meta.line, meta.column, items)
-
-    def attributes(self, items):
-        ret = {}
-
-        for i in items:
-            if type(i) == Tag:
-                ret['tag'] = i
-            elif type(i) == Format:
-                ret['format'] = i
-
-        return ret
-
-    @v_args(meta = True)
-    def tag(self, meta, items):
-        return Tag(meta.line, meta.column, items[-1])
-
-    @v_args(meta = True)
-    def format(self, meta, items):
-        return Format(meta.line, meta.column, items[0])
-
-    @v_args(meta = True)
-    def enum(self, meta, items):
-        return Enum(meta.line, meta.column, items[1], 'enum', TypeName(0, 0, 'int32'), items[0], flatten(items[2:]))
-
-    @v_args(meta = True)
-    def consts(self, meta, items):
-        return Enum(meta.line, meta.column, items[1], 'consts', items[2], items[0], flatten(items[3:]))
-
-    def enum_attributes(self, items):
-        ret = {}
-
-        for i in items:
-            if type(i) == Format:
-                ret['format'] = i
-
-        return ret
-
-    @v_args(meta = True)
-    def using(self, meta, items):
-        return UsingTag(meta.line, meta.column, items[1][1:-1], items[0][1:-1])
-
-    @v_args(meta = True)
-    def ns(self, meta, items):
-        return NamespaceTag(meta.line, meta.column, items[0][1:-1])
-
-    @v_args(meta = True)
-    def enum_member(self, meta, items):
-        return EnumMember(meta.line, meta.column, items[0], int(items[1]) if items[1] else None)
-
-    def enum_block(self, items):
-        return items
-
-    def NAME(self, items):
-        return str(items)
-
-    def ESCAPED_STRING(self, items):
-        return str(items)
-
-    @v_args(meta = True)
-    def type_name(self, meta, items):
-        return TypeName(meta.line , meta.column, ''.join(items))
-
-    @v_args(meta = True)
-    def type_size(self, meta, items):
-        return '[' + ''.join(items) + ']'
-
-    @v_args(meta = True)
-    def group(self, meta, items):
-        return Group(meta.line, meta.column, items)
-
 def token_name_to_human_readable(token):
     if token == 'NAME':
         return 'a name'
@@ -183,6 +34,8 @@ def token_name_to_human_readable(token):
         return 'a type name'
     elif token == 'LSQB':
         return 'an array' # this is more descriptive than "a left square bracket"
+    elif token == 'RSQB':
+        return 'a right square bracket'
     elif token == 'ESCAPED_STRING':
         return 'a string'
     elif token == 'SEMICOLON':
@@ -201,70 +54,78 @@ def token_name_to_human_readable(token):
         return 'a tag'
     elif token == 'GROUP':
         return 'a group'
+    elif token in ('NAMESPACE', 'CONSTS', 'STRUCT', 'USING'):
+        return f'"{token.lower()}"'
+    elif token == '$END':
+        return 'the end of file'
     else:
         return token
 
 def expected_to_human_readable(expected):
-    return ', '.join(
-            [token_name_to_human_readable(i if type(i) is str else i.name)
-                for i in set(expected)])
+    # Sorted, so that the note does not depend on the order of a set.
+    return ', '.join(sorted(
+            {token_name_to_human_readable(i if type(i) is str else i.name)
+                for i in expected}))
 
 class CompilationUnit:
     def __init__(self, filename, source):
         self.filename = filename
         self.source = source
-        self.lines = source.split('\n')
         self.tokens = None
-        self.eof = EofToken(len(self.lines) - 1, len(self.lines[-2]) + 1)
         self.type_registry = TypeRegistry()
+        self.diagnostics = []
 
-    def report_message(self, token, mesg_type, mesg1, mesg2, fatal = True):
-        line = self.lines[token.line - 1]
+        # Offsets of the start of every line, only built once a diagnostic needs them.
+        self.line_starts = None
 
-        n_tabs = line.count('\t')
-        line = line.replace('\t', '        ')
-        line_number = str(token.line)
-        line_no_len = len(line_number)
+    @property
+    def eof(self):
+        # A final newline does not start another line as far as diagnostics are concerned.
+        last_line = max(self.source.count('\n') + (not self.source.endswith('\n')), 1)
+        return EofToken(last_line, len(self.get_line(last_line)) + 1)
 
-        n_spaces = len(line_number) + ((token.column + n_tabs * 7) - 1) + 5
-        spaces = n_spaces * ' '
+    def get_line(self, number):
+        '''
+        Returns the text of the line with the given 1-based number
+        '''
+        if self.line_starts is None:
+            self.line_starts = [0]
+            self.line_starts.extend(m.end() for m in re.finditer('\n', self.source))
 
-        print(f'{self.filename}:{token.line}:{token.column}: {mesg_type}: {mesg1}')
-        print(f'  {line_number} | {line}')
-        print(f'{spaces}^')
+        start = self.line_starts[number - 1]
+        end = self.source.find('\n', start)
 
-        if len(mesg2) > 0:
-            print(f'{spaces}{mesg2}')
+        return self.source[start:end] if end >= 0 else self.source[start:]
+
+    def report_message(self, token, mesg_type, mesg1, mesg2, fatal = True):
+        '''
+        Records a diagnostic for the location of token, raises CompilationError if fatal
+        '''
+        self.diagnostics.append(Diagnostic(self.filename, token.line, token.column,
+                mesg_type, mesg1, mesg2, self.get_line(token.line)))
 
         if fatal:
-            sys.exit(1)
-
-    def process(self):
-        parser = Lark(grammar, propagate_positions = True, parser = 'lalr')
-        lines = self.source.split('\n')
-        parsed = None
-
-        try:
-            parsed = parser.parse(self.source)
-        except UnexpectedToken as e:
-            self.report_message(e, 'error',
-                    f'unexpected token \'{e.token}\'',
-                    f'was expecting {expected_to_human_readable(e.expected)} here')
-        except UnexpectedCharacters as e:
-            self.report_message(e, 'error',
-                    f'unexpected character \'{lines[e.line - 1][e.column - 1]}\'',
-                    f'was expecting {expected_to_human_readable(e.allowed)} here')
-        except UnexpectedEOF as e:
-            self.report_message(eof, 'error',
-                    f'unexpected end of file',
-                    f'was expecting {expected_to_human_readable(e.expected)} here')
-
-        self.tokens = IdlTransformer().transform(parsed)
+            raise CompilationError(self.diagnostics)
+
+    def process(self, engine = 'lark'):
+        '''
+        Parses the source and registers the types it declares
+
+        engine selects the parser, either 'lark' or the hand-written 'native' one.
+        Both produce the same tokens.
+        '''
+        with phase('import'):
+            if engine == 'native':
+                from bragi.native_parser import parse
+            else:
+                from bragi.lark_parser import parse
+
+        self.tokens = parse(self)
 
         for t in self.tokens:
             if type(t) is Enum:
                 if self.type_registry.is_known_type(t.name):
-                    self.report_message(t.type, 'error', f'name {t.name} is already in use.', '')
+                    self.report_message(t, 'error', f'name {t.name} is already in use.', '')
 
                 subtype = self.type_registry.get_type(t.type.name)
                 if not subtype:
@@ -284,7 +145,7 @@ class CompilationUnit:
                 t.type = self.type_registry.get_type(t.name)
             if type(t) is Struct:
                 if self.type_registry.is_known_type(t.name):
-                    self.report_message(t.type, 'error', f'name {t.name} is already in use.', '')
+                    self.report_message(t, 'error', f'name {t.name} is already in use.', '')
 
                 self.type_registry.register_type(
                     Type(t.name,
@@ -314,16 +175,6 @@ class CompilationUnit:
                 self.report_message(m, 'error',
                     'unexpected token inside of an enum', '')
 
-    def determine_pointer_size(self, size):
-        if size < 256:
-            return 1
-        elif size < 65536:
-            return 2
-        elif size < 4294967296:
-            return 4
-        elif size < 18446744073709551616:
-            return 8
-
     # returns size of member in bytes
     def verify_member(self, m, parent, known_names):
         if type(m) is TagsBlock:
@@ -338,7 +189,7 @@ class CompilationUnit:
                         'untagged member in tags block', '')
 
             if type(parent) is HeadSection:
-                return self.determine_pointer_size(parent.size)
+                return determine_pointer_size(parent)
         else:
             if type(m) is not MessageMember:
                 self.report_message(m, 'error',
@@ -364,19 +215,19 @@ class CompilationUnit:
                 self.report_message(m, 'error',
                     f'name \'{m.name}\' is already in use by a different member', '')
 
-            known_names.append(m.name)
+            known_names[m.name] = m
 
             if type(parent) is HeadSection:
-                return m.type.fixed_size if not m.type.dynamic else self.determine_pointer_size(parent.size)
+                return m.type.fixed_size if not m.type.dynamic else determine_pointer_size(parent)
 
     def verify_message(self, msg):
-        known_names = RESERVED_NAMES[:]
+        known_names = dict.fromkeys(RESERVED_NAMES)
         if msg.head is not None:
             total_size = 8
             for m in msg.head.members:
                 total_size += self.verify_member(m, msg.head, known_names)
             if total_size > msg.head.size:
-                self.report_message(s, 'error',
+                self.report_message(msg.head, 'error',
                         f'head section is {total_size - msg.head.size} bytes too short to fit all fixed-width members',
                         'note: the head has two hidden uint32 members for the message id and tail size')
         if msg.tail is not None:
@@ -384,7 +235,7 @@ class CompilationUnit:
                 self.verify_member(m, msg.tail, known_names)
 
     def verify_struct(self, struct):
-        known_names = RESERVED_NAMES[:]
+        known_names = dict.fromkeys(RESERVED_NAMES)
         for m in struct.members:
             self.verify_member(m, struct, known_names)
 
@@ -408,10 +259,10 @@ class CompilationUnit:
         if item.name in known_names:
             self.report_message(item, 'error', f'redefinition of \'{item.name}\'', '')
 
-        known_names.append(item.name)
+        known_names[item.name] = item
 
     def check_duplicate_names(self):
-        known_names = RESERVED_NAMES[:]
+        known_names = dict.fromkeys(RESERVED_NAMES)
 
         for i in self.tokens:
             if type(i) in {Enum, Message, Struct}:
@@ -447,3 +298,9 @@ class CompilationUnit:
             elif type(i) not in {NamespaceTag, UsingTag}:
                 self.report_message(i, 'error',
                         'unexpected token at top level', '')
+
+    def layout(self):
+        '''
+        Computes the wire layout of all messages, must be called after verify()
+        '''
+        layout_unit(self.tokens)
@@ -1,5 +1,6 @@
 from .tokens import *
 from .types import *
+from .emitter import Emitter
 
 
 IO_RESULT = "std::io::Result<()>"
@@ -58,14 +59,14 @@ class DynamicEncoder:
 
                 out += self.parent.line(f"if let Some(value) = {expr} {{")
 
-                self.parent.indent()
+                self.parent.enter_indent()
 
                 out += self.parent.line(
                     f"writer.write_varint({child.tag.value}u64)?;")
 
                 out += self.generate_encode_in_dynamic(f"value", child, False)
 
-                self.parent.dedent()
+                self.parent.leave_indent()
 
                 out += self.parent.line("}")
 
@@ -108,14 +109,14 @@ class DynamicEncoder:
         elif expr_type.identity is TypeIdentity.ARRAY:
             out = self.parent.line("{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             out += self.parent.line(
                 f"writer.write_varint({expr}.len() as u64)?;")
 
             out += self.parent.line(f"for item in {expr}.iter() {{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             item_expr = f"item"
 
@@ -129,11 +130,11 @@ class DynamicEncoder:
             out += self.generate_encode_in_dynamic_internal(
                 item_expr, expr_type.subtype)
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             out += self.parent.line("}")
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             return out + self.parent.line("}")
         elif expr_type.identity is TypeIdentity.STRUCT:
@@ -156,7 +157,7 @@ class Decoder:
         if isinstance(member, TagsBlock) or member.type.dynamic:
             out += self.parent.line("{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             out += self.parent.line(
                 f"let ptr = reader.read_integer::<{ptr_type}>()?;")
@@ -166,7 +167,7 @@ class Decoder:
             out += self.generate_decode_dynamic(expr, member)
             out += self.parent.line(f"reader.seek(prev_offset)?;")
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             out += self.parent.line("}")
         else:
@@ -221,7 +222,7 @@ class Decoder:
 
             out = self.parent.line("{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             array_type = f"[{self.parent.generate_type(expr_type.subtype)}; {expr_type.n_elements}]"
 
@@ -230,17 +231,17 @@ class Decoder:
 
             out += self.parent.line(f"for item in tmp.iter_mut() {{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             out += self.generate_decode_fixed_internal(
                 "*item", expr_type.subtype, True)
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             out += self.parent.line("}")
             out += self.parent.line(set_value("tmp"))
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             return out + self.parent.line("}")
         else:
@@ -252,11 +253,11 @@ class Decoder:
         if isinstance(member, TagsBlock):
             out += self.parent.line("loop {")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             out += self.parent.line(f"match reader.read_varint()? {{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             out += self.parent.line("0 => break,")
 
@@ -264,25 +265,25 @@ class Decoder:
                 out += self.parent.line(
                     f"{child.tag.value} => {{")
 
-                self.parent.indent()
+                self.parent.enter_indent()
 
                 child_name = snake_case(child.name)
 
                 out += self.generate_decode_dynamic_internal(
                     f"self.set_{child_name}", child.type, 0)
 
-                self.parent.dedent()
+                self.parent.leave_indent()
 
                 out += self.parent.line("}")
 
             out += self.parent.line(
                 "_ => return Err(std::io::Error::new(std::io::ErrorKind::InvalidData, \"Unknown tag\")),")
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             out += self.parent.line("}")
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             return out + self.parent.line("}")
         else:
@@ -341,7 +342,7 @@ class Decoder:
         elif expr_type.identity is TypeIdentity.ARRAY:
             out = self.parent.line("{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             out += self.parent.line(
                 f"let size = reader.read_varint()? as usize;")
@@ -360,7 +361,7 @@ class Decoder:
             index = "i" if expr_type.n_elements else "_"
             out += self.parent.line(f"for {index} in 0..size {{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             if expr_type.n_elements:
                 out += self.generate_decode_dynamic_internal(
@@ -369,26 +370,26 @@ class Decoder:
                 out += self.generate_decode_dynamic_internal(
                     f"{items_var}.push", expr_type.subtype, array_depth + 1)
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             out += self.parent.line("}")
 
             out += self.parent.line(set_value(items_var))
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             return out + self.parent.line("}")
         elif expr_type.identity is TypeIdentity.STRUCT:
             out = self.parent.line("{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             out += self.parent.line(
                 f"let mut tmp = {expr_type.name}::default();")
             out += self.parent.line(f"reader.read_struct(&mut tmp)?;")
             out += self.parent.line(set_value(f"tmp"))
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             return out + self.parent.line("}")
         else:
@@ -399,23 +400,21 @@ class Decoder:
 class FixedEncoder:
     def __init__(self, parent):
         self.parent = parent
-        self.nth_dynamic = 0
 
     def generate_encode_in_fixed(self, member, ptr_type):
-        is_tags = isinstance(member, TagsBlock)
-        expr = ""
+        if isinstance(member, TagsBlock) or member.type.dynamic:
+            return self.parent.line(
+                f"writer.write_integer::<{ptr_type}>(dyn_offsets[{member.dyn_index}])?;")
 
-        if not is_tags:
-            member_name = snake_case(member.name)
-            member_name = escape_keyword(member_name)
+        member_name = snake_case(member.name)
+        member_name = escape_keyword(member_name)
 
-            expr = f"self.{member_name}"
+        expr = f"self.{member_name}"
 
-            if self.parent.is_type_optional(member.type):
-                expr = f"{expr}.unwrap()"
+        if self.parent.is_type_optional(member.type):
+            expr = f"{expr}.unwrap()"
 
-        return self.generate_encode_in_fixed_internal(
-            expr, member.type if not is_tags else None, is_tags, ptr_type)
+        return self.generate_encode_in_fixed_internal(expr, member.type)
 
     def generate_encode_in_fixed_default(self, expr_type):
         if expr_type.identity in (TypeIdentity.INTEGER, TypeIdentity.CONSTS):
@@ -425,25 +424,18 @@ class FixedEncoder:
         elif expr_type.identity is TypeIdentity.ARRAY:
             out = self.parent.line(f"for _ in 0..{expr_type.n_elements} {{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             out += self.generate_encode_in_fixed_default(expr_type.subtype)
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             return out + self.parent.line("}")
         else:
             raise RuntimeError("Unexpected variable type")
 
-    def generate_encode_in_fixed_internal(self, expr, expr_type, is_tags, ptr_type):
-        if is_tags or expr_type.dynamic:
-            out = self.parent.line(
-                f"writer.write_integer::<{ptr_type}>(dyn_offsets[{self.nth_dynamic}])?;")
-
-            self.nth_dynamic += 1
-
-            return out
-        elif expr_type.identity == TypeIdentity.INTEGER:
+    def generate_encode_in_fixed_internal(self, expr, expr_type):
+        if expr_type.identity == TypeIdentity.INTEGER:
             return self.parent.line(
                 f"writer.write_integer::<{self.parent.generate_type(expr_type)}>({expr})?;")
         elif expr_type.identity in (TypeIdentity.ENUM, TypeIdentity.CONSTS):
@@ -465,7 +457,7 @@ class FixedEncoder:
         elif expr_type.identity is TypeIdentity.ARRAY:
             out = self.parent.line(f"for item in {expr}.iter() {{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             item_expr = f"item"
 
@@ -477,9 +469,9 @@ class FixedEncoder:
                 item_expr = f"*{item_expr}"
 
             out += self.generate_encode_in_fixed_internal(
-                item_expr, expr_type.subtype, False, None)
+                item_expr, expr_type.subtype)
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             return out + self.parent.line("}")
         else:
@@ -510,14 +502,14 @@ class DynamicEncoder:
                 out += self.parent.line(
                     f"if let Some(value) = {expr} {{")
 
-                self.parent.indent()
+                self.parent.enter_indent()
 
                 out += self.parent.line(
                     f"writer.write_varint({child.tag.value}u64)?;")
 
                 out += self.generate_encode_in_dynamic("value", child, False)
 
-                self.parent.dedent()
+                self.parent.leave_indent()
 
                 out += self.parent.line("}")
 
@@ -577,7 +569,7 @@ class DynamicEncoder:
 
             out += self.parent.line(f"for item in {expr}.iter() {{")
 
-            self.parent.indent()
+            self.parent.enter_indent()
 
             item_expr = f"item"
 
@@ -591,7 +583,7 @@ class DynamicEncoder:
             out += self.generate_encode_in_dynamic_internal(
                 item_expr, expr_type.subtype)
 
-            self.parent.dedent()
+            self.parent.leave_indent()
 
             return out + self.parent.line("}")
         elif expr_type.identity is TypeIdentity.STRUCT:
@@ -603,28 +595,19 @@ class DynamicEncoder:
             raise RuntimeError("Unexpected variable type")
 
 
-class CodeGenerator:
+class CodeGenerator(Emitter):
+    indent_unit = "    "
+
     def __init__(self, units):
         if len(units) != 1:
             raise ValueError(
                 "Rust code generator only supports one input file at a time")
 
+        super().__init__()
         self.units = units
-        self.indent_level = 0
-        self.indent_str = ""
-
-    def indent(self, level=1):
-        self.indent_level += level
-        self.indent_str = self.indent_level * "    "
-
-        if self.indent_level < 0:
-            raise RuntimeError("Indent level cannot be negative")
-
-    def dedent(self):
-        self.indent(-1)
 
     def line(self, text):
-        return f"{self.indent_str}{text}\n"
+        return f"{self.indent}{text}\n"
 
     def lines(self, lines):
         return "".join([self.line(line) for line in lines])
@@ -650,43 +633,12 @@ class CodeGenerator:
         else:
             raise ValueError(f"Unsupported type identity: {type_.identity}")
 
-    def determine_pointer_size(self, what, size):
-        if what != "head":
-            return 8
-
-        if size <= 0xFF:
-            return 1
-        elif size <= 0xFFFF:
-            return 2
-        elif size <= 0xFFFFFFFF:
-            return 4
-        elif size <= 0xFFFFFFFFFFFFFFFF:
-            return 8
-
-        return None
-
-    def determine_pointer_type(self, what, size):
-        size = self.determine_pointer_size(what, size)
-
-        if size:
-            return f"u{size * 8}"
+    def determine_pointer_type(self, part):
+        if part.pointer_size:
+            return f"u{part.pointer_size * 8}"
 
         return None
 
-    def calculate_fixed_part_size(self, what, members, parent):
-        result = 8 if what == "head" else 0
-
-        ptr_size = self.determine_pointer_size(
-            what, parent.head.size if what == "head" else None)
-
-        for member in members:
-            if isinstance(member, TagsBlock) or member.type.dynamic:
-                result += ptr_size
-            else:
-                result += member.type.fixed_size
-
-        return result
-
     def generate_calculate_dynamic_size_of_member(self, into, expr, member, as_type, is_option):
         conv = ""
 
@@ -711,14 +663,14 @@ class CodeGenerator:
 
                 out += self.line(f"if let Some(value) = {expr} {{")
 
-                self.indent()
+                self.enter_indent()
 
                 out += self.line(
                     f"{into} += bragi::size_of_varint({child.tag.value}u64){conv};")
                 out += self.generate_calculate_dynamic_size_of_member(
                     into, "value", child, as_type, False)
 
-                self.dedent()
+                self.leave_indent()
 
                 out += self.line("}")
 
@@ -778,26 +730,26 @@ class CodeGenerator:
         elif expr_type.identity is TypeIdentity.STRING:
             out = self.line("{")
 
-            self.indent()
+            self.enter_indent()
 
             out += self.line(f"let bytes = {expr}.as_bytes();")
             out += self.line(f"{into} += bragi::size_of_varint(bytes.len() as u64){conv};")
             out += self.line(f"{into} += bytes.len(){conv};")
 
-            self.dedent()
+            self.leave_indent()
 
             return out + self.line("}")
         elif expr_type.identity is TypeIdentity.ARRAY:
             out = self.line("{")
 
-            self.indent()
+            self.enter_indent()
 
             out += self.line(
                 f"{into} += bragi::size_of_varint({expr}.len() as u64){conv};")
 
             out += self.line(f"for item in {expr}.iter() {{")
 
-            self.indent()
+            self.enter_indent()
 
             item_expr = f"item"
 
@@ -811,11 +763,11 @@ class CodeGenerator:
             out += self.generate_calculate_dynamic_size_of_member_internal(
                 into, item_expr, expr_type.subtype, as_type)
 
-            self.dedent()
+            self.leave_indent()
 
             out += self.line("}")
 
-            self.dedent()
+            self.leave_indent()
 
             return out + self.line("}")
         elif expr_type.identity is TypeIdentity.STRUCT:
@@ -828,41 +780,36 @@ class CodeGenerator:
                 f"Unexpected member type identity: {expr_type.identity}")
 
     def generate_part_encoder(self, what, parent, members):
-        out = self.line(
-            f"fn encode_{what}<W: {WRTIER_GENERIC}>(&self, writer: &mut W) -> {IO_RESULT} {{")
+        self.write(self.line(
+            f"fn encode_{what}<W: {WRTIER_GENERIC}>(&self, writer: &mut W) -> {IO_RESULT} {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.line(f"let mut writer = bragi::Writer::new(writer);")
+        self.write(self.line(f"let mut writer = bragi::Writer::new(writer);"))
 
         if what == "head":
-            out += self.line(f"writer.write_integer::<u32>(Self::MESSAGE_ID)?;")
-            out += self.line(f"writer.write_integer::<u32>(self.size_of_tail() as u32)?;")
-
-        fixed_size = self.calculate_fixed_part_size(
-            what, members, parent) if members else None
+            self.write(self.line(f"writer.write_integer::<u32>(Self::MESSAGE_ID)?;"))
+            self.write(self.line(f"writer.write_integer::<u32>(self.size_of_tail() as u32)?;"))
 
-        ptrs = [
-            i for i in members if isinstance(i, TagsBlock) or i.type.dynamic
-        ] if members else None
-
-        ptr_type = self.determine_pointer_type(
-            what, parent.head.size if what == "head" else None) if parent else None
+        part = getattr(parent, what) if parent else None
+        fixed_size = part.fixed_size if members else None
+        ptrs = part.dynamic_members if members else None
+        ptr_type = self.determine_pointer_type(part) if parent else None
 
         if ptrs:
-            out += self.line(
-                f"let mut dyn_offsets = [0{ptr_type}; {len(ptrs)}];")
+            self.write(self.line(
+                f"let mut dyn_offsets = [0{ptr_type}; {len(ptrs)}];"))
 
             for i, member in enumerate(ptrs):
-                out += self.generate_determine_dyn_offset_for(
-                    fixed_size, ptrs[i - 1] if i > 0 else None, member, i, ptr_type)
+                self.write(self.generate_determine_dyn_offset_for(
+                    fixed_size, ptrs[i - 1] if i > 0 else None, member, i, ptr_type))
 
         if members:
             fixed_enc = FixedEncoder(self)
             dyn_enc = DynamicEncoder(self)
 
             for member in members:
-                out += fixed_enc.generate_encode_in_fixed(member, ptr_type)
+                self.write(fixed_enc.generate_encode_in_fixed(member, ptr_type))
 
             for member in ptrs:
                 expr = ""
@@ -875,22 +822,22 @@ class CodeGenerator:
                     expr = f"self.{member_name}"
                     is_option = self.is_type_optional(member.type)
 
-                out += dyn_enc.generate_encode_in_dynamic(
-                    expr, member, is_option)
+                self.write(dyn_enc.generate_encode_in_dynamic(
+                    expr, member, is_option))
 
-        out += self.line(f"Ok(())")
+        self.write(self.line(f"Ok(())"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_struct_encoder(self, parent, members):
-        out = self.line(
-            f"fn encode_body<W: {WRTIER_GENERIC}>(&self, writer: &mut W) -> {IO_RESULT} {{")
+        self.write(self.line(
+            f"fn encode_body<W: {WRTIER_GENERIC}>(&self, writer: &mut W) -> {IO_RESULT} {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.line(f"let mut writer = bragi::Writer::new(writer);")
+        self.write(self.line(f"let mut writer = bragi::Writer::new(writer);"))
         dyn_enc = DynamicEncoder(self)
 
         for member in members:
@@ -904,41 +851,40 @@ class CodeGenerator:
                 expr = f"self.{member_name}"
                 is_option = self.is_type_optional(member.type)
 
-            out += dyn_enc.generate_encode_in_dynamic(expr, member, is_option)
+            self.write(dyn_enc.generate_encode_in_dynamic(expr, member, is_option))
 
-        out += self.line("Ok(())")
+        self.write(self.line("Ok(())"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_part_decoder(self, what, parent, members):
-        out = self.line(
-            f"fn decode_{what}<R: {READER_GENERIC}>(&mut self, reader: &mut R) -> {IO_RESULT} {{")
+        self.write(self.line(
+            f"fn decode_{what}<R: {READER_GENERIC}>(&mut self, reader: &mut R) -> {IO_RESULT} {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.line(f"let mut reader = bragi::Reader::new(reader);")
+        self.write(self.line(f"let mut reader = bragi::Reader::new(reader);"))
 
         if what == "head":
-            out += self.line(f"let id = reader.read_integer::<u32>()?;")
-            out += self.line(f"let _tail_size = reader.read_integer::<u32>()?;")
-            out += self.line(f"if id != Self::MESSAGE_ID {{")
+            self.write(self.line(f"let id = reader.read_integer::<u32>()?;"))
+            self.write(self.line(f"let _tail_size = reader.read_integer::<u32>()?;"))
+            self.write(self.line(f"if id != Self::MESSAGE_ID {{"))
 
-            self.indent()
+            self.enter_indent()
 
-            out += self.line(
-                f"return Err(std::io::Error::new(std::io::ErrorKind::InvalidData, \"Invalid message ID\"));")
+            self.write(self.line(
+                f"return Err(std::io::Error::new(std::io::ErrorKind::InvalidData, \"Invalid message ID\"));"))
 
-            self.dedent()
+            self.leave_indent()
 
-            out += self.line("}")
+            self.write(self.line("}"))
 
         dec = Decoder(self)
 
         if members:
-            ptr_type = self.determine_pointer_type(
-                what, parent.head.size if what == "head" else None)
+            ptr_type = self.determine_pointer_type(getattr(parent, what))
 
             for member in members:
                 expr = ""
@@ -949,21 +895,21 @@ class CodeGenerator:
 
                     expr = f"self.{member_name}"
 
-                out += dec.generate_decode_member(expr, member, ptr_type)
+                self.write(dec.generate_decode_member(expr, member, ptr_type))
 
-        out += self.line(f"Ok(())")
+        self.write(self.line(f"Ok(())"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_struct_decoder(self, parent, members):
-        out = self.line(
-            f"fn decode_body<R: {READER_GENERIC}>(&mut self, reader: &mut R) -> {IO_RESULT} {{")
+        self.write(self.line(
+            f"fn decode_body<R: {READER_GENERIC}>(&mut self, reader: &mut R) -> {IO_RESULT} {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.line(f"let mut reader = bragi::Reader::new(reader);")
+        self.write(self.line(f"let mut reader = bragi::Reader::new(reader);"))
         dec = Decoder(self)
 
         for member in members:
@@ -975,33 +921,32 @@ class CodeGenerator:
 
                 expr = f"self.{member_name}"
 
-            out += dec.generate_decode_dynamic(expr, member)
+            self.write(dec.generate_decode_dynamic(expr, member))
 
-        out += self.line("Ok(())")
+        self.write(self.line("Ok(())"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_enum(self, enum):
-        out = ""
         underlying_type = self.generate_type(enum.type.subtype)
 
         format_attr = enum.attributes.get("format")
         is_bitfield = format_attr and format_attr.value == "bitfield"
 
         if is_bitfield:
-            out += self.line("bragi::generate_bitfield_enum! {")
+            self.write(self.line("bragi::generate_bitfield_enum! {"))
         elif enum.mode == "consts":
-            out += self.line(f"bragi::generate_consts! {{")
+            self.write(self.line(f"bragi::generate_consts! {{"))
         else:
-            out += self.line(f"bragi::generate_enum! {{")
+            self.write(self.line(f"bragi::generate_enum! {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.line(f"pub enum {enum.name} : {underlying_type} {{")
+        self.write(self.line(f"pub enum {enum.name} : {underlying_type} {{"))
 
-        self.indent()
+        self.enter_indent()
 
         value = 0
 
@@ -1017,26 +962,24 @@ class CodeGenerator:
             else:
                 member_name = camel_case(member_name)
 
-            out += self.line(f"{member_name} = {value},")
+            self.write(self.line(f"{member_name} = {value},"))
             value = value + 1
 
-        self.dedent()
+        self.leave_indent()
 
-        out += self.line("}")
+        self.write(self.line("}"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def is_type_optional(self, type_):
         return type_.identity in (TypeIdentity.CONSTS, TypeIdentity.ENUM)
 
     def generate_fields(self, members, is_tag_block):
-        out = ""
-
         for member in members:
             if isinstance(member, TagsBlock):
-                out += self.generate_fields(member.members, True)
+                self.generate_fields(member.members, True)
             else:
                 member_name = snake_case(member.name)
                 member_name = escape_keyword(member_name)
@@ -1045,16 +988,12 @@ class CodeGenerator:
                 if is_tag_block or self.is_type_optional(member.type):
                     member_type = f"Option<{member_type}>"
 
-                out += self.line(f"{member_name}: {member_type},")
-
-        return out
+                self.write(self.line(f"{member_name}: {member_type},"))
 
     def generate_accessors(self, members, is_tag_block):
-        out = ""
-
         for member in members:
             if isinstance(member, TagsBlock):
-                out += self.generate_accessors(member.members, True)
+                self.generate_accessors(member.members, True)
                 continue
 
             member_name = snake_case(member.name)
@@ -1076,51 +1015,49 @@ class CodeGenerator:
                 member_type_ref = f"&[{self.generate_type(member.type.subtype)}{array_size}]"
 
             if is_tag_block:
-                out += self.line(
-                    f"pub fn {member_name_esc}(&self) -> Option<{member_type_ref}> {{")
+                self.write(self.line(
+                    f"pub fn {member_name_esc}(&self) -> Option<{member_type_ref}> {{"))
             else:
-                out += self.line(
-                    f"pub fn {member_name_esc}(&self) -> {member_type_ref} {{")
+                self.write(self.line(
+                    f"pub fn {member_name_esc}(&self) -> {member_type_ref} {{"))
 
-            self.indent()
+            self.enter_indent()
 
             if is_tag_block:
                 if member.type.identity in (TypeIdentity.STRING, TypeIdentity.ARRAY) and not member.type.fixed_size:
-                    out += self.line(f"self.{member_name_esc}.as_deref()")
+                    self.write(self.line(f"self.{member_name_esc}.as_deref()"))
                 elif member.type.identity in (TypeIdentity.STRUCT, TypeIdentity.ARRAY):
-                    out += self.line(f"self.{member_name_esc}.as_ref()")
+                    self.write(self.line(f"self.{member_name_esc}.as_ref()"))
                 else:
-                    out += self.line(f"self.{member_name_esc}")
+                    self.write(self.line(f"self.{member_name_esc}"))
             elif member.type.identity in (
                 TypeIdentity.STRUCT,
                 TypeIdentity.STRING,
                 TypeIdentity.ARRAY,
             ):
-                out += self.line(f"&self.{member_name_esc}")
+                self.write(self.line(f"&self.{member_name_esc}"))
             else:
                 if member.type.identity in (TypeIdentity.ENUM, TypeIdentity.CONSTS):
-                    out += self.line(f"self.{member_name_esc}.unwrap()")
+                    self.write(self.line(f"self.{member_name_esc}.unwrap()"))
                 else:
-                    out += self.line(f"self.{member_name_esc}")
+                    self.write(self.line(f"self.{member_name_esc}"))
 
-            self.dedent()
+            self.leave_indent()
 
-            out += self.line(f"}}")
-            out += self.line(
-                f"pub fn set_{member_name}(&mut self, value: {member_type}) {{")
+            self.write(self.line(f"}}"))
+            self.write(self.line(
+                f"pub fn set_{member_name}(&mut self, value: {member_type}) {{"))
 
-            self.indent()
+            self.enter_indent()
 
             if is_tag_block or self.is_type_optional(member.type):
-                out += self.line(f"self.{member_name_esc} = Some(value);")
+                self.write(self.line(f"self.{member_name_esc} = Some(value);"))
             else:
-                out += self.line(f"self.{member_name_esc} = value;")
+                self.write(self.line(f"self.{member_name_esc} = value;"))
 
-            self.dedent()
+            self.leave_indent()
 
-            out += self.line(f"}}")
-
-        return out
+            self.write(self.line(f"}}"))
 
     def generate_determine_dyn_offset_for(self, skip, prev, member, n, as_type):
         out = ""
@@ -1141,13 +1078,13 @@ class CodeGenerator:
         return out
 
     def generate_calculate_size_of(self, what, members, parent):
-        out = self.line(f"fn size_of_{what}(&self) -> usize {{")
+        self.write(self.line(f"fn size_of_{what}(&self) -> usize {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        fixed_part_size = self.calculate_fixed_part_size(what, members, parent)
+        fixed_part_size = getattr(parent, what).fixed_size
 
-        out += self.line(f"let mut size = {fixed_part_size};")
+        self.write(self.line(f"let mut size = {fixed_part_size};"))
 
         dyn_members = [
             member for member in members if isinstance(member, TagsBlock) or member.type.dynamic
@@ -1164,32 +1101,32 @@ class CodeGenerator:
                 expr = f"self.{member_name}"
                 is_option = self.is_type_optional(member.type)
 
-            out += self.generate_calculate_dynamic_size_of_member(
-                "size", expr, member, False, is_option)
+            self.write(self.generate_calculate_dynamic_size_of_member(
+                "size", expr, member, False, is_option))
 
-        out += self.line("size")
+        self.write(self.line("size"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_stub_calculate_size_of(self, what):
-        out = self.line(f"fn size_of_{what}(&self) -> usize {{")
+        self.write(self.line(f"fn size_of_{what}(&self) -> usize {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.line(f"{8 if what == 'head' else 0}")
+        self.write(self.line(f"{8 if what == 'head' else 0}"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_struct_calculate_size_of(self, members, parent):
-        out = self.line(f"fn size_of_body(&self) -> usize {{")
+        self.write(self.line(f"fn size_of_body(&self) -> usize {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.line(f"let mut size = 0;")
+        self.write(self.line(f"let mut size = 0;"))
 
         for member in members:
             expr = ""
@@ -1202,14 +1139,14 @@ class CodeGenerator:
                 expr = f"self.{member_name}"
                 is_option = self.is_type_optional(member.type)
 
-            out += self.generate_calculate_dynamic_size_of_member(
-                "size", expr, member, False, is_option)
+            self.write(self.generate_calculate_dynamic_size_of_member(
+                "size", expr, member, False, is_option))
 
-        out += self.line("size")
+        self.write(self.line("size"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_constructor(self, members):
         ctor_members = list(
@@ -1223,76 +1160,74 @@ class CodeGenerator:
 
             args.append(f"{member_name}: {self.generate_type(member.type)}")
 
-        out = self.line(f"pub fn new({', '.join(args)}) -> Self {{")
+        self.write(self.line(f"pub fn new({', '.join(args)}) -> Self {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.line(f"Self {{")
+        self.write(self.line(f"Self {{"))
 
-        self.indent()
+        self.enter_indent()
 
         for member in ctor_members:
             member_name = snake_case(member.name)
             member_name = escape_keyword(member_name)
 
             if self.is_type_optional(member.type):
-                out += self.line(f"{member_name}: Some({member_name}),")
+                self.write(self.line(f"{member_name}: Some({member_name}),"))
             else:
-                out += self.line(f"{member_name},")
+                self.write(self.line(f"{member_name},"))
 
         if len(ctor_members) != len(members):
-            out += self.line(f"..Default::default()")
+            self.write(self.line(f"..Default::default()"))
 
-        self.dedent()
+        self.leave_indent()
 
-        out += self.line("}")
+        self.write(self.line("}"))
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_struct(self, struct):
-        out = ""
         all_members = flatten([
             flatten((
                 m.members if isinstance(m, TagsBlock) else [m] for m in struct.members
             ))
         ])
 
-        out += self.line(f"#[derive(Default, Debug, Clone)]")
-        out += self.line(f"pub struct {struct.name} {{")
+        self.write(self.line(f"#[derive(Default, Debug, Clone)]"))
+        self.write(self.line(f"pub struct {struct.name} {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.generate_fields(struct.members, False)
+        self.generate_fields(struct.members, False)
 
-        self.dedent()
+        self.leave_indent()
 
-        out += self.line("}")
-        out += self.line(f"impl {struct.name} {{")
+        self.write(self.line("}"))
+        self.write(self.line(f"impl {struct.name} {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.generate_constructor(struct.members)
-        out += self.generate_accessors(struct.members, False)
+        self.generate_constructor(struct.members)
+        self.generate_accessors(struct.members, False)
 
-        self.dedent()
+        self.leave_indent()
 
-        out += self.line("}")
-        out += self.line(f"impl bragi::Struct for {struct.name} {{")
+        self.write(self.line("}"))
+        self.write(self.line(f"impl bragi::Struct for {struct.name} {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.generate_struct_calculate_size_of(struct.members, struct)
-        out += self.generate_struct_encoder(struct, struct.members)
-        out += self.generate_struct_decoder(struct, struct.members)
+        self.generate_struct_calculate_size_of(struct.members, struct)
+        self.generate_struct_encoder(struct, struct.members)
+        self.generate_struct_decoder(struct, struct.members)
 
-        self.dedent()
+        self.leave_indent()
 
-        return out + self.line("}")
+        self.write(self.line("}"))
 
     def generate_message(self, message):
-        out = ""
         all_members = flatten([
             flatten((m.members if isinstance(m, TagsBlock) else [
                     m] for m in message.head.members) if message.head is not None else []),
@@ -1300,111 +1235,91 @@ class CodeGenerator:
                     m] for m in message.tail.members) if message.tail is not None else [])
         ])
 
-        out += self.line(f"#[derive(Default, Debug, Clone)]")
-        out += self.line(f"pub struct {message.name} {{")
+        self.write(self.line(f"#[derive(Default, Debug, Clone)]"))
+        self.write(self.line(f"pub struct {message.name} {{"))
 
-        self.indent()
+        self.enter_indent()
 
         if message.head:
-            out += self.generate_fields(message.head.members, False)
+            self.generate_fields(message.head.members, False)
 
         if message.tail:
-            out += self.generate_fields(message.tail.members, False)
+            self.generate_fields(message.tail.members, False)
 
-        self.dedent()
+        self.leave_indent()
 
-        out += self.line("}")
-        out += self.line(f"impl {message.name} {{")
+        self.write(self.line("}"))
+        self.write(self.line(f"impl {message.name} {{"))
 
-        self.indent()
+        self.enter_indent()
 
-        out += self.generate_constructor(flatten([
+        self.generate_constructor(flatten([
             flatten([message.head.members]) if message.head else [],
             flatten([message.tail.members]) if message.tail else []
         ]))
 
         if message.head:
-            out += self.generate_accessors(message.head.members, False)
+            self.generate_accessors(message.head.members, False)
 
         if message.tail:
-            out += self.generate_accessors(message.tail.members, False)
-
-        self.dedent()
-
-        out += self.line("}")
-        out += self.line(f"impl bragi::Message for {message.name} {{")
+            self.generate_accessors(message.tail.members, False)
 
-        self.indent()
+        self.leave_indent()
 
-        out += self.line(f"const MESSAGE_ID: u32 = {message.id};")
-        out += self.line(f"const HEAD_SIZE: usize = {message.head.size};")
+        self.write(self.line("}"))
+        self.write(self.line(f"impl bragi::Message for {message.name} {{"))
 
-        head_size_of = ""
-        head_encode = ""
-        head_decode = ""
-
-        tail_size_of = ""
-        tail_encode = ""
-        tail_decode = ""
-
-        if message.head:
-            head_size_of = self.generate_calculate_size_of(
-                "head", message.head.members, message)
+        self.enter_indent()
 
-            head_encode = self.generate_part_encoder(
-                "head", message, message.head.members)
+        self.write(self.line(f"const MESSAGE_ID: u32 = {message.id};"))
+        self.write(self.line(f"const HEAD_SIZE: usize = {message.head.size};"))
 
-            head_decode = self.generate_part_decoder(
-                "head", message, message.head.members)
-        else:
-            head_size_of = self.generate_stub_calculate_size_of("head")
-            head_encode = self.generate_part_encoder("head", None, None)
-            head_decode = self.generate_part_decoder("head", None, None)
+        for what in ("head", "tail"):
+            part = getattr(message, what)
 
-        if message.tail:
-            tail_size_of = self.generate_calculate_size_of(
-                "tail", message.tail.members, message)
+            if part:
+                self.generate_calculate_size_of(what, part.members, message)
+            else:
+                self.generate_stub_calculate_size_of(what)
 
-            tail_encode = self.generate_part_encoder(
-                "tail", message, message.tail.members)
+        for what in ("head", "tail"):
+            part = getattr(message, what)
 
-            tail_decode = self.generate_part_decoder(
-                "tail", message, message.tail.members)
-        else:
-            tail_size_of = self.generate_stub_calculate_size_of("tail")
-            tail_encode = self.generate_part_encoder("tail", None, None)
-            tail_decode = self.generate_part_decoder("tail", None, None)
+            if part:
+                self.generate_part_encoder(what, message, part.members)
+            else:
+                self.generate_part_encoder(what, None, None)
 
-        out += head_size_of
-        out += tail_size_of
+        for what in ("head", "tail"):
+            part = getattr(message, what)
 
-        out += head_encode
-        out += tail_encode
+            if part:
+                self.generate_part_decoder(what, message, part.members)
+            else:
+                self.generate_part_decoder(what, None, None)
 
-        out += head_decode
-        out += tail_decode
+        self.leave_indent()
 
-        self.dedent()
+        self.write(self.line("}"))
 
-        return out + self.line("}")
+    def generate(self, stream=None):
+        self.begin_output(stream)
 
-    def generate(self):
-        output = [
-            "// This file is generated by bragi. Any changes will be overwritten.\n",
-            "use bragi::Struct;\n"
-        ]
+        self.write(
+            "// This file is generated by bragi. Any changes will be overwritten.\n")
+        self.write("use bragi::Struct;\n")
 
         for token in self.units[0].tokens:
             if isinstance(token, Enum):
-                output.append(self.generate_enum(token))
+                self.generate_enum(token)
             elif isinstance(token, Struct):
-                output.append(self.generate_struct(token))
+                self.generate_struct(token)
             elif isinstance(token, Message):
-                output.append(self.generate_message(token))
+                self.generate_message(token)
             elif isinstance(token, Group):
                 for member in token.members:
-                    output.append(self.generate_message(member))
+                    self.generate_message(member)
             else:
-                output.append(f"// Unknown token: {type(token).__name__}\n")
+                self.write(f"// Unknown token: {type(token).__name__}\n")
 
-        return "".join(output)
+        return self.end_output()
@@ -0,0 +1,172 @@
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+
+# Seconds a client waits for the server before it compiles in-process instead,
+# can be overridden through BRAGI_SERVER_TIMEOUT.
+DEFAULT_TIMEOUT = 60
+
+def default_socket_path():
+    '''
+    Returns the socket used by 'bragi serve' when no path is given
+    '''
+    path = os.environ.get('BRAGI_SERVER')
+    if path:
+        return path
+
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f'bragi-{os.getuid()}.sock')
+
+def package_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+def source_stamp():
+    '''
+    Returns the size and mtime of bragi's own sources
+
+    A server whose stamp no longer matches the files on disk runs outdated code.
+    '''
+    directory = package_dir()
+    stamp = []
+
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            st = os.stat(os.path.join(directory, name))
+            stamp.append((name, st.st_size, st.st_mtime_ns))
+
+    return stamp
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        request = json.loads(line)
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        status = 0
+
+        # Clients that run another copy of bragi compile in-process, like they do
+        # when there is no response.
+        if request['package'] != package_dir():
+            return
+
+        # Every request is handled in its own forked process, so changing the
+        # working directory, environment and umask does not affect other requests.
+        # The environment selects e.g. the cache directory.
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        os.umask(request['umask'])
+
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                self.server.run(request['argv'])
+            except SystemExit as e:
+                if e.code is None:
+                    status = 0
+                elif isinstance(e.code, int):
+                    status = e.code
+                else:
+                    print(e.code, file = sys.stderr)
+                    status = 1
+
+        response = {'status': status, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    def __init__(self, path, run):
+        self.path = path
+        self.run = run
+        self.stamp = source_stamp()
+        self.stale = False
+
+        if os.path.exists(path):
+            # Only replace sockets that no running server listens on anymore.
+            if forward_request(path, None) is not None:
+                raise RuntimeError(f'a bragi server is already listening on {path}')
+            os.unlink(path)
+
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def verify_request(self, request, client_address):
+        # Refuse to compile with outdated code, clients fall back to compiling
+        # in-process when the connection is closed without a response.
+        if source_stamp() != self.stamp:
+            self.stale = True
+            return False
+
+        return True
+
+    def server_close(self):
+        super().server_close()
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+def serve(path, run):
+    '''
+    Serves compilation requests on the Unix socket at path until bragi is updated
+
+    run is called with the argument vector of every request.
+    '''
+    # Make sure that the socket is removed when the server is terminated.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with Server(path, run) as server:
+        print(f'bragi: listening on {path}', flush = True)
+
+        try:
+            while not server.stale:
+                server.handle_request()
+        except KeyboardInterrupt:
+            pass
+
+def forward_request(path, argv):
+    '''
+    Sends argv to the server listening at path
+
+    Returns the response, or None if there is no usable server or it does not respond
+    in time. A request with argv set to None only checks whether a server is listening.
+    '''
+    try:
+        timeout = float(os.environ.get('BRAGI_SERVER_TIMEOUT', DEFAULT_TIMEOUT))
+    except ValueError:
+        timeout = DEFAULT_TIMEOUT
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(path)
+
+            if argv is None:
+                return {}
+
+            # The client does nothing else yet, reading the umask cannot race.
+            umask = os.umask(0)
+            os.umask(umask)
+
+            request = {'cwd': os.getcwd(), 'env': dict(os.environ), 'umask': umask,
+                    'package': package_dir(), 'argv': argv}
+            s.sendall(json.dumps(request).encode('utf-8') + b'\n')
+
+            with s.makefile('rb') as f:
+                line = f.readline()
+    except OSError:
+        return None
+
+    if not line:
+        return None
+
+    return json.loads(line)
@@ -0,0 +1,142 @@
+'''
+Per-phase instrumentation of a compiler run, see bragi --timings
+
+Phases are recorded by wrapping them in phase(). Unless enable() has been called,
+phase() does nothing beyond creating a small object, so the instrumentation can stay
+in place in normal runs.
+'''
+
+import sys
+import time
+
+# Recorder of this process, None unless timings are enabled.
+recorder = None
+
+def peak_rss(who = 'self'):
+    '''
+    Returns the peak resident set size of this process or its children in bytes
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+
+    # Linux reports KiB, macOS reports bytes.
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+class Recorder:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.outputs = []
+
+    def add_phase(self, name, file, seconds):
+        self.phases.append({
+            'phase': name,
+            'file': file,
+            'seconds': seconds,
+            'peak_rss': peak_rss(),
+        })
+
+    def add_output(self, path, size, cached, written):
+        self.outputs.append({
+            'output': path,
+            'bytes': size,
+            'cached': cached,
+            'written': written,
+        })
+
+    def merge(self, other):
+        self.phases.extend(other.phases)
+        self.outputs.extend(other.outputs)
+
+    def summary(self):
+        '''
+        Returns all measurements as a JSON-serializable dict
+        '''
+        totals = {}
+        for p in self.phases:
+            totals[p['phase']] = totals.get(p['phase'], 0) + p['seconds']
+
+        return {
+            'total_seconds': time.perf_counter() - self.start,
+            'peak_rss': peak_rss(),
+            'peak_rss_children': peak_rss('children') or None,
+            'phase_totals': totals,
+            'phases': self.phases,
+            'outputs': self.outputs,
+        }
+
+class Phase:
+    __slots__ = ('name', 'file', 'start')
+
+    def __init__(self, name, file):
+        self.name = name
+        self.file = file
+
+    def __enter__(self):
+        if recorder is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if recorder is not None:
+            recorder.add_phase(self.name, self.file, time.perf_counter() - self.start)
+
+def phase(name, file = None):
+    '''
+    Returns a context manager that records the wall time of the phase name
+
+    file is the input or output the phase works on, if any.
+    '''
+    return Phase(name, file)
+
+def enable():
+    global recorder
+    recorder = Recorder()
+
+def record_call(function, *args):
+    '''
+    Calls function with timings enabled and returns its result and the recorder
+
+    Used to collect the timings of work done in worker processes.
+    '''
+    global recorder
+
+    recorder = Recorder()
+    try:
+        return function(*args), recorder
+    finally:
+        recorder = None
+
+def format_size(size):
+    if size is None:
+        return '-'
+    return f'{size / 2**20:.1f} MiB'
+
+def format_report(summary):
+    '''
+    Returns summary as a human-readable table
+    '''
+    lines = ['bragi: timings']
+    width = max([len(p['file'] or '') for p in summary['phases']] + [4])
+
+    lines.append(f'  {"phase":<12} {"file":<{width}} {"time":>10} {"peak RSS":>10}')
+    for p in summary['phases']:
+        lines.append(f'  {p["phase"]:<12} {p["file"] or "":<{width}} {p["seconds"] * 1000:7.1f} ms {format_size(p["peak_rss"]):>10}')
+
+    lines.append('  per phase:')
+    for name, seconds in summary['phase_totals'].items():
+        lines.append(f'  {name:<12} {seconds * 1000:7.1f} ms')
+
+    if summary['outputs']:
+        lines.append('  outputs:')
+        for o in summary['outputs']:
+            state = 'cached' if o['cached'] else 'written' if o['written'] else 'unchanged'
+            lines.append(f'  {o["output"]}: {o["bytes"]} bytes ({state})')
+
+    lines.append(f'  total {summary["total_seconds"] * 1000:.1f} ms, peak RSS {format_size(summary["peak_rss"])}'
+            + (f', children {format_size(summary["peak_rss_children"])}' if summary['peak_rss_children'] else ''))
+
+    return '\n'.join(lines) + '\n'
@@ -1,23 +1,39 @@
 class HeadSection:
+    __slots__ = ('line', 'column', 'size', 'members', 'fixed_size', 'pointer_size', 'dynamic_members')
+
     def __init__(self, line, column, size, members):
         self.line = line
         self.column = column
         self.size = size
         self.members = members
 
+        # Set by the layout pass, see bragi.layout.
+        self.fixed_size = None
+        self.pointer_size = None
+        self.dynamic_members = None
+
     def __repr__(self):
         return 'HeadSection(' + self.size + ') { ' + str(self.members) + ' }'
 
 class TailSection:
+    __slots__ = ('line', 'column', 'members', 'fixed_size', 'pointer_size', 'dynamic_members')
+
     def __init__(self, line, column, members):
         self.line = line
         self.column = column
         self.members = members
 
+        # Set by the layout pass, see bragi.layout.
+        self.fixed_size = None
+        self.pointer_size = None
+        self.dynamic_members = None
+
     def __repr__(self):
         return 'TailSection() { ' + str(self.members) + " }"
 
 class Message:
+    __slots__ = ('line', 'column', 'name', 'id', 'head', 'tail', 'body')
+
     def __init__(self, line, column, name, id, body):
         self.line = line
         self.column = column
@@ -37,6 +53,8 @@ class Message:
         return 'Message(' + self.name + ', ' + self.id + ') { ' + str(self.body) + ' }'
 
 class Struct:
+    __slots__ = ('line', 'column', 'name', 'members')
+
     def __init__(self, line, column, name, body):
         self.line = line
         self.column = column
@@ -47,6 +65,8 @@ class Struct:
         return 'Struct(' + self.name + ') { ' + str(self.members) + ' }'
 
 class MessageMember:
+    __slots__ = ('line', 'column', 'tag', 'format', 'typename', 'type', 'name', 'offset', 'pointer_size', 'dyn_index')
+
     def __init__(self, line, column, attributes, typename, name):
         self.line = line
         self.column = column
@@ -56,21 +76,35 @@ class MessageMember:
         self.type = None
         self.name = name
 
+        # Set by the layout pass for members of a head or tail section.
+        self.offset = None
+        self.pointer_size = None
+        self.dyn_index = None
+
     def __repr__(self):
         return (str(self.tag) + ' ' if self.tag else '') + str(self.type) + ' ' + self.name
 
 class TagsBlock:
+    __slots__ = ('line', 'column', 'members', 'known_tags', 'offset', 'pointer_size', 'dyn_index')
+
     def __init__(self, line, column, members):
         self.line = line
         self.column = column
         self.members = members
         self.known_tags = {}
 
+        # Set by the layout pass for members of a head or tail section.
+        self.offset = None
+        self.pointer_size = None
+        self.dyn_index = None
+
     def __repr__(self):
         return 'TagsBlock { ' + str(self.members) + ' }'
 
 
 class TypeName:
+    __slots__ = ('line', 'column', 'name')
+
     def __init__(self, line, column, name):
         self.line = line
         self.column = column
@@ -80,6 +114,8 @@ class TypeName:
         return self.name
 
 class Tag:
+    __slots__ = ('line', 'column', 'value')
+
     def __init__(self, line, column, value):
         self.line = line
         self.column = column
@@ -89,6 +125,8 @@ class Tag:
         return 'tag(' + str(self.value) + ')'
 
 class Format:
+    __slots__ = ('line', 'column', 'value')
+
     def __init__(self, line, column, value):
         self.line = line
         self.column = column
@@ -98,6 +136,8 @@ class Format:
         return 'format(' + str(self.value) + ')'
 
 class Enum:
+    __slots__ = ('line', 'column', 'name', 'mode', 'type', 'members', 'attributes')
+
     def __init__(self, line, column, name, mode, typename, attributes, members):
         self.line = line
         self.column = column
@@ -111,6 +151,8 @@ class Enum:
         return 'Enum(' + self.name + ') { ' + str(self.members) + ' }'
 
 class EnumMember:
+    __slots__ = ('line', 'column', 'name', 'value')
+
     def __init__(self, line, column, name, value = None):
         self.line = line
         self.column = column
@@ -121,17 +163,23 @@ class EnumMember:
         return self.name + ((' = ' + str(self.value)) if self.value is not None else '')
 
 class EofToken:
+    __slots__ = ('line', 'column')
+
     def __init__(self, line, column):
         self.line = line
         self.column = column
 
 class NamespaceTag:
+    __slots__ = ('line', 'column', 'name')
+
     def __init__(self, line, column, name):
         self.line = line
         self.column = column
         self.name = name
 
 class UsingTag:
+    __slots__ = ('line', 'column', 'from_name', 'to_name')
+
     def __init__(self, line, column, from_name, to_name):
         self.line = line
         self.column = column
@@ -139,6 +187,8 @@ class UsingTag:
         self.to_name = to_name
 
 class Group:
+    __slots__ = ('line', 'column', 'members')
+
     def __init__(self, line, column, body):
         self.line = line
         self.column = column
@@ -9,6 +9,8 @@ class TypeIdentity(enum.Enum):
     STRING = 6
 
 class Type:
+    __slots__ = ('name', 'identity', 'fixed_size', 'dynamic', 'subtype', 'n_elements', 'signed', 'attributes')
+
     def __init__(self, name, identity, fixed_size = None, dynamic = False, subtype = None, signed = False, n_elements = None, attributes = {}):
         self.name = name
         self.identity = identity
@@ -47,6 +49,9 @@ class TypeRegistry:
 
         self.types['string'] = Type('string', TypeIdentity.STRING, dynamic = True, subtype = self.types['char'])
 
+        # Array types are interned by their name, see parse_type().
+        self.array_types = {}
+
     def get_type(self, name):
         return self.types[name] if name in self.types else None
 
@@ -57,6 +62,12 @@ class TypeRegistry:
         return name in self.types
 
     def parse_type(self, name):
+        '''
+        Resolves a type name like 'uint32[16][]'
+
+        Every distinct array type is resolved once, all members that use it share
+        the same Type object.
+        '''
         base, delim, size = name.rpartition('[')
 
         if delim == '':
@@ -65,6 +76,9 @@ class TypeRegistry:
             else:
                 return self.types[name]
 
+        if name in self.array_types:
+            return self.array_types[name]
+
         if size[-1] != ']':
             return None
 
@@ -84,8 +98,11 @@ class TypeRegistry:
         dynamic = base_type.dynamic or len(size) == 0
         t_size = base_type.fixed_size * i_size if not dynamic else None
 
-        return Type(name, TypeIdentity.ARRAY,
+        array_type = Type(name, TypeIdentity.ARRAY,
                 fixed_size = t_size,
                 n_elements = i_size,
                 dynamic = dynamic,
                 subtype = base_type)
+
+        self.array_types[name] = array_type
+        return array_type
@@ -1,140 +1,130 @@
 from .tokens import *
 from .types import *
+from .emitter import Emitter
 
 import hashlib
 
 flatten = lambda l: [item for sublist in l for item in sublist]
 
-class CodeGenerator:
+class CodeGenerator(Emitter):
     def __init__(self, units):
+        super().__init__()
         self.units = units
-        self.indent_depth = 0
-        self.indent = ''
         self.enums = {}
         self.messages = {}
         self.namespace_tag = None
         self.protocols = {}
-
-    def enter_indent(self):
-        self.indent_depth += 1
-        self.indent = '\t' * self.indent_depth
-        return self.indent
-
-    def leave_indent(self):
-        self.indent_depth -= 1
-        self.indent = '\t' * self.indent_depth
-        return self.indent
+        # Names of the ProtoFields of every message, keyed by the message.
+        self.fields = {}
 
     def generate_header(self):
         '''
         Generate the output file header
         '''
 
-        out = f'{self.indent}function parse_varint(varint)\n'
+        self.write(f'{self.indent}function parse_varint(varint)\n')
         self.enter_indent()
-        out += f'{self.indent}local nbytes = 9\n'
-        out += f'{self.indent}local ret = 0\n'
-        out += f'{self.indent}if varint(0, 1):uint() ~= 0 then\n'
+        self.write(f'{self.indent}local nbytes = 9\n')
+        self.write(f'{self.indent}local ret = 0\n')
+        self.write(f'{self.indent}if varint(0, 1):uint() ~= 0 then\n')
         self.enter_indent()
-        out += f'{self.indent}for i=1,8 do\n'
+        self.write(f'{self.indent}for i=1,8 do\n')
         self.enter_indent()
-        out += f'{self.indent}if bit.band(bit.rshift(varint(0, 1):uint(), i - 1), 1) ~= 0 then\n'
+        self.write(f'{self.indent}if bit.band(bit.rshift(varint(0, 1):uint(), i - 1), 1) ~= 0 then\n')
         self.enter_indent()
-        out += f'{self.indent}nbytes = i\n'
-        out += f'{self.indent}break\n'
+        self.write(f'{self.indent}nbytes = i\n')
+        self.write(f'{self.indent}break\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
+        self.write(f'{self.indent}end\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
+        self.write(f'{self.indent}end\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
-        out += f'{self.indent}for i=1,nbytes-1 do\n'
+        self.write(f'{self.indent}end\n')
+        self.write(f'{self.indent}for i=1,nbytes-1 do\n')
         self.enter_indent()
-        out += f'{self.indent}ret = bit.bor(ret, bit.lshift(varint(i, 1):uint(), (i - 1) * 8))\n'
+        self.write(f'{self.indent}ret = bit.bor(ret, bit.lshift(varint(i, 1):uint(), (i - 1) * 8))\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
-        out += f'{self.indent}local shift = 0\n'
-        out += f'{self.indent}if nbytes < 9 then\n'
+        self.write(f'{self.indent}end\n')
+        self.write(f'{self.indent}local shift = 0\n')
+        self.write(f'{self.indent}if nbytes < 9 then\n')
         self.enter_indent()
-        out += f'{self.indent}shift = 8 - (nbytes % 8)\n'
+        self.write(f'{self.indent}shift = 8 - (nbytes % 8)\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
-        out += f'{self.indent}ret = bit.lshift(ret, shift)\n'
-        out += f'{self.indent}ret = bit.bor(ret, bit.rshift(varint(0, 1):uint(), nbytes))\n'
-        out += f'{self.indent}return nbytes, ret\n'
+        self.write(f'{self.indent}end\n')
+        self.write(f'{self.indent}ret = bit.lshift(ret, shift)\n')
+        self.write(f'{self.indent}ret = bit.bor(ret, bit.rshift(varint(0, 1):uint(), nbytes))\n')
+        self.write(f'{self.indent}return nbytes, ret\n')
         self.leave_indent()
-        out += f'{self.indent}end\n\n'
-        return out
+        self.write(f'{self.indent}end\n\n')
 
     def generate_footer(self):
         '''
         Generate the output file footer
         '''
 
-        out = f'{self.indent}bragi_protocol = Proto("bragi", "bragi request")\n\n'
-        out += f'{self.indent}protocol_id = ProtoField.uint32("bragi.protocol", "Encapsulated protocol", base.HEX, protocol_mappings)\n'
-        out += f'{self.indent}message_id = ProtoField.int32("bragi.message_id", "message ID", base.DEC)\n'
-        out += f'{self.indent}tail_size = ProtoField.int32("bragi.tail_size", "tail size", base.DEC)\n'
-        out += f'{self.indent}pid = ProtoField.uint32("bragi.pid", "PID", base.DEC)\n'
-        out += f'{self.indent}request_of = ProtoField.framenum("bragi.request_of", "Response in", base.NONE, frametype.RESPONSE)\n'
-        out += f'{self.indent}response_to = ProtoField.framenum("bragi.reply_to", "Reply to", base.NONE, frametype.REQUEST)\n'
-        out += f'{self.indent}convo_time = ProtoField.relative_time("bragi.convo_time", "Handling time")\n\n'
-        out += f'{self.indent}bragi_protocol.fields = {{protocol_id, message_id, tail_size, pid, request_of, response_to, convo_time}}\n\n'
-        out += f'{self.indent}function bragi_protocol.dissector(tvb, pinfo, tree)\n'
+        self.write(f'{self.indent}bragi_protocol = Proto("bragi", "bragi request")\n\n')
+        self.write(f'{self.indent}protocol_id = ProtoField.uint32("bragi.protocol", "Encapsulated protocol", base.HEX, protocol_mappings)\n')
+        self.write(f'{self.indent}message_id = ProtoField.int32("bragi.message_id", "message ID", base.DEC)\n')
+        self.write(f'{self.indent}tail_size = ProtoField.int32("bragi.tail_size", "tail size", base.DEC)\n')
+        self.write(f'{self.indent}pid = ProtoField.uint32("bragi.pid", "PID", base.DEC)\n')
+        self.write(f'{self.indent}request_of = ProtoField.framenum("bragi.request_of", "Response in", base.NONE, frametype.RESPONSE)\n')
+        self.write(f'{self.indent}response_to = ProtoField.framenum("bragi.reply_to", "Reply to", base.NONE, frametype.REQUEST)\n')
+        self.write(f'{self.indent}convo_time = ProtoField.relative_time("bragi.convo_time", "Handling time")\n\n')
+        self.write(f'{self.indent}bragi_protocol.fields = {{protocol_id, message_id, tail_size, pid, request_of, response_to, convo_time}}\n\n')
+        self.write(f'{self.indent}function bragi_protocol.dissector(tvb, pinfo, tree)\n')
         self.enter_indent()
-        out += f'{self.indent}if tvb:len() == 0 then return end\n\n'
-        out += f'{self.indent}local subtree = tree:add(bragi_protocol, tvb(0, 40), "Bragi Protocol Data")\n'
-        out += f'{self.indent}local proto_id = tvb(0, 4)\n'
-        out += f'{self.indent}local pid_val = tvb(4, 4)\n'
-        out += f'{self.indent}local req_num = tvb(8, 8)\n'
-        out += f'{self.indent}local resp_num = tvb(16, 8)\n'
-        out += f'{self.indent}local req_time = tvb(24, 8)\n'
-        out += f'{self.indent}local request = tvb(32, 4)\n\n'
-        out += f'{self.indent}if protocol_mappings[proto_id:le_uint()] ~= nil then\n'
+        self.write(f'{self.indent}if tvb:len() == 0 then return end\n\n')
+        self.write(f'{self.indent}local subtree = tree:add(bragi_protocol, tvb(0, 40), "Bragi Protocol Data")\n')
+        self.write(f'{self.indent}local proto_id = tvb(0, 4)\n')
+        self.write(f'{self.indent}local pid_val = tvb(4, 4)\n')
+        self.write(f'{self.indent}local req_num = tvb(8, 8)\n')
+        self.write(f'{self.indent}local resp_num = tvb(16, 8)\n')
+        self.write(f'{self.indent}local req_time = tvb(24, 8)\n')
+        self.write(f'{self.indent}local request = tvb(32, 4)\n\n')
+        self.write(f'{self.indent}if protocol_mappings[proto_id:le_uint()] ~= nil then\n')
         self.enter_indent()
-        out += f'{self.indent}pinfo.cols.protocol = protocol_mappings[proto_id:le_uint()]\n'
+        self.write(f'{self.indent}pinfo.cols.protocol = protocol_mappings[proto_id:le_uint()]\n')
         self.leave_indent()
-        out += f'{self.indent}else\n'
+        self.write(f'{self.indent}else\n')
         self.enter_indent()
-        out += f'{self.indent}pinfo.cols.protocol = "bragi"\n'
+        self.write(f'{self.indent}pinfo.cols.protocol = "bragi"\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
-        out += f'{self.indent}subtree:add_le(protocol_id, proto_id)\n'
-        out += f'{self.indent}subtree:add_le(pid, pid_val)\n'
-        out += f'{self.indent}if req_num:le_uint64():tonumber() == pinfo.number and resp_num:le_uint64():tonumber() ~= 0 then\n'
+        self.write(f'{self.indent}end\n')
+        self.write(f'{self.indent}subtree:add_le(protocol_id, proto_id)\n')
+        self.write(f'{self.indent}subtree:add_le(pid, pid_val)\n')
+        self.write(f'{self.indent}if req_num:le_uint64():tonumber() == pinfo.number and resp_num:le_uint64():tonumber() ~= 0 then\n')
         self.enter_indent()
-        out += f'{self.indent}subtree:add(request_of, resp_num, resp_num:le_uint64():tonumber())\n'
+        self.write(f'{self.indent}subtree:add(request_of, resp_num, resp_num:le_uint64():tonumber())\n')
         self.leave_indent()
-        out += f'{self.indent}elseif resp_num:le_uint64():tonumber() == pinfo.number and req_num:le_uint64():tonumber() ~= 0 then\n'
+        self.write(f'{self.indent}elseif resp_num:le_uint64():tonumber() == pinfo.number and req_num:le_uint64():tonumber() ~= 0 then\n')
         self.enter_indent()
-        out += f'{self.indent}subtree:add(response_to, req_num, req_num:le_uint64():tonumber())\n'
+        self.write(f'{self.indent}subtree:add(response_to, req_num, req_num:le_uint64():tonumber())\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
-        out += f'{self.indent}if req_time:le_uint64():tonumber() ~= 0 then\n'
+        self.write(f'{self.indent}end\n')
+        self.write(f'{self.indent}if req_time:le_uint64():tonumber() ~= 0 then\n')
         self.enter_indent()
-        out += f'{self.indent}subtree:add(convo_time, req_time, NSTime.new(req_time:le_uint64():tonumber() // 1000000000, req_time:le_uint64():tonumber() % 1000000000))\n'
+        self.write(f'{self.indent}subtree:add(convo_time, req_time, NSTime.new(req_time:le_uint64():tonumber() // 1000000000, req_time:le_uint64():tonumber() % 1000000000))\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
-        out += f'{self.indent}if protocols[proto_id:le_uint()] ~= nil then\n'
+        self.write(f'{self.indent}end\n')
+        self.write(f'{self.indent}if protocols[proto_id:le_uint()] ~= nil then\n')
         self.enter_indent()
-        out += f'{self.indent}local proto = protocols[proto_id:le_uint()]\n'
-        out += f'{self.indent}if proto[request:le_uint()] ~= nil then\n'
+        self.write(f'{self.indent}local proto = protocols[proto_id:le_uint()]\n')
+        self.write(f'{self.indent}if proto[request:le_uint()] ~= nil then\n')
         self.enter_indent()
-        out += f'{self.indent}local msg_ids = protocol_message_ids[proto_id:le_uint()]\n'
-        out += f'{self.indent}pinfo.cols.info:set("PID " .. pid_val:le_uint() .. " " .. msg_ids[request:le_uint()])\n'
-        out += f'{self.indent}subtree:add_le(message_id, request, request:le_uint(), "message:", msg_ids[request:le_uint()])\n'
-        out += f'{self.indent}local prototree = tree:add(proto[request:le_uint()], tvb(40, tvb:len() - 40))\n'
-        out += f'{self.indent}proto[request:le_uint()].dissector(tvb(40, tvb:len() - 40):tvb(), pinfo, prototree)\n'
+        self.write(f'{self.indent}local msg_ids = protocol_message_ids[proto_id:le_uint()]\n')
+        self.write(f'{self.indent}pinfo.cols.info:set("PID " .. pid_val:le_uint() .. " " .. msg_ids[request:le_uint()])\n')
+        self.write(f'{self.indent}subtree:add_le(message_id, request, request:le_uint(), "message:", msg_ids[request:le_uint()])\n')
+        self.write(f'{self.indent}local prototree = tree:add(proto[request:le_uint()], tvb(40, tvb:len() - 40))\n')
+        self.write(f'{self.indent}proto[request:le_uint()].dissector(tvb(40, tvb:len() - 40):tvb(), pinfo, prototree)\n')
         self.leave_indent()
-        out += f'{self.indent}end\n'
+        self.write(f'{self.indent}end\n')
         self.leave_indent()
-        out += f'{self.indent}end\n\n'
-        out += f'{self.indent}subtree:add_le(tail_size, tvb(36, 4))\n'
+        self.write(f'{self.indent}end\n\n')
+        self.write(f'{self.indent}subtree:add_le(tail_size, tvb(36, 4))\n')
         self.leave_indent()
-        out += 'end\n\n'
-        out += 'local tab = DissectorTable.get("wtap_encap")\n'
-        out += 'tab:add(wtap.USER0, bragi_protocol)\n'
-        return out
+        self.write('end\n\n')
+        self.write('local tab = DissectorTable.get("wtap_encap")\n')
+        self.write('tab:add(wtap.USER0, bragi_protocol)\n')
 
     def generate_integer_parsing(self, m: MessageMember, msg: Message | Struct, tree_name: str = 'tree', tvb_name: str = 'tvb') -> str:
         '''
@@ -213,7 +203,7 @@ class CodeGenerator:
                 if format_attr == "bitfield":
                     for em in self.enums[m.type.name].members:
                         out += f"{self.indent}{m.name}_item:add_le({self.proto_field_member_name(message, m)}_{em.name}, {tvb_name}({member_offset}, member_size), {type_prefix}member{type_suffix})\n"
-                        message.fields.append(f"{m.name}_{em.name}")
+                        self.fields[message].append(f"{m.name}_{em.name}")
 
             out += f'{self.indent}{member_offset} = {member_offset} + member_size\n'
         elif m.type.subtype.identity == TypeIdentity.STRUCT:
@@ -228,13 +218,14 @@ class CodeGenerator:
 
         return out
 
-    def generate(self):
+    def generate(self, stream = None):
         '''
-        Main code generation function
+        Main code generation function, writes to stream if given and returns the code otherwise
         '''
+        self.begin_output(stream)
 
-        out = '-- This file has been autogenerated, changes *will* be lost eventually...\n'
-        out += self.generate_header()
+        self.write('-- This file has been autogenerated, changes *will* be lost eventually...\n')
+        self.generate_header()
 
         for unit in self.units:
             self.enums = {}
@@ -244,25 +235,25 @@ class CodeGenerator:
             for thing in unit.tokens:
                 if type(thing) == Enum:
                     self.enums[thing.name] = thing
-                    out += self.generate_consts(thing)
+                    self.generate_consts(thing)
                 elif type(thing) == Message:
-                    out += self.generate_message(thing)
+                    self.generate_message(thing)
                 elif type(thing) == NamespaceTag:
                     self.protohash = hashlib.shake_128(thing.name.encode('ascii')).hexdigest(4)
                     self.shortprotoname = thing.name.rsplit('::', 1)[-1]
                     self.protoname = thing.name
                     self.protocols[self.protohash] = self.protoname
                 elif type(thing) == Struct:
-                    out += self.generate_struct(thing)
+                    self.generate_struct(thing)
                 else:
                     print(f"unhandled type {str(type(thing))}")
 
-            out += self.generate_protocol_metadata()
+            self.generate_protocol_metadata()
 
-        out += self.generate_global_protocol_metadata()
-        out += self.generate_footer()
+        self.generate_global_protocol_metadata()
+        self.generate_footer()
 
-        return out
+        return self.end_output()
 
     def generate_consts(self, enum):
         '''
@@ -270,21 +261,19 @@ class CodeGenerator:
         '''
 
         i = 0
-        out = f'local dis_{self.protohash}_{enum.name} = {{\n'
+        self.write(f'local dis_{self.protohash}_{enum.name} = {{\n')
         self.enter_indent()
 
         for m in enum.members:
             if m.value is not None:
                 i = m.value
 
-            out += f'{self.indent}[{i}] = "{m.name}",\n'
+            self.write(f'{self.indent}[{i}] = "{m.name}",\n')
 
             i += 1
 
         self.leave_indent()
-        out += '}\n\n'
-
-        return out
+        self.write('}\n\n')
 
     def is_simple_integer(self, t):
         return t in ['byte', 'char', 'int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64']
@@ -414,10 +403,10 @@ class CodeGenerator:
             return f'{out}{self.proto_field_member_name(message, m)} = ProtoField.{field_type}("{self.shortprotoname}_{message.name}.{m.name}", "{m.name}"{extra_arg})\n'
 
     def generate_message(self, message):
-        message.fields = []
+        self.fields[message] = []
         tag_members = {}
 
-        out = f'{self.proto_name(message)} = Proto("{self.shortprotoname}_{message.name}", "{self.protoname} {message.name} request")\n\n'
+        self.write(f'{self.proto_name(message)} = Proto("{self.shortprotoname}_{message.name}", "{self.protoname} {message.name} request")\n\n')
 
         head_members = flatten((m.members if type(m) is TagsBlock else [m] for m in message.head.members) if message.head is not None else [])
         tail_members = flatten((m.members if type(m) is TagsBlock else [m] for m in message.tail.members) if message.tail is not None else [])
@@ -427,264 +416,221 @@ class CodeGenerator:
             if m.tag:
                 tag_members[m.tag] = m
 
-            message.fields.append(m.name)
+            self.fields[message].append(m.name)
 
-            out += self.generate_protofield(message, m)
+            self.write(self.generate_protofield(message, m))
 
-        out += f'\n{self.indent}{self.proto_name(message)}_tags = {{\n'
+        self.write(f'\n{self.indent}{self.proto_name(message)}_tags = {{\n')
         self.enter_indent()
         for tag, m in tag_members.items():
-            out += f'{self.indent}[{tag.value}] = {self.proto_field_member_name(message, m)},\n'
+            self.write(f'{self.indent}[{tag.value}] = {self.proto_field_member_name(message, m)},\n')
 
         self.leave_indent()
-        out += f'{self.indent}}}\n\n'
+        self.write(f'{self.indent}}}\n\n')
 
-        out += f'{self.indent}function {self.proto_name(message)}.dissector(tvb, pinfo, tree)\n'
+        self.write(f'{self.indent}function {self.proto_name(message)}.dissector(tvb, pinfo, tree)\n')
         self.enter_indent()
 
-        member_offset = 0
         for m in head_members:
             if m.tag:
                 continue
 
-            out += f'{self.indent}local {m.name}_item = tree:add_le({self.proto_field_member_name(message, m)}, tvb({member_offset}, {m.type.fixed_size}))\n'
+            # Offsets are relative to the end of the message ID and tail size.
+            member_offset = m.offset - 8
+            self.write(f'{self.indent}local {m.name}_item = tree:add_le({self.proto_field_member_name(message, m)}, tvb({member_offset}, {m.type.fixed_size}))\n')
             if m.type.identity in (TypeIdentity.ENUM, TypeIdentity.CONSTS) and "format" in m.type.attributes:
                 format_attr = m.type.attributes['format'].value
                 if format_attr == "bitfield":
                     for em in self.enums[m.type.name].members:
-                        out += f"{self.indent}{m.name}_item:add_le({self.proto_field_member_name(message, m)}_{em.name}, tvb:range({member_offset}, {m.type.fixed_size}))\n"
-                        message.fields.append(f"{m.name}_{em.name}")
-
-            member_offset += m.type.fixed_size
+                        self.write(f"{self.indent}{m.name}_item:add_le({self.proto_field_member_name(message, m)}_{em.name}, tvb:range({member_offset}, {m.type.fixed_size}))\n")
+                        self.fields[message].append(f"{m.name}_{em.name}")
 
-        out += self.generate_message_tag_members(message, tag_members)
-        out += self.generate_message_tail_members(message, tail_members)
+        self.generate_message_tag_members(message, tag_members)
+        self.generate_message_tail_members(message, tail_members)
 
         self.leave_indent()
-        out += 'end\n\n'
+        self.write('end\n\n')
 
-        fields_str = ", ".join([self.proto_field_name(message, f) for f in message.fields])
-        out += f'{self.proto_name(message)}.fields = {{{fields_str}}}\n\n'
+        fields_str = ", ".join([self.proto_field_name(message, f) for f in self.fields[message]])
+        self.write(f'{self.proto_name(message)}.fields = {{{fields_str}}}\n\n')
 
         self.messages[message.id] = message
 
-        return out
-
     def generate_message_tag_members(self, message, tag_members):
         if not tag_members:
-            return ''
+            return
 
         first_tag = True
-        tags_offset = self.calculate_fixed_part_size('head', message.head.members, message) - 8
-        out = f'{self.indent}local tags = tvb({tags_offset}, tvb:len() - {tags_offset}):tvb()\n'
-        out += f'{self.indent}local size, tag = parse_varint(tags)\n'
-        out += f'{self.indent}tags = tags(size, tags:len() - size):tvb()\n'
-        out += f'{self.indent}while tag ~= 0 do\n'
+        tags_offset = message.head.fixed_size - 8
+        self.write(f'{self.indent}local tags = tvb({tags_offset}, tvb:len() - {tags_offset}):tvb()\n')
+        self.write(f'{self.indent}local size, tag = parse_varint(tags)\n')
+        self.write(f'{self.indent}tags = tags(size, tags:len() - size):tvb()\n')
+        self.write(f'{self.indent}while tag ~= 0 do\n')
         self.enter_indent()
-        out += f'{self.indent}local value_size = 0\n'
+        self.write(f'{self.indent}local value_size = 0\n')
         for tag, m in tag_members.items():
             if first_tag:
                 first_tag = False
-                out += f'{self.indent}if tag == {tag.value} then\n'
+                self.write(f'{self.indent}if tag == {tag.value} then\n')
             else:
-                out += f'{self.indent}elseif tag == {tag.value} then\n'
+                self.write(f'{self.indent}elseif tag == {tag.value} then\n')
             self.enter_indent()
 
             if self.is_simple_integer(self.proto_field_type(m.type)) and m.type.identity != TypeIdentity.ARRAY:
-                out += self.generate_integer_parsing(m, message, tvb_name='tags')
-                out += f'{self.indent}value_size = varint_size\n'
+                self.write(self.generate_integer_parsing(m, message, tvb_name='tags'))
+                self.write(f'{self.indent}value_size = varint_size\n')
             elif m.type.identity == TypeIdentity.STRING:
-                out += self.generate_string_parsing(m, message, tvb_name='tags')
-                out += f'{self.indent}value_size = len_size + len\n'
+                self.write(self.generate_string_parsing(m, message, tvb_name='tags'))
+                self.write(f'{self.indent}value_size = len_size + len\n')
             elif m.type.identity == TypeIdentity.ARRAY:
-                out += self.generate_array_parsing(m, message, 'tag', tvb_name='tags')
+                self.write(self.generate_array_parsing(m, message, 'tag', tvb_name='tags'))
             else:
                 print(f'unhandled type {m.type}')
 
             self.leave_indent()
-        out += f'{self.indent}end\n'
+        self.write(f'{self.indent}end\n')
 
-        out += f'{self.indent}size, tag = parse_varint(tags(value_size))\n'
-        out += f'{self.indent}tags = tags(value_size + size, tags:len() - size - value_size):tvb()\n'
+        self.write(f'{self.indent}size, tag = parse_varint(tags(value_size))\n')
+        self.write(f'{self.indent}tags = tags(value_size + size, tags:len() - size - value_size):tvb()\n')
 
         self.leave_indent()
-        out += f'{self.indent}end\n'
-
-        return out
+        self.write(f'{self.indent}end\n')
 
     def generate_message_tail_members(self, message, tail_members):
         if not tail_members:
-            return ''
+            return
 
-        out = ''
-        head_size = self.calculate_fixed_part_size('head', message.head.members, message) - 8
+        head_size = message.head.fixed_size - 8
         tail_member_num = 0
         for m in tail_members:
-            out += f'{self.indent}local dynoff{tail_member_num} = tvb({head_size + (tail_member_num * 8)}, 4):le_uint()\n'
-            out += f'{self.indent}local tail = tvb({head_size} + dynoff{tail_member_num}, tvb:len() - ({head_size} + dynoff{tail_member_num}))\n'
-            out += f'{self.indent}local value_size = 0\n'
+            self.write(f'{self.indent}local dynoff{tail_member_num} = tvb({head_size + (tail_member_num * 8)}, 4):le_uint()\n')
+            self.write(f'{self.indent}local tail = tvb({head_size} + dynoff{tail_member_num}, tvb:len() - ({head_size} + dynoff{tail_member_num}))\n')
+            self.write(f'{self.indent}local value_size = 0\n')
             if m.type.identity == TypeIdentity.STRING:
-                out += f'{self.indent}local len_size, len = parse_varint(tail)\n'
-                out += f'{self.indent}if len_size < tail:len() then\n'
+                self.write(f'{self.indent}local len_size, len = parse_varint(tail)\n')
+                self.write(f'{self.indent}if len_size < tail:len() then\n')
                 self.enter_indent()
-                out += f'{self.indent}tree:add({self.proto_field_member_name(message, m)}, tail(len_size, len), tail(len_size, len):string())\n'
+                self.write(f'{self.indent}tree:add({self.proto_field_member_name(message, m)}, tail(len_size, len), tail(len_size, len):string())\n')
                 self.leave_indent()
-                out += f'{self.indent}else\n'
+                self.write(f'{self.indent}else\n')
                 self.enter_indent()
-                out += f'{self.indent}tree:add({self.proto_field_member_name(message, m)}, tail(0, len_size + len), "<empty>")\n'
+                self.write(f'{self.indent}tree:add({self.proto_field_member_name(message, m)}, tail(0, len_size + len), "<empty>")\n')
                 self.leave_indent()
-                out += f'{self.indent}end\n'
+                self.write(f'{self.indent}end\n')
             elif m.type.identity == TypeIdentity.ARRAY:
-                out += self.generate_array_parsing(m, message, 'tail', tvb_name='tail')
+                self.write(self.generate_array_parsing(m, message, 'tail', tvb_name='tail'))
 
-                out += f'{self.indent}len = value_size\n'
+                self.write(f'{self.indent}len = value_size\n')
             elif self.is_simple_integer(self.proto_field_type(m.type)):
-                out += f'{self.indent}if len_size < tail:len() then\n'
+                self.write(f'{self.indent}if len_size < tail:len() then\n')
                 self.enter_indent()
-                out += f'{self.indent}tree:add({self.proto_field_member_name(message, m)}, tail(len_size, len), parse_varint(tail(len_size, len)))\n'
+                self.write(f'{self.indent}tree:add({self.proto_field_member_name(message, m)}, tail(len_size, len), parse_varint(tail(len_size, len)))\n')
                 self.leave_indent()
-                out += f'{self.indent}else\n'
+                self.write(f'{self.indent}else\n')
                 self.enter_indent()
-                out += f'{self.indent}tree:add({self.proto_field_member_name(message, m)}, tail(0, len_size + len), "<empty>")\n'
+                self.write(f'{self.indent}tree:add({self.proto_field_member_name(message, m)}, tail(0, len_size + len), "<empty>")\n')
                 self.leave_indent()
-                out += f'{self.indent}end\n'
+                self.write(f'{self.indent}end\n')
             else:
                 print(f"unhandled tail member {m.type} {m.name}")
             tail_member_num += 1
 
-        return out
-
     def generate_struct(self, struct: Struct):
         '''
         Generates the Proto and dissector for a given struct
         '''
 
         self.structs[struct.name] = struct
-        out = f'{self.indent}{self.proto_name(struct)} = Proto("{self.shortprotoname}_{struct.name}", "{struct.name}")\n'
+        self.write(f'{self.indent}{self.proto_name(struct)} = Proto("{self.shortprotoname}_{struct.name}", "{struct.name}")\n')
 
         members = []
         for item in struct.members:
-            out += self.generate_protofield(struct, item)
+            self.write(self.generate_protofield(struct, item))
             members.append(item.name)
 
         fields_str = ", ".join([self.proto_field_name(struct, f) for f in members])
-        out += f'{self.indent}{self.proto_name(struct)}.fields = {{{fields_str}}}\n'
-        out += f'{self.indent}function {self.proto_name(struct)}.dissector(tvb, pinfo, tree)\n'
+        self.write(f'{self.indent}{self.proto_name(struct)}.fields = {{{fields_str}}}\n')
+        self.write(f'{self.indent}function {self.proto_name(struct)}.dissector(tvb, pinfo, tree)\n')
         self.enter_indent()
-        out += f'{self.indent}local subtree = tree:add({self.proto_name(struct)}, tvb(0))\n'
-        out += f'{self.indent}local offset = 0\n'
+        self.write(f'{self.indent}local subtree = tree:add({self.proto_name(struct)}, tvb(0))\n')
+        self.write(f'{self.indent}local offset = 0\n')
         for m in struct.members:
             if m.type.identity == TypeIdentity.STRING:
-                out += self.generate_string_parsing(m, struct, tree_name='subtree', tvb_offset='offset')
-                out += f'{self.indent}offset = offset + len_size + len\n'
+                self.write(self.generate_string_parsing(m, struct, tree_name='subtree', tvb_offset='offset'))
+                self.write(f'{self.indent}offset = offset + len_size + len\n')
             elif self.is_simple_integer(self.proto_field_type(m.type)) and m.type.identity != TypeIdentity.ARRAY:
-                out += self.generate_integer_parsing(m, struct, tree_name='subtree')
-                out += f'{self.indent}offset = offset + varint_size\n'
+                self.write(self.generate_integer_parsing(m, struct, tree_name='subtree'))
+                self.write(f'{self.indent}offset = offset + varint_size\n')
             else:
                 print(f'unhandled struct member {m.type} {m.name}')
         self.leave_indent()
-        out += 'end\n\n'
+        self.write('end\n\n')
 
         # generate a function to calculate the struct's size
-        out += f'{self.indent}function {self.proto_name(struct)}_struct_size(tvb)\n'
+        self.write(f'{self.indent}function {self.proto_name(struct)}_struct_size(tvb)\n')
         self.enter_indent()
-        out += f'{self.indent}local offset = 0\n'
+        self.write(f'{self.indent}local offset = 0\n')
         for m in struct.members:
             if m.type.identity == TypeIdentity.STRING:
-                out += f'{self.indent}local len_size, len = parse_varint(tvb(offset))\n'
-                out += f'{self.indent}offset = offset + len_size + len\n'
+                self.write(f'{self.indent}local len_size, len = parse_varint(tvb(offset))\n')
+                self.write(f'{self.indent}offset = offset + len_size + len\n')
             elif self.is_simple_integer(self.proto_field_type(m.type)) and m.type.identity != TypeIdentity.ARRAY:
                 if self.proto_field_type(m.type) in ('uint8', 'char'):
-                    out += f'{self.indent}offset = offset + 1\n'
+                    self.write(f'{self.indent}offset = offset + 1\n')
                 else:
-                    out += f'{self.indent}local varint_size, value = parse_varint(tvb(offset))\n'
-                    out += f'{self.indent}offset = offset + varint_size\n'
+                    self.write(f'{self.indent}local varint_size, value = parse_varint(tvb(offset))\n')
+                    self.write(f'{self.indent}offset = offset + varint_size\n')
             else:
                 print(f'unhandled struct member {m.type} {m.name}')
-        out += f'{self.indent}return offset\n'
+        self.write(f'{self.indent}return offset\n')
         self.leave_indent()
-        out += 'end\n\n'
-
-        return out
+        self.write('end\n\n')
 
     def generate_protocol_metadata(self):
         '''
         Generates the protocol metadata for the current bragi protocol dissector
         '''
 
-        out = f'local dis_{self.protohash}_msgs = {{\n'
+        self.write(f'local dis_{self.protohash}_msgs = {{\n')
         self.enter_indent()
 
         for m in self.messages:
-            out += f'{self.indent}[{m}] = {self.proto_name(self.messages[m])},\n'
+            self.write(f'{self.indent}[{m}] = {self.proto_name(self.messages[m])},\n')
 
         self.leave_indent()
-        out += '}\n\n'
+        self.write('}\n\n')
 
-        out += f'local dis_{self.protohash}_message_ids = {{\n'
+        self.write(f'local dis_{self.protohash}_message_ids = {{\n')
         self.enter_indent()
 
         for m in self.messages:
-            out += f'{self.indent}[{m}] = "{self.messages[m].name}",\n'
+            self.write(f'{self.indent}[{m}] = "{self.messages[m].name}",\n')
 
         self.leave_indent()
-        out += '}\n\n'
-
-        return out
+        self.write('}\n\n')
 
     def generate_global_protocol_metadata(self):
         '''
         Generates the global protocol metadata for the generated bragi protocol dissectors
         '''
 
-        out = f'local protocol_mappings = {{\n'
+        self.write(f'local protocol_mappings = {{\n')
         self.enter_indent()
         for p in self.protocols:
-            out += f'{self.indent}[0x{p}] = "{self.protocols[p]}",\n'
+            self.write(f'{self.indent}[0x{p}] = "{self.protocols[p]}",\n')
         self.leave_indent()
-        out += '}\n\n'
+        self.write('}\n\n')
 
-        out += f'local protocol_message_ids = {{\n'
+        self.write(f'local protocol_message_ids = {{\n')
         self.enter_indent()
         for p in self.protocols:
-            out += f'{self.indent}[0x{p}] = dis_{p}_message_ids,\n'
+            self.write(f'{self.indent}[0x{p}] = dis_{p}_message_ids,\n')
         self.leave_indent()
-        out += '}\n\n'
+        self.write('}\n\n')
 
-        out += f'local protocols = {{\n'
+        self.write(f'local protocols = {{\n')
         self.enter_indent()
         for p in self.protocols:
-            out += f'{self.indent}[0x{p}] = dis_{p}_msgs,\n'
+            self.write(f'{self.indent}[0x{p}] = dis_{p}_msgs,\n')
         self.leave_indent()
-        out += '}\n\n'
-
-        return out
-
-    def determine_pointer_size(self, what, size):
-        if what != 'head':
-            return 8
-
-        if size < 256:
-            return 1
-        elif size < 65536:
-            return 2
-        elif size < 4294967296:
-            return 4
-        elif size < 18446744073709551616:
-            return 8
-        else:
-            return None
-
-    def calculate_fixed_part_size(self, what, members, parent):
-        i = 8 if what == 'head' else 0
-
-        ptr_size = self.determine_pointer_size(what, parent.head.size if what == 'head' else None)
-
-        for m in members:
-            if not self.is_dyn_pointer(m):
-                assert m.type.fixed_size
-                i += m.type.fixed_size
-            else:
-                i += ptr_size if ptr_size else 0
-
-        return i
+        self.write('}\n\n')
@@ -10,6 +10,15 @@ inline bool write_head_tail(Message &msg, HBuffer &&head, TBuffer &&tail) {
 	limited_writer head_rd{head.data(), head.size()};
 	limited_writer tail_rd{tail.data(), tail.size()};
 
+	if constexpr (detail::is_single_pass<Message>::value) {
+		size_t tail_size;
+
+		if (!msg.encode_tail(tail_rd, tail_size))
+			return false;
+
+		return msg.encode_head(head_rd, tail_size);
+	}
+
 	if (!msg.encode_head(head_rd))
 		return false;
 
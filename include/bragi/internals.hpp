@@ -28,6 +28,15 @@ namespace detail {
 
 		return bytes;
 	}
+
+	// Messages generated with '--encoder single-pass' report the size of the tail
+	// they encode, so the head does not need to compute it.
+	template <typename Message, typename = void>
+	struct is_single_pass : std::false_type { };
+
+	template <typename Message>
+	struct is_single_pass<Message, std::void_t<decltype(Message::single_pass_encoding)>>
+	: std::bool_constant<Message::single_pass_encoding> { };
 } // namespace detail
 
 struct limited_writer {
@@ -35,7 +44,8 @@ struct limited_writer {
 	: buf_{static_cast<uint8_t *>(buf)}, size_{size} {}
 
 	bool write(size_t offset, const void *data, size_t size) {
-		if (offset + size > size_)
+		// Written this way so that a huge size cannot overflow the check.
+		if (size > size_ || offset > size_ - size)
 			return false;
 
 		memcpy(buf_ + offset, data, size);
@@ -43,17 +53,60 @@ struct limited_writer {
 		return true;
 	}
 
+	uint8_t *data() const {
+		return buf_;
+	}
+
+	size_t size() const {
+		return size_;
+	}
+
 private:
 	uint8_t *buf_;
 	size_t size_;
 };
 
+// Writer without bounds checks, only used once a part is known to fit the buffer.
+struct unchecked_writer {
+	explicit unchecked_writer(void *buf)
+	: buf_{static_cast<uint8_t *>(buf)} {}
+
+	bool write(size_t offset, const void *data, size_t size) {
+		// data may be null if size is 0, which memcpy does not allow.
+		if (size)
+			memcpy(buf_ + offset, data, size);
+
+		return true;
+	}
+
+private:
+	uint8_t *buf_;
+};
+
+// Calls encode with a writer for wr. If wr is a limited_writer with room for size
+// bytes, that is an unchecked_writer, otherwise wr itself which checks every write.
+template <typename Writer, typename F>
+inline bool with_capacity(Writer &wr, size_t, F &&encode) {
+	return encode(wr);
+}
+
+template <typename F>
+inline bool with_capacity(limited_writer &wr, size_t size, F &&encode) {
+	if (size <= wr.size()) {
+		unchecked_writer uwr{wr.data()};
+		return encode(uwr);
+	}
+
+	return encode(wr);
+}
+
 struct limited_reader {
 	limited_reader(const void *buf, size_t size)
 	: buf_{static_cast<const uint8_t *>(buf)}, size_{size} {}
 
 	bool read(size_t offset, void *data, size_t size) {
-		if (offset + size > size_)
+		// Written this way so that a huge size read from the buffer cannot overflow the check.
+		if (size > size_ || offset > size_ - size)
 			return false;
 
 		memcpy(data, buf_ + offset, size);
@@ -67,12 +120,27 @@ private:
 };
 
 struct serializer {
+	// Sequential writes start at index, after the fixed part of a message part.
+	explicit serializer(size_t index = 0)
+	: index_{index} {}
+
+	// Offset of the next sequential write, the size of everything written so far.
+	size_t index() const {
+		return index_;
+	}
+
 	template <typename T, typename Writer>
 	bool write_integer(Writer &wr, T val) {
+		return write_integer_at<T>(wr, advance(sizeof(T)), val);
+	}
+
+	// Writes val at a constant offset, for the members of the fixed part.
+	template <typename T, typename Writer>
+	bool write_integer_at(Writer &wr, size_t offset, T val) {
 #if __BYTE_ORDER__ != __ORDER_LITTLE_ENDIAN__
 		val = detail::bswap(val);
 #endif
-		return wr.write(advance(sizeof(T)), &val, sizeof(T));
+		return wr.write(offset, &val, sizeof(T));
 	}
 
 	template <typename Writer>
@@ -98,6 +166,24 @@ struct serializer {
 		return wr.write(advance(n), buf, n);
 	}
 
+	// Writes size raw bytes, used for strings and arrays of 1-byte integers.
+	// Empty containers may have a null data(), which must not reach memcpy.
+	template <typename Writer>
+	bool write_bytes(Writer &wr, const void *data, size_t size) {
+		if (!size)
+			return true;
+
+		return wr.write(advance(size), data, size);
+	}
+
+	template <typename Writer>
+	bool write_bytes_at(Writer &wr, size_t offset, const void *data, size_t size) {
+		if (!size)
+			return true;
+
+		return wr.write(offset, data, size);
+	}
+
 private:
 	size_t index_ = 0;
 
@@ -113,9 +199,15 @@ struct deserializer {
 
 	template <typename T, typename Reader>
 	bool read_integer(Reader &rd, T &out) {
+		return read_integer_at<T>(rd, advance(sizeof(T)), out);
+	}
+
+	// Reads from a constant offset, for the members of the fixed part.
+	template <typename T, typename Reader>
+	bool read_integer_at(Reader &rd, size_t offset, T &out) {
 		T val;
 
-		if (!rd.read(advance(sizeof(T)), &val, sizeof(T)))
+		if (!rd.read(offset, &val, sizeof(T)))
 			return false;
 
 #if __BYTE_ORDER__ != __ORDER_LITTLE_ENDIAN__
@@ -154,6 +246,24 @@ struct deserializer {
 		return true;
 	}
 
+	// Reads size raw bytes, used for strings and arrays of 1-byte integers.
+	// Empty containers may have a null data(), which must not reach memcpy.
+	template <typename Reader>
+	bool read_bytes(Reader &rd, void *data, size_t size) {
+		if (!size)
+			return true;
+
+		return rd.read(advance(size), data, size);
+	}
+
+	template <typename Reader>
+	bool read_bytes_at(Reader &rd, size_t offset, void *data, size_t size) {
+		if (!size)
+			return true;
+
+		return rd.read(offset, data, size);
+	}
+
 	void push_index(size_t index) {
 		index_stack_[++n_index_] = index;
 	}
@@ -31,3 +31,36 @@ where
         Err(format!("Bragi compiler failed:\n{stdout}\n{stderr}").into())
     }
 }
+
+pub fn generate_bindings_batch<I, P>(
+    bragi_source_paths: I,
+) -> Result<(), Box<dyn std::error::Error>>
+where
+    I: IntoIterator<Item = P>,
+    P: AsRef<std::path::Path>,
+{
+    let out_dir = std::env::var("OUT_DIR")?;
+    let paths: Vec<P> = bragi_source_paths.into_iter().collect();
+
+    // Invoke the bragi compiler once for all files, each one gets its own output
+    let output = std::process::Command::new("bragi")
+        .arg("-O")
+        .arg(&out_dir)
+        .args(paths.iter().map(|path| path.as_ref()))
+        .arg("rust")
+        .output()?;
+
+    if output.status.success() {
+        // Make sure the build script is re-run if any of the source files change
+        for path in &paths {
+            println!("cargo::rerun-if-changed={}", path.as_ref().display());
+        }
+
+        Ok(())
+    } else {
+        let stderr = String::from_utf8_lossy(&output.stderr);
+        let stdout = String::from_utf8_lossy(&output.stdout);
+
+        Err(format!("Bragi compiler failed:\n{stdout}\n{stderr}").into())
+    }
+}
@@ -1,12 +1,10 @@
 fn main() -> Result<(), Box<dyn std::error::Error>> {
-    for test in [
+    let paths = [
         "arrays", "basic", "empty", "enums", "group", "preamble", "struct", "using",
-    ] {
-        let path = format!("../../tests/{test}/{test}.bragi");
-        let out_path = format!("{test}.rs");
+    ]
+    .map(|test| format!("../../tests/{test}/{test}.bragi"));
 
-        bragi_build::generate_bindings(path, &out_path)?;
-    }
+    bragi_build::generate_bindings_batch(paths)?;
 
     Ok(())
 }
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+'''
+Checks the in-process compiler API in bragi.api
+
+Compiles valid and malformed sources and checks the result, the output and the
+location of the reported diagnostics, and that invalid options raise ValueError.
+'''
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bragi.api
+
+VALID = '''namespace "api";
+
+message Ping 1 {
+head(16):
+\tuint32 seq;
+tail:
+\tstring payload;
+}
+'''
+
+# Sources with an error, and the line, column and message expected for it.
+MALFORMED = [
+    ('message X 1 {\nhead(8):\n\tuint8 x\n}\n', 4, 1, 'unexpected token \'}\''),
+    ('message X 1 {\nhead(8):\n\tfoo x;\n}\n', 3, 2, 'unknown type for this member'),
+    ('message X 1 {\nhead(8):\n\tuint64 x;\n}\n', 2, 1, 'head section is 8 bytes too short to fit all fixed-width members'),
+]
+
+failed = False
+
+def check(condition, description):
+    global failed
+
+    if condition:
+        print(f'ok: {description}')
+    else:
+        print(f'error: {description}')
+        failed = True
+
+def raises_value_error(function, *args, **kwargs):
+    try:
+        function(*args, **kwargs)
+    except ValueError:
+        return True
+
+    return False
+
+def main():
+    for language in bragi.api.LANGUAGES:
+        result = bragi.api.compile_string(VALID, language)
+        check(result.ok and result.diagnostics == [], f'{language}: valid source compiles')
+        check('Ping' in result.output, f'{language}: output contains the message')
+
+    for engine in ['lark', 'native']:
+        for source, line, column, message in MALFORMED:
+            result = bragi.api.compile_string(source, 'cpp', filename = 'bad.bragi', engine = engine)
+            diagnostic = result.diagnostics[-1] if result.diagnostics else None
+
+            check(not result.ok and result.output is None, f'{engine}: {message}: result is not ok')
+            check(diagnostic is not None and diagnostic.severity == 'error'
+                    and (diagnostic.filename, diagnostic.line, diagnostic.column, diagnostic.message)
+                    == ('bad.bragi', line, column, message),
+                    f'{engine}: {message}: reported at line {line}, column {column}')
+
+    # Every source is checked, errors in several sources are all reported.
+    result = bragi.api.compile_sources([('a.bragi', MALFORMED[0][0]), ('b.bragi', VALID), ('c.bragi', MALFORMED[1][0])], 'cpp')
+    check(not result.ok and [d.filename for d in result.diagnostics] == ['a.bragi', 'c.bragi'],
+            'errors of several sources are reported')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+
+        for name, source in [('a.bragi', VALID), ('b.bragi', VALID.replace('Ping 1', 'Pong 2'))]:
+            paths.append(os.path.join(tmp, name))
+            with open(paths[-1], 'w') as f:
+                f.write(source)
+
+        result = bragi.api.compile_files(paths, 'cpp', lib = 'frigg', encoder = 'single-pass', cache_sizes = True)
+        check(result.ok and 'Ping' in result.output and 'Pong' in result.output, 'compile_files() combines files')
+
+        check(raises_value_error(bragi.api.compile_files, paths, 'rust'),
+                'several sources for the rust backend raise ValueError')
+
+    check(raises_value_error(bragi.api.compile_string, VALID, 'c'), 'unknown language raises ValueError')
+    check(raises_value_error(bragi.api.compile_string, VALID, 'cpp', lib = 'libc++'), 'unknown library raises ValueError')
+    check(raises_value_error(bragi.api.compile_string, VALID, 'cpp', encoder = 'fast'), 'unknown encoder raises ValueError')
+    check(raises_value_error(bragi.api.compile_string, VALID, 'cpp', engine = 'yacc'), 'unknown engine raises ValueError')
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
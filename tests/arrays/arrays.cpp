@@ -175,6 +175,40 @@ void test5_2() {
 	assert(t2->arr() == arr);
 }
 
+void test_empty_arrays() {
+	auto t1 = test::make_msg<Test3>();
+
+	// Empty byte arrays are copied in bulk from a possibly null data().
+	t1.set_arr(test::make_vector<test::vec_of<uint8_t>>(
+		test::make_vector<uint8_t>(),
+		test::make_vector<uint8_t>(0xDE, 0xAD),
+		test::make_vector<uint8_t>()
+	));
+
+	std::vector<std::byte> head_buf(128);
+	assert(bragi::write_head_only(t1, head_buf));
+
+	auto t2 = test::parse_with<Test3>(head_buf);
+	assert(t2);
+
+	auto arr = test::make_vector<test::vec_of<uint8_t>>(
+		test::make_vector<uint8_t>(),
+		test::make_vector<uint8_t>(0xDE, 0xAD),
+		test::make_vector<uint8_t>()
+	);
+
+	assert(t2->arr() == arr);
+
+	auto t3 = test::make_msg<Test1>();
+	t3.set_arr(test::make_vector<uint8_t>());
+
+	assert(bragi::write_head_only(t3, head_buf));
+
+	auto t4 = test::parse_with<Test1>(head_buf);
+	assert(t4);
+	assert(t4->arr().size() == 0);
+}
+
 int main() {
 	test1();
 	test2();
@@ -182,4 +216,5 @@ int main() {
 	test4();
 	test5_1();
 	test5_2();
+	test_empty_arrays();
 }
@@ -0,0 +1,186 @@
+#include <iostream>
+
+#include "../test-util.hpp"
+
+#ifdef TEST_FRIGG
+#include <cache.bragi.frg.hpp>
+#else
+#include <cache.bragi.std.hpp>
+#endif
+
+#include <cassert>
+
+// These tests encode a message, modify it and encode it again. With --cache-sizes,
+// the second encoding must not reuse the sizes computed for the first one.
+
+template <typename Msg>
+auto encode(Msg &msg) {
+	std::vector<std::byte> head_buf(128);
+	std::vector<std::byte> tail_buf(msg.size_of_tail());
+	assert(bragi::write_head_tail(msg, head_buf, tail_buf));
+	return std::make_pair(head_buf, tail_buf);
+}
+
+// Checks that msg round trips and that its sizes and encoding match those of the
+// decoded copy, whose sizes are computed from scratch.
+template <typename Msg>
+auto round_trip(Msg &msg) {
+	auto bufs = encode(msg);
+	auto copy = test::parse_with<Test>(bufs.first, bufs.second);
+	assert(copy);
+	assert(msg.size_of_head() == copy->size_of_head());
+	assert(msg.size_of_tail() == copy->size_of_tail());
+	assert(encode(*copy) == bufs);
+	return copy;
+}
+
+auto make_test() {
+	auto t = test::make_msg<Test>();
+	t.set_id(42);
+	t.set_label(test::make_string("label"));
+	t.set_numbers(test::make_vector<uint64_t>(1, 2, 3));
+	t.set_text(test::make_string("text"));
+	t.set_words(test::make_vector<decltype(test::make_string(""))>(
+		test::make_string("a"), test::make_string("b")));
+
+	auto item = test::make_msg<Item>();
+	item.set_name(test::make_string("item"));
+	item.set_values(test::make_vector<uint32_t>(1, 2));
+	t.set_item(item);
+	t.add_items(item);
+	t.add_items(item);
+	return t;
+}
+
+void test_setters() {
+	auto t = make_test();
+	round_trip(t);
+
+	t.set_text(test::make_string("a much longer text than before"));
+	assert(round_trip(t)->text() == test::make_string("a much longer text than before"));
+
+	t.set_words(1, test::make_string("a much longer word"));
+	assert(round_trip(t)->words(1) == test::make_string("a much longer word"));
+
+	t.add_words(test::make_string("c"));
+	assert(round_trip(t)->words_size() == 3);
+
+	auto item = test::make_msg<Item>();
+	item.set_name(test::make_string("another item"));
+	item.add_values(0xFFFFFFFF);
+	t.set_item(item);
+	assert(round_trip(t)->item().name() == test::make_string("another item"));
+
+	t.set_items(0, item);
+	assert(round_trip(t)->items(0).values(0) == 0xFFFFFFFF);
+
+	t.add_items(item);
+	assert(round_trip(t)->items_size() == 3);
+}
+
+void test_tags() {
+	auto t = make_test();
+	round_trip(t);
+
+	t.set_label(test::make_string("a much longer label"));
+	assert(round_trip(t)->label() == test::make_string("a much longer label"));
+
+	t.set_numbers(0, 0xFFFFFFFFFFFF);
+	assert(round_trip(t)->numbers(0) == 0xFFFFFFFFFFFF);
+
+	t.add_numbers(0xFFFFFFFFFFFF);
+	assert(round_trip(t)->numbers_size() == 4);
+
+	t.set_numbers(test::make_vector<uint64_t>());
+	assert(round_trip(t)->numbers_size() == 0);
+}
+
+void test_references() {
+	auto t = make_test();
+	round_trip(t);
+
+	t.label() = test::make_string("a much longer label");
+	assert(round_trip(t)->label() == test::make_string("a much longer label"));
+
+	t.numbers().push_back(0xFFFFFFFFFFFF);
+	assert(round_trip(t)->numbers(3) == 0xFFFFFFFFFFFF);
+
+	t.text() = test::make_string("a much longer text than before");
+	assert(round_trip(t)->text() == test::make_string("a much longer text than before"));
+
+	t.words().push_back(test::make_string("c"));
+	assert(round_trip(t)->words_size() == 3);
+
+	t.words(0) = test::make_string("a much longer word");
+	assert(round_trip(t)->words(0) == test::make_string("a much longer word"));
+
+	t.item().set_name(test::make_string("another item"));
+	assert(round_trip(t)->item().name() == test::make_string("another item"));
+
+	t.items(1).add_values(0xFFFFFFFF);
+	assert(round_trip(t)->items(1).values_size() == 3);
+
+	t.items().push_back(t.item());
+	assert(round_trip(t)->items_size() == 3);
+}
+
+void test_const_getters() {
+	auto t = make_test();
+	round_trip(t);
+
+	const auto &ct = t;
+	assert(ct.label() == test::make_string("label"));
+	assert(ct.text() == test::make_string("text"));
+	assert(ct.words(1) == test::make_string("b"));
+	assert(ct.item().name() == test::make_string("item"));
+	assert(ct.items().size() == 2);
+	round_trip(t);
+}
+
+void test_stale_reference() {
+	auto t = make_test();
+	auto &text = t.text();
+	auto size = t.size_of_tail();
+
+	// Changing the message through a reference after its size was cached is not
+	// supported, but must not make the encoder write past the end of the buffer.
+	text = test::make_string("a much longer text than before");
+
+	std::vector<std::byte> tail_buf(size);
+	bragi::limited_writer tail_wr{tail_buf.data(), tail_buf.size()};
+	assert(!t.encode_tail(tail_wr));
+}
+
+void test_decode() {
+	auto t1 = make_test();
+	auto t2 = make_test();
+	t2.set_label(test::make_string("a much longer label"));
+	t2.set_text(test::make_string("a much longer text than before"));
+	t2.add_items(t2.item());
+
+	auto bufs1 = encode(t1);
+	auto bufs2 = encode(t2);
+
+	// Decoding into t1 replaces the contents that its cached sizes belong to.
+	bragi::limited_reader head_rd{bufs2.first.data(), bufs2.first.size()};
+	bragi::limited_reader tail_rd{bufs2.second.data(), bufs2.second.size()};
+	assert(t1.decode_head(head_rd));
+	assert(t1.decode_tail(tail_rd));
+	assert(t1.size_of_head() == t2.size_of_head());
+	assert(encode(t1) == bufs2);
+
+	head_rd = bragi::limited_reader{bufs1.first.data(), bufs1.first.size()};
+	tail_rd = bragi::limited_reader{bufs1.second.data(), bufs1.second.size()};
+	assert(t1.decode_head(head_rd));
+	assert(t1.decode_tail(tail_rd));
+	assert(encode(t1) == bufs1);
+}
+
+int main() {
+	test_setters();
+	test_tags();
+	test_references();
+	test_const_getters();
+	test_stale_reference();
+	test_decode();
+}
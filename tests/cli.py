@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+'''
+Checks the bragi command
+
+Runs bragi as a subprocess on inputs in a temporary directory and checks the files it
+writes and what it prints.
+'''
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VALID = '''namespace "cli";
+
+message Ping 1 {
+head(16):
+\tuint32 seq;
+}
+'''
+
+failed = False
+
+def check(condition, description):
+    global failed
+
+    if condition:
+        print(f'ok: {description}')
+    else:
+        print(f'error: {description}')
+        failed = True
+
+def write(path, text, mode = 'w'):
+    with open(path, mode) as f:
+        f.write(text)
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+def wait_for(condition, timeout = 10):
+    '''
+    Returns whether condition() became true within timeout seconds
+    '''
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+
+    return condition()
+
+def test_watch(tmp):
+    source = os.path.join(tmp, 'watch.bragi')
+    output = os.path.join(tmp, 'watch.lua')
+    write(source, VALID)
+
+    # The wireshark backend fails on sources without a namespace.
+    watcher = subprocess.Popen([sys.executable, '-m', 'bragi', 'watch', '--no-unit-cache', '-o', output, source, 'wireshark'],
+            cwd = ROOT, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True)
+
+    try:
+        check(wait_for(lambda: os.path.exists(output)), 'watch: writes the output')
+
+        # Watch mode compares the mtime and size of inputs, changes to a different
+        # size are noticed even if the file system stores coarse mtimes.
+        fixed = VALID.replace('Ping', 'Pong2')
+
+        def survives(description, change):
+            change()
+            time.sleep(0.5)
+            check(watcher.poll() is None, f'watch: keeps running after {description}')
+
+            # Any later fix of the input is picked up.
+            write(source, fixed)
+            check(wait_for(lambda: 'Pong' in read(output)), f'watch: recovers from {description}')
+            write(source, VALID)
+            check(wait_for(lambda: 'Pong' not in read(output)), f'watch: regenerates after {description}')
+
+        survives('an error in the input', lambda: write(source, 'message {'))
+        survives('undecodable input', lambda: write(source, b'\xff\xfe message', 'wb'))
+        survives('a backend failure', lambda: write(source, VALID.replace('namespace "cli";', '')))
+
+        def replace_input_by_directory():
+            os.unlink(source)
+            os.mkdir(source)
+
+        def restore_input():
+            os.rmdir(source)
+            write(source, fixed)
+
+        replace_input_by_directory()
+        time.sleep(0.5)
+        check(watcher.poll() is None, 'watch: keeps running after the input became unreadable')
+        restore_input()
+        check(wait_for(lambda: 'Pong' in read(output)), 'watch: recovers from an unreadable input')
+
+        # The output cannot be replaced by a file while it is a non-empty directory.
+        os.unlink(output)
+        os.mkdir(output)
+        write(os.path.join(output, 'keep'), '')
+        write(source, VALID)
+        time.sleep(0.5)
+        check(watcher.poll() is None, 'watch: keeps running after the output could not be written')
+        os.unlink(os.path.join(output, 'keep'))
+        os.rmdir(output)
+        write(source, fixed)
+        check(wait_for(lambda: os.path.isfile(output) and 'Pong' in read(output)), 'watch: recovers from an unwritable output')
+    finally:
+        watcher.terminate()
+        _, errors = watcher.communicate()
+
+    check('Traceback' in errors and 'cannot read' in errors and 'cannot write' in errors,
+            'watch: reports the failures')
+
+def run_bragi(*args, env = None, timeout = 60, umask = 0o022):
+    return subprocess.run([sys.executable, '-m', 'bragi', *args], cwd = ROOT, umask = umask,
+            env = dict(os.environ, **(env or {})), capture_output = True, text = True, timeout = timeout)
+
+def run_uncached(*args, **kwargs):
+    return run_bragi('--no-unit-cache', *args, **kwargs)
+
+def test_backends(tmp):
+    source = os.path.join(tmp, 'backends.bragi')
+    write(source, VALID)
+    outputs = {language: os.path.join(tmp, f'backends.{language}') for language in ['cpp', 'wireshark', 'rust']}
+
+    result = run_uncached(source, 'cpp', '-l', 'stdc++', '-o', outputs['cpp'],
+            '+', 'wireshark', '-o', outputs['wireshark'], '+', 'rust', '-o', outputs['rust'])
+    check(result.returncode == 0, 'backends: several backends run on the same inputs')
+
+    # Every backend generates what it generates when it runs alone.
+    for language, options in [('cpp', ['-l', 'stdc++']), ('wireshark', []), ('rust', [])]:
+        alone = os.path.join(tmp, f'alone.{language}')
+        run_uncached('-o', alone, source, language, *options)
+        check(read(outputs[language]) == read(alone), f'backends: {language} output does not depend on other backends')
+
+    # The global output is shared by the backends that do not set their own.
+    result = run_uncached('-o', outputs['cpp'], source, 'cpp', '-l', 'stdc++', '+', 'rust')
+    check(result.returncode != 0 and 'written more than once' in result.stderr,
+            'backends: backends writing the same output are rejected')
+
+    result = run_uncached(source, 'cpp', '-l', 'stdc++', '-o', outputs['cpp'], '+', 'rust')
+    check(result.returncode != 0 and 'no output file given for the rust backend' in result.stderr,
+            'backends: backends without an output are rejected')
+
+def write_sources(directory, names):
+    '''
+    Writes one message per name to directory and returns the paths of the sources
+    '''
+    os.makedirs(directory, exist_ok = True)
+    paths = []
+
+    for n, name in enumerate(names):
+        paths.append(os.path.join(directory, f'{name}.bragi'))
+        write(paths[-1], VALID.replace('Ping 1', f'{name.capitalize()} {n + 1}'))
+
+    return paths
+
+def test_batch(tmp):
+    sources = write_sources(os.path.join(tmp, 'src'), ['alpha', 'beta'])
+    out = os.path.join(tmp, 'out')
+
+    # -O implies --batch and puts the default output names into the directory.
+    result = run_uncached('-O', out, *sources, 'cpp', '-l', 'stdc++', '+', 'wireshark')
+    check(result.returncode == 0 and sorted(os.listdir(out)) == ['alpha.bragi.hpp', 'alpha.lua', 'beta.bragi.hpp', 'beta.lua'],
+            'batch: -O writes the default outputs of every input')
+    check('Alpha' in read(os.path.join(out, 'alpha.lua')) and 'Beta' not in read(os.path.join(out, 'alpha.lua')),
+            'batch: every input is compiled separately')
+
+    result = run_uncached('--batch', '-o', os.path.join(out, 'gen-{basename}.rs'), *sources, 'rust')
+    check(result.returncode == 0 and os.path.exists(os.path.join(out, 'gen-alpha.rs'))
+            and os.path.exists(os.path.join(out, 'gen-beta.rs')), 'batch: {basename} is replaced in output templates')
+
+    # Inputs with the same name in different directories would overwrite each other.
+    duplicate = write_sources(os.path.join(tmp, 'other'), ['alpha'])
+    result = run_uncached('-O', out, *sources, *duplicate, 'cpp', '-l', 'stdc++')
+    check(result.returncode != 0 and 'alpha.bragi.hpp would be written more than once' in result.stderr,
+            'batch: outputs written more than once are rejected')
+
+    result = run_uncached('--batch', '-o', os.path.join(out, 'all.rs'), *sources, 'rust')
+    check(result.returncode != 0 and 'written more than once' in result.stderr,
+            'batch: templates without {basename} are rejected for several inputs')
+
+def test_jobs(tmp):
+    sources = write_sources(os.path.join(tmp, 'src'), ['alpha', 'beta', 'gamma', 'delta'])
+    texts = {}
+
+    for jobs in ['1', '3']:
+        out = os.path.join(tmp, f'out-{jobs}')
+        result = run_uncached('-j', jobs, '-O', out, *sources, 'cpp', '-l', 'stdc++', '+', 'rust')
+        check(result.returncode == 0, f'jobs: -j {jobs} compiles')
+        texts[jobs] = {name: read(os.path.join(out, name)) for name in sorted(os.listdir(out))}
+
+    check(len(texts['1']) == 8 and texts['1'] == texts['3'], 'jobs: outputs do not depend on -j')
+
+    combined = os.path.join(tmp, 'combined.hpp')
+    run_uncached('-j', '3', '-o', combined, *sources, 'cpp', '-l', 'stdc++')
+    check(all(name in read(combined) for name in ['Alpha', 'Beta', 'Gamma', 'Delta']), 'jobs: -j combines inputs')
+
+    # Errors found by worker processes are reported like in-process ones.
+    write(sources[2], 'message {')
+    result = run_uncached('-j', '3', '-O', os.path.join(tmp, 'broken'), *sources, 'cpp', '-l', 'stdc++')
+    check(result.returncode != 0 and 'gamma.bragi:1:9: error' in result.stdout, 'jobs: errors in worker processes are reported')
+
+def timed_outputs(tmp, *args, cache = False):
+    '''
+    Runs bragi with --timings-json and returns the recorded outputs by name
+    '''
+    report = os.path.join(tmp, 'timings.json')
+    run = run_bragi if cache else run_uncached
+    run('--timings-json', report, *args)
+
+    with open(report) as f:
+        return {os.path.basename(o['output']): o for o in json.load(f)['outputs']}
+
+def test_unchanged_outputs(tmp):
+    sources = write_sources(os.path.join(tmp, 'src'), ['alpha', 'beta'])
+    out = os.path.join(tmp, 'out')
+    args = ['-O', out, *sources, 'cpp', '-l', 'stdc++']
+
+    outputs = timed_outputs(tmp, *args)
+    check(all(o['written'] for o in outputs.values()), 'unchanged: new outputs are written')
+
+    # Old mtimes make rewritten outputs stand out even on file systems with coarse mtimes.
+    paths = [os.path.join(out, name) for name in ['alpha.bragi.hpp', 'beta.bragi.hpp']]
+    for path in paths:
+        os.utime(path, ns = (1, 1))
+
+    outputs = timed_outputs(tmp, *args)
+    check(not any(o['written'] for o in outputs.values()) and all(os.stat(path).st_mtime_ns == 1 for path in paths),
+            'unchanged: a rerun does not touch the outputs')
+
+    write(sources[1], read(sources[1]).replace('uint32 seq', 'uint32 sequence'))
+    outputs = timed_outputs(tmp, *args)
+    check(not outputs['alpha.bragi.hpp']['written'] and os.stat(paths[0]).st_mtime_ns == 1,
+            'unchanged: outputs of unchanged inputs are kept')
+    check(outputs['beta.bragi.hpp']['written'] and 'sequence' in read(paths[1]) and os.stat(paths[1]).st_mtime_ns != 1,
+            'unchanged: outputs of changed inputs are rewritten')
+
+def test_output_cache(tmp):
+    sources = write_sources(os.path.join(tmp, 'src'), ['alpha', 'beta'])
+    out = os.path.join(tmp, 'out')
+    cache = os.path.join(tmp, 'cache')
+
+    def cached(*options):
+        outputs = timed_outputs(tmp, '--cache-dir', cache, '-O', out, *sources, 'cpp', '-l', 'stdc++', *options,
+                '+', 'wireshark', cache = True)
+        return {name: o['cached'] for name, o in outputs.items()}
+
+    check(not any(cached().values()), 'cache: outputs are generated on the first run')
+    check(os.path.isdir(os.path.join(cache, 'units')), 'cache: verified units are cached in the cache directory')
+    texts = {name: read(os.path.join(out, name)) for name in os.listdir(out)}
+
+    shutil.rmtree(out)
+    check(all(cached().values()), 'cache: outputs are taken from the cache on the next run')
+    check({name: read(os.path.join(out, name)) for name in os.listdir(out)} == texts, 'cache: cached outputs are unchanged')
+
+    check(cached('--protobuf') == {'alpha.bragi.hpp': False, 'beta.bragi.hpp': False, 'alpha.lua': True, 'beta.lua': True},
+            'cache: backend options are part of the key')
+
+    write(sources[0], read(sources[0]).replace('uint32 seq', 'uint32 sequence'))
+    check(cached() == {'alpha.bragi.hpp': False, 'beta.bragi.hpp': True, 'alpha.lua': False, 'beta.lua': True},
+            'cache: sources are part of the key')
+    check('sequence' in read(os.path.join(out, 'alpha.bragi.hpp')), 'cache: changed sources are compiled again')
+
+def test_depfile(tmp):
+    sources = write_sources(os.path.join(tmp, 'src dir'), ['alpha', 'beta'])
+    escaped = [source.replace(' ', '\\ ') for source in sources]
+    output = os.path.join(tmp, 'combined.hpp')
+    depfile = os.path.join(tmp, 'combined.d')
+
+    run_uncached('--depfile', depfile, '-o', output, *sources, 'cpp', '-l', 'stdc++')
+    check(read(depfile) == f'{output}: {escaped[0]} {escaped[1]}\n', 'depfile: lists every input of a combined output')
+
+    out = os.path.join(tmp, 'out')
+    run_uncached('--depfile', depfile, '-O', out, *sources, 'cpp', '-l', 'stdc++', '+', 'wireshark')
+    check(read(depfile) == ''.join(f'{out}/{name}: {escaped[n]}\n' for name, n in
+            [('alpha.bragi.hpp', 0), ('beta.bragi.hpp', 1), ('alpha.lua', 0), ('beta.lua', 1)]),
+            'depfile: lists the input of every batch output')
+
+def mode_of(path):
+    return os.stat(path).st_mode & 0o7777
+
+def test_write_output(tmp):
+    source = os.path.join(tmp, 'output.bragi')
+    output = os.path.join(tmp, 'output.hpp')
+    write(source, VALID)
+
+    run_bragi('--no-unit-cache', '-o', output, source, 'cpp', '-l', 'stdc++', umask = 0o027)
+    check(mode_of(output) == 0o640, 'output: new outputs are created according to the umask')
+
+    # Changed outputs keep the mode of the file they replace.
+    os.chmod(output, 0o604)
+    write(source, VALID.replace('Ping', 'Pong'))
+    run_bragi('--no-unit-cache', '-o', output, source, 'cpp', '-l', 'stdc++')
+    check('Pong' in read(output) and mode_of(output) == 0o604, 'output: replaced outputs keep their mode')
+
+    # Symlinked outputs stay symlinks, their target is replaced.
+    target = os.path.join(tmp, 'target.hpp')
+    os.rename(output, target)
+    os.symlink('target.hpp', output)
+    write(source, VALID)
+    run_bragi('--no-unit-cache', '-o', output, source, 'cpp', '-l', 'stdc++')
+    check(os.path.islink(output) and 'Ping' in read(target), 'output: symlinks are followed')
+    check(not [name for name in os.listdir(tmp) if name.endswith('.tmp')], 'output: no temporary files are left behind')
+
+def test_server(tmp):
+    source = os.path.join(tmp, 'server.bragi')
+    output = os.path.join(tmp, 'server.hpp')
+    path = os.path.join(tmp, 'server.sock')
+    write(source, VALID)
+
+    server = subprocess.Popen([sys.executable, '-m', 'bragi', 'serve', '-s', path], cwd = ROOT,
+            env = dict(os.environ, BRAGI_CACHE_DIR = os.path.join(tmp, 'server-cache')),
+            stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+    try:
+        check(wait_for(lambda: os.path.exists(path)), 'server: listens on the socket')
+
+        # Requests are compiled with the environment of the client.
+        result = run_bragi('-o', output, source, 'cpp', '-l', 'stdc++',
+                env = {'BRAGI_SERVER': path, 'BRAGI_CACHE_DIR': os.path.join(tmp, 'client-cache')})
+        check(result.returncode == 0 and 'Ping' in read(output), 'server: compiles requests')
+        # The server stores its parser in its own cache directory at startup.
+        check(os.path.isdir(os.path.join(tmp, 'client-cache', 'units'))
+                and not os.path.exists(os.path.join(tmp, 'server-cache', 'units')),
+                'server: uses the cache directory of the client')
+
+        os.unlink(output)
+        run_bragi('-o', output, source, 'cpp', '-l', 'stdc++', umask = 0o077, env = {'BRAGI_SERVER': path})
+        check(mode_of(output) == 0o600, 'server: uses the umask of the client')
+    finally:
+        server.terminate()
+        server.wait()
+
+    # A server that never responds does not hang the client.
+    hung_path = os.path.join(tmp, 'hung.sock')
+    os.unlink(output)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as hung:
+        hung.bind(hung_path)
+        hung.listen()
+
+        result = run_bragi('-o', output, source, 'cpp', '-l', 'stdc++', timeout = 30,
+                env = {'BRAGI_SERVER': hung_path, 'BRAGI_SERVER_TIMEOUT': '0.5', 'BRAGI_CACHE_DIR': os.path.join(tmp, 'client-cache')})
+        check(result.returncode == 0 and 'Ping' in read(output), 'server: clients compile in-process if the server hangs')
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        test_watch(tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_backends(tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_batch(tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_jobs(tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_unchanged_outputs(tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_output_cache(tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_depfile(tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_write_output(tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_server(tmp)
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
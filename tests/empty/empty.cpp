@@ -80,9 +80,32 @@ void test_empty_message() {
 	assert(t2);
 }
 
+void test_empty_strings() {
+	auto t1 = test::make_msg<TestEmptyHead>();
+	t1.set_foo(test::make_string(""));
+
+	std::vector<std::byte> head_buf(128);
+	std::vector<std::byte> tail_buf(t1.size_of_tail());
+	assert(bragi::write_head_tail(t1, head_buf, tail_buf));
+
+	auto t2 = test::parse_with<TestEmptyHead>(head_buf, tail_buf);
+	assert(t2);
+	assert(t2->foo() == test::make_string(""));
+
+	auto t3 = test::make_msg<TestNoTail>();
+	t3.set_foo(test::make_string(""));
+
+	assert(bragi::write_head_only(t3, head_buf));
+
+	auto t4 = test::parse_with<TestNoTail>(head_buf);
+	assert(t4);
+	assert(t4->foo() == test::make_string(""));
+}
+
 int main() {
 	test_empty_head();
 	test_empty_tail();
 	test_no_tail();
 	test_empty_message();
+	test_empty_strings();
 }
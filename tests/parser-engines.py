@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+'''
+Checks that the Lark and the native parser produce identical tokens and errors
+
+Parses every .bragi file below tests/ (or the files given on the command line) and a
+sample that covers the syntax the test schemas do not use with both engines, and
+compares the resulting tokens including their line and column. For malformed samples,
+the location and message of the error are compared instead. The notes listing the
+expected tokens only have to be present: Lark derives them from its LALR states,
+which sometimes allow more than the grammar does.
+'''
+
+import argparse
+import glob
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bragi.parser import CompilationUnit
+from bragi.diagnostics import CompilationError
+
+SYNTAX_SAMPLE = '''namespace "sample";
+// Line comments, formats and consts blocks.
+@format(bitfield) consts Flags uint32 { A = 1, B = 2, C = 4 }
+@format(x) enum Kind { First, Second = 5, Third }
+
+/* Block
+   comment */
+message Sample 1 {
+head(32):
+\tuint8 [ 4 ] small;
+\ttags {
+\t\ttag(1) @format(hex) uint64 id;
+\t\ttag(2) head[] part;
+\t}
+tail:
+\tuint32[][8] matrix;
+head(16):
+\tKind kind;
+}
+
+struct Nested { tag(3) string label; Sample[] samples; }
+group { message A 2 { tail: byte data; } message B 3 { head(8): } }
+using "sample::Alias" = "Nested";
+'''
+
+MALFORMED_SAMPLES = [
+    '',
+    "''",
+    '$',
+    'x',
+    'x $',
+    'message X 1 {',
+    'message X 1 { head(8):',
+    'message X 1 { head(8): uint8',
+    'message X 1 { head(8): uint8[x] y; }',
+    'message X 1 { head(8): tags { } }',
+    'message X 1 { head(8): tag(1) } }',
+    'message X 1 { head(8): $ }',
+    'message X 1 { tail: } }',
+    'struct S { uint8 x; ',
+    'struct S { uint8 x; } $',
+    'enum E { A = }',
+    'consts C uint8',
+    '@format(x)',
+    'namespace "x" $',
+    'using "a" = b;',
+    'group { x }',
+    '/* unterminated',
+    'message X 1 { head(8): uint8 x; }\n\nstruct S {\n\tuint8 ',
+    'enum E { A }\n$',
+]
+
+def describe(value):
+    '''
+    Returns a comparable representation of value and all tokens it refers to
+    '''
+    if isinstance(value, list):
+        return [describe(v) for v in value]
+    elif isinstance(value, dict):
+        return {k: describe(v) for k, v in value.items()}
+    elif hasattr(value, '__slots__'):
+        return (type(value).__name__, {s: describe(getattr(value, s)) for s in value.__slots__})
+
+    return value
+
+def parse(filename, source, engine):
+    unit = CompilationUnit(filename, source)
+    unit.process(engine)
+    return describe(unit.tokens)
+
+def error(source, engine):
+    '''
+    Returns the location and message of the error in source, checking that it has a note
+    '''
+    try:
+        CompilationUnit('<malformed>', source).process(engine)
+    except CompilationError as e:
+        diagnostic = e.diagnostics[-1]
+        assert diagnostic.note, f'no note for {source!r} from the {engine} parser'
+        return diagnostic.line, diagnostic.column, diagnostic.message
+
+    raise AssertionError(f'{source!r} was accepted by the {engine} parser')
+
+def main():
+    parser = argparse.ArgumentParser(description = 'bragi parser engine differential test')
+    parser.add_argument('input', nargs = '*', help = 'files to parse (default: all .bragi files in tests/)')
+    args = parser.parse_args()
+
+    inputs = args.input or sorted(glob.glob(os.path.join(ROOT, 'tests', '**', '*.bragi'), recursive = True))
+    sources = [(filename, open(filename).read()) for filename in inputs]
+
+    if not args.input:
+        sources.append(('<sample>', SYNTAX_SAMPLE))
+
+    failed = False
+
+    for filename, source in sources:
+        if parse(filename, source, 'lark') != parse(filename, source, 'native'):
+            print(f'error: the parser engines disagree on {filename}')
+            failed = True
+        else:
+            print(f'ok: {filename}')
+
+    if not args.input:
+        for source in MALFORMED_SAMPLES:
+            lark_error, native_error = error(source, 'lark'), error(source, 'native')
+
+            if lark_error != native_error:
+                print(f'error: the parser engines disagree on {source!r}: {lark_error} != {native_error}')
+                failed = True
+            else:
+                print(f'ok: {source!r}')
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
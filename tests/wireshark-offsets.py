@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+'''
+Checks the offsets at which the Wireshark dissector reads head members
+
+Head members that follow a tags block (or any other member stored as a pointer) are
+placed after the pointer on the wire, so the dissector must not just add up the sizes
+of the fixed-width members before them.
+'''
+
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bragi.api
+
+SOURCE = '''namespace "offsets";
+
+message Middle 1 {
+head(32):
+\tuint32 first;
+\ttags {
+\t\ttag(1) uint32 tagged;
+\t}
+\tuint16 second;
+\tuint8 third;
+}
+
+message Leading 2 {
+head(16):
+\ttags {
+\t\ttag(1) uint64 leading_tagged;
+\t}
+\tuint8 after;
+}
+'''
+
+# Offset and size of every untagged head member, relative to the end of the message
+# ID and tail size. Heads smaller than 256 bytes use one byte wide pointers.
+EXPECTED = {
+    'first': (0, 4),
+    'second': (5, 2),
+    'third': (7, 1),
+    'after': (1, 1),
+}
+
+def main():
+    result = bragi.api.compile_string(SOURCE, 'wireshark')
+    if not result.ok:
+        print('error: the source does not compile')
+        sys.exit(1)
+
+    offsets = {m.group(1): (int(m.group(2)), int(m.group(3)))
+            for m in re.finditer(r'local (\w+)_item = tree:add_le\(\w+, tvb\((\d+), (\d+)\)\)', result.output)}
+
+    if offsets == EXPECTED:
+        print('ok: head members are read at their offsets')
+    else:
+        print(f'error: head members are read at {offsets}, expected {EXPECTED}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()